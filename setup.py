@@ -54,5 +54,13 @@ setuptools.setup (
 		'typing_extensions==4.8.0',
 		'urllib3==2.0.7',
 		'userpaths==0.1.3',
-	]
+	],
+	extras_require = {
+		'onnx': [
+			'numpy==1.26.2',
+			'onnx==1.15.0',
+			'onnxruntime==1.16.3',
+			'piper-phonemize==1.1.0',
+		]
+	}
 )
\ No newline at end of file
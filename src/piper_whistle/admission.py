@@ -0,0 +1,83 @@
+"""Admission control of speak payloads.
+
+Under overload, payloads pile up in the channel and its spool, and what
+finally gets spoken is minutes old. Speak bounds that backlog (bytes
+waiting in the channel and its spool) and the age of payloads. Once the
+backlog would exceed its limit, one of these policies applies:
+
+* reject - The payload is not sent and speak exits with EXIT_OVERLOADED.
+* drop-oldest - Oldest spooled payloads are dropped to make room.
+* degrade - The payload asks for a lower quality of its voice, which
+	synthesises faster. Rejected if none is installed.
+
+With an age limit, payloads carry the (unix) time they expire at. serve
+and route skip expired payloads, instead of speaking stale audio.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import sys
+import json
+import time
+import pathlib
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import db
+
+
+POLICIES = ('reject', 'drop-oldest', 'degrade')
+DEFAULT_POLICY = 'reject'
+# Exit code of speak, if a payload was not admitted. (EX_TEMPFAIL)
+EXIT_OVERLOADED = 75
+
+
+def expired (payload: dict, now: float = None):
+	"""! Checks if a payload is past the time it expires at.
+	@param payload Payload map, optionally carrying 'expires'.
+	@param now Current unix time. (defaults to time.time ())
+	@return Returns True if the payload expired.
+	"""
+	expires = payload.get ('expires', None)
+	if expires is None:
+		return False
+	try:
+		return float (expires) < (time.time () if now is None else now)
+	except (TypeError, ValueError):
+		return False
+
+
+def line_expired (line: str, now: float = None):
+	"""! Checks if a payload line is a JSON map which expired.
+	@param line Payload line.
+	@param now Current unix time. (defaults to time.time ())
+	@return Returns True if the payload expired.
+	"""
+	line = line.strip ()
+	if not line.startswith ('{'):
+		return False
+	try:
+		payload = json.loads (line)
+	except ValueError:
+		return False
+	return isinstance (payload, dict) and expired (payload, now)
+
+
+def voice_degrade (paths, selector: str):
+	"""! Finds the next lower quality of the selected voice, if installed.
+	@param paths Paths map. Can be obtained via @ref "db.data_paths ()".
+	@param selector Voice selector. (see db.selector_parse)
+	@return Returns selector of the degraded voice, or None.
+	"""
+	try:
+		m = db.selector_parse (selector)
+	except ValueError:
+		return None
+	if m['quality'] not in db.QUALITIES:
+		return None
+
+	prefix = f'{m["code"]}:' if m['code'] else ''
+	suffix = f'/{m["speaker"]}' if m['speaker'] else ''
+	i = db.QUALITIES.index (m['quality'])
+	for quality in reversed (db.QUALITIES[:i]):
+		candidate = f'{prefix}{m["name"]}@{quality}{suffix}'
+		if db.model_resolve_selector (paths, candidate)['path']:
+			return candidate
+	return None
@@ -0,0 +1,167 @@
+"""Audio helpers.
+
+Small utilities around the wav files and raw PCM piper produces. Piper
+writes 16bit mono PCM, at the sample rate configured in the voice's
+.onnx.json file.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import math
+import wave
+import array
+import struct
+
+
+# Size field value of wav files streamed with unknown length.
+WAV_SIZE_UNKNOWN = 0xFFFFFFFF
+
+
+class AudioFormat:
+	"""! Layout of raw PCM audio."""
+	__slots__ = ('sample_rate', 'channels', 'sample_width')
+
+	def __init__ (self, sample_rate: int, channels: int = 1
+		, sample_width: int = 2
+	):
+		self.sample_rate = sample_rate
+		self.channels = channels
+		self.sample_width = sample_width
+
+	@property
+	def frame_size (self):
+		"""! Bytes per frame (one sample of every channel)."""
+		return self.channels * self.sample_width
+
+	def __eq__ (self, other):
+		return isinstance (other, AudioFormat) \
+			and self.sample_rate == other.sample_rate \
+			and self.channels == other.channels \
+			and self.sample_width == other.sample_width
+
+	def __repr__ (self):
+		return \
+			f'AudioFormat({self.sample_rate}, {self.channels}, ' \
+			f'{self.sample_width})'
+
+
+def voice_format (model_path: str):
+	"""! Reads the audio format of a voice from its config (.onnx.json).
+	@param model_path Path to voice model (onnx).
+	@return Returns AudioFormat of the voice, or None if unknown.
+	"""
+	try:
+		with open (f'{model_path}.json', 'r') as f:
+			return AudioFormat (int (json.load (f)['audio']['sample_rate']))
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+
+
+def pcm_silence (fmt: AudioFormat, seconds: float):
+	"""! Creates silent PCM of given duration."""
+	return b'\0' * (int (fmt.sample_rate * seconds) * fmt.frame_size)
+
+
+def pcm_join (parts, fmt: AudioFormat, gap: float = 0.0):
+	"""! Concatenates PCM parts, optionally separated by silence.
+	@param parts Iterable of PCM bytes, all in given format.
+	@param fmt AudioFormat of the parts.
+	@param gap Seconds of silence between parts.
+	@return Returns joined PCM.
+	"""
+	return pcm_silence (fmt, gap).join (parts)
+
+
+def pcm_envelope (pcm: bytes, fmt: AudioFormat, seconds: float = 0.01):
+	"""! Computes the loudness envelope of 16bit PCM.
+	@param pcm Raw audio.
+	@param fmt AudioFormat of given PCM.
+	@param seconds Length of the windows loudness is measured over.
+	@return Returns a list of RMS values, one per window.
+	@throws ValueError if the samples are not 16bit.
+	"""
+	if 2 != fmt.sample_width:
+		raise ValueError (f'Expected 16bit samples, got {fmt}.')
+	samples = array.array ('h', pcm[:len (pcm) - len (pcm) % 2])
+	if 'big' == sys.byteorder:
+		samples.byteswap ()
+	window = max (1, int (fmt.sample_rate * seconds) * fmt.channels)
+	envelope = []
+	for i in range (0, len (samples), window):
+		w = samples[i:i + window]
+		envelope.append (math.sqrt (sum (s * s for s in w) / len (w)))
+	return envelope
+
+
+def wav_read (path: str):
+	"""! Reads a wav file.
+	@param path Path to wav file.
+	@return Returns a touple of (AudioFormat, pcm bytes).
+	"""
+	with wave.open (str (path), 'rb') as w:
+		fmt = AudioFormat (w.getframerate ()
+			, w.getnchannels ()
+			, w.getsampwidth ()
+		)
+		return fmt, w.readframes (w.getnframes ())
+
+
+def wav_is_complete (path: str):
+	"""! Checks if a wav file exists and holds all of its announced audio.
+	@param path Path to wav file.
+	@return Returns True if the file is complete.
+	"""
+	try:
+		with wave.open (str (path), 'rb') as w:
+			frame_size = w.getnchannels () * w.getsampwidth ()
+			expected = w.getnframes () * frame_size
+		return 44 + expected <= os.path.getsize (path)
+	except (OSError, EOFError, wave.Error):
+		return False
+
+
+def wav_duration (path: str):
+	"""! Reads the duration of a wav file.
+	@param path Path to wav file.
+	@return Returns seconds of audio, or None if unreadable.
+	"""
+	try:
+		with wave.open (str (path), 'rb') as w:
+			return w.getnframes () / w.getframerate ()
+	except (OSError, EOFError, wave.Error, ZeroDivisionError):
+		return None
+
+
+def wav_write (path: str, fmt: AudioFormat, pcm: bytes):
+	"""! Writes raw PCM to a wav file.
+	@param path Path to wav file.
+	@param fmt AudioFormat of given PCM.
+	@param pcm Raw audio.
+	"""
+	with wave.open (str (path), 'wb') as w:
+		w.setnchannels (fmt.channels)
+		w.setsampwidth (fmt.sample_width)
+		w.setframerate (fmt.sample_rate)
+		w.writeframes (pcm)
+
+
+def wav_header (fmt: AudioFormat, data_size: int = None):
+	"""! Builds a (PCM) wav file header.
+	@param fmt AudioFormat of the following PCM.
+	@param data_size	Bytes of PCM following the header. If None, the
+						sizes are set to WAV_SIZE_UNKNOWN for streaming.
+	@return Returns the 44 bytes of the header.
+	"""
+	riff_size = WAV_SIZE_UNKNOWN
+	if data_size is None:
+		data_size = WAV_SIZE_UNKNOWN
+	else:
+		riff_size = 36 + data_size
+	byte_rate = fmt.sample_rate * fmt.frame_size
+	return struct.pack ('<4sI4s4sIHHIIHH4sI'
+		, b'RIFF', riff_size, b'WAVE'
+		, b'fmt ', 16, 1, fmt.channels, fmt.sample_rate
+		, byte_rate, fmt.frame_size, fmt.sample_width * 8
+		, b'data', data_size
+	)
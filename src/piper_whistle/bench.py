@@ -0,0 +1,260 @@
+"""Synthesis benchmark.
+
+Runs a fixed corpus of sentences through piper, for each voice given,
+and measures:
+
+* load_time: Seconds until piper had the voice loaded.
+* ttfb: Mean seconds until the audio of a sentence was done. As whistle
+	streams sentence by sentence, this is the time to the first audio.
+* chars_per_second: Characters synthesised per second.
+* rtf: Real-time factor, seconds of synthesis per second of audio.
+
+Sentences are sent one after another to a single piper process (or the
+in-process engine, see engine module), after warming it up. Reports
+carry information about the host, so results can be compared across
+machines.
+
+Variants of a model (e.g. quantised ones) are compared against the
+original by benchmarking both, and by comparing the audio they produce
+with the noise of synthesis disabled:
+
+* duration_delta: Relative difference of the total audio duration.
+* envelope_correlation: Mean correlation of the loudness envelopes of
+	the sentences. 1.0 means the variant's audio rises and falls with the
+	original's.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import math
+import time
+import pathlib
+import platform
+import tempfile
+import wave
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import audio
+from piper_whistle import engine as whistle_engine
+
+
+CORPUS = (
+	'Hello.',
+	'The quick brown fox jumps over the lazy dog.',
+	'Your order has been shipped and will arrive tomorrow morning.',
+	'Please remember to save your work, the system restarts in five minutes.',
+	'A journey of a thousand miles begins with a single step, '
+	'and every step after that one gets a little easier.'
+)
+# Columns of a benchmark result row.
+COLUMNS = [
+	'key', 'quality', 'load_time', 'ttfb', 'chars_per_second', 'rtf',
+	'sentences', 'audio_seconds', 'engine'
+]
+# Columns of a variant comparison row.
+COMPARE_COLUMNS = [
+	'key', 'model_size', 'load_time', 'ttfb', 'chars_per_second', 'rtf',
+	'duration_delta', 'envelope_correlation'
+]
+# Seconds to wait for piper loading a voice.
+LOAD_TIMEOUT = 120.0
+# Piper parameters disabling the noise of synthesis, so the audio of a
+# model and its variants can be compared.
+DETERMINISTIC_ARGS = ['--noise_scale', '0', '--noise_w', '0']
+
+
+def host_info ():
+	"""! Describes the machine benchmarks run on.
+	@return Returns a map of host details.
+	"""
+	return {
+		'node': platform.node (),
+		'system': platform.system (),
+		'release': platform.release (),
+		'machine': platform.machine (),
+		'processor': platform.processor (),
+		'cpus': os.cpu_count (),
+		'python': platform.python_version (),
+		'time': time.time ()
+	}
+
+
+def voice_bench (piper, model, corpus = CORPUS
+	, repeat: int = 1
+	, warmup: int = 1
+	, extra_args = None
+	, timeout: float = None
+	, engine: str = whistle_engine.DEFAULT_ENGINE
+	, engine_options: dict = None
+):
+	"""! Benchmarks a voice.
+	@param piper Piper executable. Either a path / command string or a list.
+	@param model Installed model map. (see db.query_installed)
+	@param corpus Sentences to synthesise.
+	@param repeat Number of times the corpus is synthesised.
+	@param warmup Number of sentences synthesised before measuring.
+	@param extra_args Additional parameters passed on to piper. (optional)
+	@param timeout Seconds to wait for a single sentence. (optional)
+	@param engine Synthesis engine. (see engine.ENGINES)
+	@param engine_options	Sessions and threads of the onnx engine.
+							(see engine.worker_factory)
+	@return Returns a map of COLUMNS.
+	@throws RuntimeError if synthesis fails.
+	"""
+	with tempfile.TemporaryDirectory () as tmp:
+		factory = whistle_engine.worker_factory (engine, piper, tmp
+			, extra_args = extra_args
+			, **(engine_options or {})
+		)
+		w = factory (model['path']).start ()
+		try:
+			if not w.wait_ready (LOAD_TIMEOUT):
+				raise RuntimeError (f'Could not load "{model["key"]}".')
+
+			def _synthesise (text):
+				started = time.monotonic ()
+				wav_path = w.submit ({'text': text}).result (timeout)
+				elapsed = time.monotonic () - started
+				duration = audio.wav_duration (wav_path)
+				pathlib.Path (wav_path).unlink (missing_ok = True)
+				if duration is None:
+					raise RuntimeError (f'Piper wrote no audio for "{text}".')
+				return elapsed, duration
+
+			for text in list (corpus)[:warmup]:
+				_synthesise (text)
+
+			elapsed = 0.0
+			duration = 0.0
+			chars = 0
+			sentences = 0
+			for _ in range (repeat):
+				for text in corpus:
+					e, d = _synthesise (text)
+					elapsed += e
+					duration += d
+					chars += len (text)
+					sentences += 1
+		finally:
+			w.stop ()
+
+	holz.debug (f'Benchmarked {model["key"]} in {elapsed:.3f}s.')
+	return {
+		'key': model['key'],
+		'quality': model['quality'],
+		'load_time': round (w.load_time, 4),
+		'ttfb': round (elapsed / sentences, 4),
+		'chars_per_second': round (chars / elapsed, 2),
+		'rtf': round (elapsed / duration, 4) if duration else None,
+		'sentences': sentences,
+		'audio_seconds': round (duration, 3),
+		'engine': engine
+	}
+
+
+def voice_render (piper, model, corpus = CORPUS
+	, extra_args = None
+	, timeout: float = None
+):
+	"""! Synthesises every sentence of a corpus with piper.
+	@param piper Piper executable. Either a path / command string or a list.
+	@param model Installed model map. (see db.query_installed)
+	@param corpus Sentences to synthesise.
+	@param extra_args Additional parameters passed on to piper. (optional)
+	@param timeout Seconds to wait for a single sentence. (optional)
+	@return Returns a list of (AudioFormat, pcm bytes), one per sentence.
+	@throws RuntimeError if piper fails.
+	"""
+	rendered = []
+	with tempfile.TemporaryDirectory () as tmp:
+		factory = whistle_engine.worker_factory ('piper', piper, tmp
+			, extra_args = extra_args
+		)
+		w = factory (model['path']).start ()
+		try:
+			if not w.wait_ready (LOAD_TIMEOUT):
+				raise RuntimeError (f'Piper did not load "{model["key"]}".')
+			for text in corpus:
+				wav_path = w.submit ({'text': text}).result (timeout)
+				try:
+					rendered.append (audio.wav_read (wav_path))
+				except (OSError, EOFError, wave.Error) as e:
+					raise RuntimeError (f'Piper wrote no audio for "{text}": {e}')
+		finally:
+			w.stop ()
+	return rendered
+
+
+def correlation (a: list, b: list):
+	"""! Correlates two series over their common length.
+	@return	Returns Pearson's correlation coefficient. Constant series
+			correlate with 1.0 if equal, otherwise 0.0.
+	"""
+	n = min (len (a), len (b))
+	if 0 == n:
+		return 0.0
+	a, b = a[:n], b[:n]
+	mean_a = sum (a) / n
+	mean_b = sum (b) / n
+	cov = sum ((x - mean_a) * (y - mean_b) for x, y in zip (a, b))
+	var_a = sum ((x - mean_a) ** 2 for x in a)
+	var_b = sum ((y - mean_b) ** 2 for y in b)
+	if 0 == var_a or 0 == var_b:
+		return 1.0 if a == b else 0.0
+	return cov / math.sqrt (var_a * var_b)
+
+
+def voice_compare (piper, model, variant, corpus = CORPUS
+	, repeat: int = 1
+	, extra_args = None
+	, timeout: float = None
+):
+	"""! Compares a variant of a model with the original.
+	@param piper Piper executable. Either a path / command string or a list.
+	@param model Installed model map. (see db.query_installed)
+	@param variant Model map (key, quality and path) of the variant.
+	@param corpus Sentences to synthesise.
+	@param repeat Number of times the corpus is benchmarked.
+	@param extra_args Additional parameters passed on to piper. (optional)
+	@param timeout Seconds to wait for a single sentence. (optional)
+	@return Returns a list of two maps of COMPARE_COLUMNS, the original's
+			and the variant's.
+	@throws RuntimeError if piper fails.
+	"""
+	deterministic_args = list (extra_args or []) + DETERMINISTIC_ARGS
+	rows = []
+	reference = None
+	for m in (model, variant):
+		result = voice_bench (piper, m, corpus
+			, repeat = repeat
+			, extra_args = extra_args
+			, timeout = timeout
+		)
+		rendered = voice_render (piper, m, corpus
+			, extra_args = deterministic_args
+			, timeout = timeout
+		)
+		envelopes = [audio.pcm_envelope (pcm, fmt) for fmt, pcm in rendered]
+		durations = [len (pcm) / (fmt.frame_size * fmt.sample_rate)
+			for fmt, pcm in rendered
+		]
+		if reference is None:
+			reference = (envelopes, durations)
+		correlations = [correlation (a, b)
+			for a, b in zip (reference[0], envelopes)
+		]
+		total = sum (reference[1])
+		rows.append ({
+			'key': m['key'],
+			'model_size': os.path.getsize (m['path']),
+			'load_time': result['load_time'],
+			'ttfb': result['ttfb'],
+			'chars_per_second': result['chars_per_second'],
+			'rtf': result['rtf'],
+			'duration_delta':
+				round ((sum (durations) - total) / total, 4) if total else None,
+			'envelope_correlation':
+				round (sum (correlations) / len (correlations), 4)
+		})
+	return rows
@@ -0,0 +1,287 @@
+"""Synthesis result cache.
+
+Content addressed store of synthesised wav files, located in the data
+root. Entries are keyed by the normalised text, the voice key, speaker and
+piper settings, so repeated prompts are served without running piper.
+
+The cache is bounded in size. Hits refresh the modification time of an
+entry, and once the cache grows beyond its size, entries least recently
+used are removed first. Eviction scans all entries, so it makes room
+down to a low-water mark (EVICT_TARGET of the size) instead of just
+enough for the entry added, and runs seldom on a full cache.
+
+Requests answered by piper asynchronously (e.g. speak via a channel) can
+be recorded as pending. The wav file is taken into the cache once it is
+complete, the next time its key is looked up. As the file was recorded
+before piper wrote it, it is only taken in if it changed since, and
+records are settled (see SynthesisCache.settle) before their file is
+targeted again, so audio of another text is never cached under a key.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import shutil
+import hashlib
+import pathlib
+import threading
+import unicodedata
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import audio
+
+
+DEFAULT_CACHE_SIZE = 256 << 20
+# Share of the maximum size eviction trims the cache down to.
+EVICT_TARGET = 0.9
+
+
+def text_normalize (text: str):
+	"""! Normalises text, so trivially different texts share an entry.
+	@param text Text to be spoken.
+	@return Returns NFC normalised text with collapsed whitespace.
+	"""
+	return ' '.join (unicodedata.normalize ('NFC', text).split ())
+
+
+def cache_key (text: str, voice: str, speaker = None, settings: dict = None):
+	"""! Computes cache key of a synthesis request.
+	@param text Text to be spoken.
+	@param voice Voice key. (e.g. en_GB-alba-medium)
+	@param speaker Speaker id or name. (optional)
+	@param settings Map of piper settings affecting the audio. (optional)
+	@return Returns hex digest identifying the request.
+	"""
+	j = json.dumps ({
+		'text': text_normalize (text),
+		'voice': voice,
+		'speaker': str (speaker or 0),
+		'settings': settings or {}
+	}, sort_keys = True, ensure_ascii = False)
+	return hashlib.sha256 (j.encode ('utf-8')).hexdigest ()
+
+
+def _identity (path: str):
+	"""! Identifies the contents of a file by inode, size and mtime.
+	@return Returns a list of [st_ino, st_size, st_mtime_ns], or None if
+			the file does not exist.
+	"""
+	try:
+		st = os.stat (path)
+	except OSError:
+		return None
+	return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def _place (src: str, dest: str, link: bool):
+	"""! Hard links (if requested and possible) or copies a file."""
+	if link:
+		try:
+			os.link (src, dest)
+			return
+		except OSError:
+			pass
+	shutil.copyfile (src, dest)
+
+
+class SynthesisCache:
+	"""! Size bounded LRU store of wav files."""
+	def __init__ (self, root: str, max_size: int = DEFAULT_CACHE_SIZE):
+		"""! Creates cache.
+		@param root Directory of the cache. Usually paths['cache'].
+		@param max_size Maximum bytes of all entries.
+		"""
+		self.root = pathlib.Path (root)
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self._size = None
+		self._lock = threading.Lock ()
+
+	def _path (self, key):
+		return self.root.joinpath (key[:2], f'{key}.wav')
+
+	def _pending_path (self, key):
+		return self.root.joinpath ('pending', key)
+
+	def _entries (self):
+		if not self.root.exists ():
+			return
+		for d in self.root.iterdir ():
+			if 2 != len (d.name) or not d.is_dir ():
+				continue
+			for p in d.iterdir ():
+				if p.suffix == '.wav':
+					yield p
+
+	@property
+	def size (self):
+		"""! Bytes of all entries (scanned once, then tracked)."""
+		with self._lock:
+			if self._size is None:
+				self._size = sum (p.stat ().st_size for p in self._entries ())
+			return self._size
+
+	def _pending_load (self, pp):
+		"""! Loads a pending record, or None if it is unreadable."""
+		try:
+			record = json.loads (pp.read_text ())
+			return record if isinstance (record, dict) else None
+		except (OSError, ValueError):
+			return None
+
+	def _ingest_pending (self, key):
+		pp = self._pending_path (key)
+		record = self._pending_load (pp)
+		if record is None:
+			return None
+		output_path = record.get ('path', None)
+		# Not yet (re)written by piper.
+		if _identity (output_path) == record.get ('before', None):
+			return None
+		if not audio.wav_is_complete (output_path):
+			return None
+		p = self.put (key, output_path)
+		pp.unlink (missing_ok = True)
+		return p
+
+	def get (self, key: str):
+		"""! Looks up an entry, marking it as recently used.
+		@return Returns path to the cached wav file, or None.
+		"""
+		p = self._path (key)
+		try:
+			os.utime (p)
+		except FileNotFoundError:
+			p = self._ingest_pending (key)
+		if p is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return p.as_posix ()
+
+	def fetch (self, key: str, dest: str, link: bool = False):
+		"""! Places cached wav file of key at dest.
+		@param key Cache key.
+		@param dest Path to place the wav file at.
+		@param link	Hard link instead of copying. Only use for files which
+					are not modified afterwards.
+		@return Returns True on a hit.
+		"""
+		p = self.get (key)
+		if p is None:
+			return False
+		try:
+			_place (p, dest, link)
+		except OSError as e:
+			holz.warn (f'Could not fetch cache entry {key}: {e}')
+			return False
+		return True
+
+	def put (self, key: str, src: str, link: bool = False):
+		"""! Stores a wav file under given key.
+		@param key Cache key.
+		@param src Path to the wav file.
+		@param link	Hard link instead of copying. Only use for files which
+					are not modified afterwards.
+		@return Returns path to the cached wav file, or None on failure.
+		"""
+		p = self._path (key)
+		tmp = p.with_suffix (f'.{os.getpid ()}.{threading.get_ident ()}.tmp')
+		try:
+			p.parent.mkdir (parents = True, exist_ok = True)
+			_place (src, tmp.as_posix (), link)
+			try:
+				replaced = p.stat ().st_size
+			except FileNotFoundError:
+				replaced = 0
+			os.replace (tmp, p)
+			size = p.stat ().st_size - replaced
+		except OSError as e:
+			holz.warn (f'Could not cache "{src}": {e}')
+			tmp.unlink (missing_ok = True)
+			return None
+
+		with self._lock:
+			if self._size is not None:
+				self._size += size
+		if self.max_size < self.size:
+			self.evict ()
+		return p
+
+	def pending (self, key: str, output_path: str):
+		"""! Records a wav file to be taken into the cache once complete.
+
+		Has to be called before the file is (re)written, as only changes
+		made afterwards are taken in. Records of other keys for the same
+		file are settled first. If one of them is still waiting for its
+		audio, nothing is recorded, as there is no telling which of the
+		writes to come the file holds.
+
+		@param key Cache key of the audio the file is going to hold.
+		@param output_path Path of the wav file.
+		@return Returns True if the file was recorded.
+		"""
+		if 0 < self.settle (output_path):
+			holz.debug (f'Not caching "{output_path}", still being written.')
+			return False
+		pp = self._pending_path (key)
+		record = {'path': output_path, 'before': _identity (output_path)}
+		try:
+			pp.parent.mkdir (parents = True, exist_ok = True)
+			pp.write_text (json.dumps (record))
+		except OSError as e:
+			holz.warn (f'Could not record pending cache entry: {e}')
+			return False
+		return True
+
+	def settle (self, output_path: str):
+		"""! Settles pending records of a file, about to be overwritten.
+
+		Records of files written since are taken into the cache, the
+		others are dropped.
+
+		@param output_path Path of the wav file.
+		@return Returns number of records dropped without being taken in.
+		"""
+		d = self.root.joinpath ('pending')
+		if not d.is_dir ():
+			return 0
+		dropped = 0
+		for pp in d.iterdir ():
+			record = self._pending_load (pp)
+			if record is None or output_path != record.get ('path', None):
+				continue
+			if self._ingest_pending (pp.name) is None:
+				dropped += 1
+			pp.unlink (missing_ok = True)
+		return dropped
+
+	def evict (self):
+		"""! Removes least recently used entries, until the cache is down to
+		EVICT_TARGET of its max size.
+		@return Returns number of removed entries.
+		"""
+		entries = []
+		for p in self._entries ():
+			try:
+				st = p.stat ()
+			except FileNotFoundError:
+				continue
+			entries.append ((st.st_mtime, st.st_size, p))
+		entries.sort ()
+
+		size = sum (e[1] for e in entries)
+		target = int (self.max_size * EVICT_TARGET)
+		removed = 0
+		for _, entry_size, p in entries:
+			if size <= target:
+				break
+			p.unlink (missing_ok = True)
+			size -= entry_size
+			removed += 1
+		with self._lock:
+			self._size = size
+		holz.debug (f'Evicted {removed} cache entries.')
+		return removed
@@ -0,0 +1,228 @@
+"""Whistle catalog data model.
+
+Compact record types for the voices and languages whistle knows about.
+The catalog is built once from the raw voice index (voices.json) and then
+shared by the database helpers and commands, instead of keeping the nested
+JSON structure around for the lifetime of the process.
+
+All records use __slots__, strings repeated across voices (qualities,
+language metadata, file paths) are interned and speaker maps are backed by
+arrays instead of per-voice dicts.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import sys
+import array
+
+
+def _i (s):
+	"""! Interns given string, passing through None."""
+	if s is None:
+		return None
+	return sys.intern (str (s))
+
+
+class Speaker:
+	"""! A single speaker of a (multi-speaker) voice."""
+	__slots__ = ('name', 'id')
+
+	def __init__ (self, name: str, speaker_id: int):
+		self.name = name
+		self.id = speaker_id
+
+	def __repr__ (self):
+		return f'Speaker({self.name!r}, {self.id})'
+
+
+class VoiceFile:
+	"""! A file belonging to a voice on the remote repository."""
+	__slots__ = ('path', 'size', 'md5')
+
+	def __init__ (self, path: str, size: int, md5: str):
+		self.path = path
+		self.size = size
+		self.md5 = md5
+
+	@property
+	def kind (self):
+		"""! Classifies file as 'model', 'config', 'card' or 'other'."""
+		if self.path.endswith ('.onnx'):
+			return 'model'
+		if self.path.endswith ('.onnx.json'):
+			return 'config'
+		if self.path.endswith ('MODEL_CARD'):
+			return 'card'
+		return 'other'
+
+	def __repr__ (self):
+		return f'VoiceFile({self.path!r}, {self.size})'
+
+
+class Language:
+	"""! Language record, listing keys of all voices speaking it."""
+	__slots__ = (
+		'code', 'family', 'region',
+		'name_native', 'name_english', 'country_english',
+		'voices'
+	)
+
+	def __init__ (self, code, family, region
+		, name_native, name_english, country_english
+	):
+		self.code = code
+		self.family = family
+		self.region = region
+		self.name_native = name_native
+		self.name_english = name_english
+		self.country_english = country_english
+		self.voices = []
+
+	def __repr__ (self):
+		return f'Language({self.code!r}, {len (self.voices)} voices)'
+
+
+class Voice:
+	"""! Voice record as listed in the remote voice index."""
+	__slots__ = (
+		'key', 'name', 'language', 'quality', 'num_speakers',
+		'files', 'aliases', '_speaker_names', '_speaker_ids'
+	)
+
+	def __init__ (self, key, name, language, quality, num_speakers
+		, files, aliases, speaker_names, speaker_ids
+	):
+		self.key = key
+		self.name = name
+		self.language = language
+		self.quality = quality
+		self.num_speakers = num_speakers
+		self.files = files
+		self.aliases = aliases
+		self._speaker_names = speaker_names
+		self._speaker_ids = speaker_ids
+
+	@property
+	def code (self):
+		"""! Language code of this voice (e.g. en_GB)."""
+		return self.language.code
+
+	@property
+	def selection_name (self):
+		"""! Selector string in the form ${CODE}:${NAME}@${QUALITY}."""
+		return f'{self.language.code}:{self.name}@{self.quality}'
+
+	@property
+	def speaker_id_map (self):
+		"""! Builds a speaker name to id map (as found in the raw index)."""
+		return dict (zip (self._speaker_names, self._speaker_ids))
+
+	def speakers (self):
+		"""! Iterates speakers of this voice in index order."""
+		for name, speaker_id in zip (self._speaker_names, self._speaker_ids):
+			yield Speaker (name, speaker_id)
+
+	def speaker_id (self, name: str):
+		"""! Looks up the id of a named speaker, or None if unknown."""
+		try:
+			return self._speaker_ids[self._speaker_names.index (name)]
+		except ValueError:
+			return None
+
+	def file_of_kind (self, kind: str):
+		"""! Returns the first file of given kind (see VoiceFile.kind)."""
+		for f in self.files:
+			if kind == f.kind:
+				return f
+		return None
+
+	def __repr__ (self):
+		return f'Voice({self.key!r})'
+
+
+class Catalog:
+	"""! Lookup of all voices and languages, keyed by voice key and code."""
+	__slots__ = ('voices', 'languages')
+
+	def __init__ (self):
+		self.voices = {}
+		self.languages = {}
+
+	def voice (self, key: str):
+		"""! Fetches voice by key (e.g. de_DE-eva_k-x_low) or None."""
+		return self.voices.get (key, None)
+
+	def language (self, code: str):
+		"""! Fetches language by code (e.g. de_DE) or None."""
+		return self.languages.get (code, None)
+
+	def voice_at (self, code: str, voice_i: int):
+		"""! Fetches the voice at given index of a language, or None."""
+		lang = self.languages.get (code, None)
+		if lang and -1 < voice_i and voice_i < len (lang.voices):
+			return self.voices[lang.voices[voice_i]]
+		return None
+
+	def __len__ (self):
+		return len (self.voices)
+
+	def __repr__ (self):
+		return \
+			f'Catalog({len (self.voices)} voices, ' \
+			f'{len (self.languages)} languages)'
+
+
+def catalog_build (index: dict):
+	"""! Builds a catalog from the raw voice index.
+
+	Languages are created on first sight and shared by all of their voices.
+	Voice order within languages follows the order of the index, matching
+	the language lookup written on refresh.
+
+	@param index Parsed voice index (voices.json) as fetched from the remote.
+	@return Returns a Catalog object.
+	"""
+	catalog = Catalog ()
+
+	for entry in index.values ():
+		raw_lang = entry['language']
+		code = _i (raw_lang['code'])
+		lang = catalog.languages.get (code, None)
+		if lang is None:
+			lang = Language (code
+				, _i (raw_lang.get ('family'))
+				, _i (raw_lang.get ('region'))
+				, _i (raw_lang.get ('name_native'))
+				, _i (raw_lang.get ('name_english'))
+				, _i (raw_lang.get ('country_english'))
+			)
+			catalog.languages[code] = lang
+
+		files = tuple (
+			VoiceFile (_i (path), int (info['size_bytes']), info['md5_digest'])
+			for path, info in entry['files'].items ()
+		)
+
+		speaker_id_map = entry.get ('speaker_id_map', None) or {}
+		speaker_names = tuple (_i (name) for name in speaker_id_map)
+		speaker_ids = array.array ('I'
+			, (int (i) for i in speaker_id_map.values ())
+		)
+
+		key = _i (entry['key'])
+		voice = Voice (key
+			, _i (entry['name'])
+			, lang
+			, _i (entry['quality'])
+			, int (entry.get ('num_speakers', 1))
+			, files
+			, tuple (_i (a) for a in entry.get ('aliases', None) or [])
+			, speaker_names
+			, speaker_ids
+		)
+		catalog.voices[key] = voice
+		lang.voices.append (key)
+
+	# Freeze voice lists, now that all voices are known.
+	for lang in catalog.languages.values ():
+		lang.voices = tuple (lang.voices)
+
+	return catalog
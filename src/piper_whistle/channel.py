@@ -0,0 +1,535 @@
+"""Channel (named pipe) handling.
+
+Writing to a FIFO with a plain open () blocks until a reader is attached,
+which hangs callers whenever the pipeline (e.g. tail / piper) is down.
+The helpers here open channels non-blocking and bound every write by a
+timeout. Payloads which cannot be delivered in time are appended to an
+on-disk spool, which gets replayed in order once the reader is back.
+
+Payloads are lines. Channels are only ever written whole lines, so no
+torn line is left in a pipe for the next writer to append to: a line is
+only started before the deadline, and a line started is finished, even
+past it. (lines of up to PIPE_BUF bytes go into a pipe at once anyway)
+
+Only available on systems providing named pipes (linux / bsd).
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import hashlib
+import pathlib
+try:
+	import fcntl
+	import termios
+except ImportError:
+	fcntl = None
+	termios = None
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+
+
+# Delay between attempts to open a channel without reader.
+POLL_INTERVAL = 0.01
+# Default time budget of a single write.
+DEFAULT_TIMEOUT = 1.0
+
+
+def spool_path_for (paths, channel_path):
+	"""! Builds path of the spool file used for given channel.
+	@param paths Paths map. Can be obtained via @ref "db.data_paths ()".
+	@param channel_path Path to channel (FIFO).
+	@return Returns the spool file path as string.
+	"""
+	channel_path = pathlib.Path (channel_path).absolute ().as_posix ()
+	h = hashlib.sha1 (channel_path.encode ('utf-8')).hexdigest ()[:16]
+	p = pathlib.Path (paths['spool'])
+	return p.joinpath (f'{h}.spool').as_posix ()
+
+
+class _SpoolLock:
+	"""! Exclusive (advisory) lock guarding a spool file."""
+	def __init__ (self, spool_path):
+		self.path = f'{spool_path}.lock'
+		self.fd = -1
+
+	def __enter__ (self):
+		pathlib.Path (self.path).parent.mkdir (parents = True, exist_ok = True)
+		self.fd = os.open (self.path, os.O_RDWR | os.O_CREAT, 0o600)
+		if fcntl:
+			fcntl.flock (self.fd, fcntl.LOCK_EX)
+		return self
+
+	def __exit__ (self, *exc):
+		if fcntl:
+			fcntl.flock (self.fd, fcntl.LOCK_UN)
+		os.close (self.fd)
+		self.fd = -1
+		return False
+
+
+def spool_size (spool_path):
+	"""! Returns number of bytes waiting in spool."""
+	try:
+		return os.stat (spool_path).st_size
+	except FileNotFoundError:
+		return 0
+
+
+def spool_append (spool_path, data: bytes):
+	"""! Durably appends data to spool.
+	@param spool_path Path to spool file.
+	@param data Payload bytes.
+	@return Returns number of bytes spooled.
+	"""
+	with _SpoolLock (spool_path):
+		with open (spool_path, 'ab') as f:
+			f.write (data)
+			f.flush ()
+			os.fsync (f.fileno ())
+
+	holz.debug (f'Spooled {len (data)} bytes to "{spool_path}".')
+	return len (data)
+
+
+def spool_shed (spool_path, max_size: int = None, outdated = None):
+	"""! Drops oldest payloads from the spool.
+
+	Only whole JSON payload lines are dropped. Other lines (e.g. the rest
+	of a payload partially written to the channel) are kept.
+
+	@param spool_path Path to spool file.
+	@param max_size Drop payloads while the spool is larger. (optional)
+	@param outdated	Optional callable taking a payload line and returning
+					True if it should be dropped regardless of size.
+	@return Returns number of dropped payloads.
+	"""
+	with _SpoolLock (spool_path):
+		try:
+			with open (spool_path, 'rb') as f:
+				lines = f.readlines ()
+		except FileNotFoundError:
+			return 0
+
+		size = sum (map (len, lines))
+		kept = []
+		dropped = 0
+		for raw in lines:
+			line = raw.decode ('utf-8', 'replace')
+			droppable = raw.endswith (b'\n') and line.startswith ('{')
+			too_big = max_size is not None and max_size < size
+			if droppable and (too_big or (outdated and outdated (line))):
+				size -= len (raw)
+				dropped += 1
+				continue
+			kept.append (raw)
+		if 0 == dropped:
+			return 0
+
+		tmp_path = f'{spool_path}.tmp'
+		with open (tmp_path, 'wb') as f:
+			f.writelines (kept)
+			f.flush ()
+			os.fsync (f.fileno ())
+		os.replace (tmp_path, spool_path)
+
+	holz.debug (f'Dropped {dropped} spooled payloads.')
+	return dropped
+
+
+def pipe_pending (fd):
+	"""! Returns number of bytes waiting in the pipe behind fd, if known."""
+	if termios is None or 0 > fd:
+		return 0
+	try:
+		buf = fcntl.ioctl (fd, termios.FIONREAD, struct.pack ('i', 0))
+	except OSError:
+		return 0
+	return struct.unpack ('i', buf)[0]
+
+
+def _open_nonblocking (path, timeout):
+	"""! Opens FIFO for writing, waiting up to timeout for a reader.
+	@return Returns file descriptor, or -1 if no reader showed up.
+	"""
+	deadline = time.monotonic () + timeout
+	while True:
+		try:
+			return os.open (path, os.O_WRONLY | os.O_NONBLOCK)
+		except OSError as e:
+			# ENXIO signals there is no reader attached (yet).
+			if errno.ENXIO != e.errno:
+				raise
+		if time.monotonic () >= deadline:
+			return -1
+		time.sleep (POLL_INTERVAL)
+
+
+def _write_until (fd, data: bytes, deadline: float):
+	"""! Writes as much of data as possible before deadline.
+	@return Returns number of bytes written.
+	"""
+	view = memoryview (data)
+	written = 0
+	while written < len (data):
+		try:
+			written += os.write (fd, view[written:])
+			continue
+		except BlockingIOError:
+			pass
+		except BrokenPipeError:
+			break
+		remaining = deadline - time.monotonic ()
+		if 0 >= remaining:
+			break
+		# Wait until pipe has room again.
+		select.select ([], [fd], [], remaining)
+
+	return written
+
+
+def _line_finish (fd, rest, stop_event = None):
+	"""! Writes the rest of a line, started already, regardless of time.
+	@param stop_event Optional threading.Event to give up on.
+	@return Returns True if the line was finished.
+	"""
+	view = memoryview (rest)
+	while 0 < len (view):
+		if stop_event and stop_event.is_set ():
+			return False
+		try:
+			view = view[os.write (fd, view):]
+			continue
+		except BlockingIOError:
+			pass
+		except BrokenPipeError:
+			return False
+		select.select ([], [fd], [], DEFAULT_TIMEOUT)
+	return True
+
+
+def _write_lines_until (fd, data: bytes, deadline: float, stop_event = None):
+	"""! Writes as many whole lines of data as possible before deadline.
+
+	Lines are started before deadline only. A line started is finished,
+	even past deadline, unless the reader goes away (or stop_event is
+	set), in which case it counts as not written.
+
+	@return Returns number of bytes written, always at the end of a line.
+	"""
+	written = 0
+	for line in data.splitlines (keepends = True):
+		n = _write_until (fd, line, deadline)
+		if 0 < n < len (line):
+			holz.debug (f'Finishing line of {len (line)} bytes ...')
+			if _line_finish (fd, line[n:], stop_event):
+				n = len (line)
+		if n < len (line):
+			break
+		written += n
+	return written
+
+
+def _spool_drain_to (spool_path, fd, deadline, stop_event = None):
+	"""! Replays whole spooled lines to an opened channel until deadline.
+	@param stop_event	Optional threading.Event to give up on, while
+						finishing a line past deadline.
+	@return Returns True if spool is empty afterwards.
+	"""
+	with _SpoolLock (spool_path):
+		try:
+			with open (spool_path, 'rb') as f:
+				data = f.read ()
+		except FileNotFoundError:
+			return True
+		if 0 == len (data):
+			return True
+
+		written = _write_lines_until (fd, data, deadline, stop_event)
+		holz.debug (f'Drained {written} of {len (data)} spooled bytes.')
+		if written == len (data):
+			os.unlink (spool_path)
+			return True
+
+		# Keep the rest, replacing the spool atomically.
+		tmp_path = f'{spool_path}.tmp'
+		with open (tmp_path, 'wb') as f:
+			f.write (data[written:])
+			f.flush ()
+			os.fsync (f.fileno ())
+		os.replace (tmp_path, spool_path)
+
+	return False
+
+
+def spool_drain (spool_path, channel_path, timeout = DEFAULT_TIMEOUT):
+	"""! Replays spooled data to channel, in order.
+
+	Whatever could not be delivered within timeout stays in the spool.
+
+	@param spool_path Path to spool file.
+	@param channel_path Path to channel (FIFO).
+	@param timeout Time budget in seconds.
+	@return Returns True if spool is empty afterwards.
+	"""
+	if 0 == spool_size (spool_path):
+		return True
+
+	deadline = time.monotonic () + timeout
+	fd = _open_nonblocking (channel_path, timeout)
+	if 0 > fd:
+		return False
+	try:
+		return _spool_drain_to (spool_path, fd, deadline)
+	finally:
+		os.close (fd)
+
+
+def spool_drain_loop (spool_path, channel_path
+	, interval = 0.5
+	, timeout = DEFAULT_TIMEOUT
+	, forever = False
+):
+	"""! Keeps draining spool into channel.
+	@param interval Seconds to wait between attempts.
+	@param forever	If False, returns as soon as the spool is empty.
+					Otherwise keeps watching the spool.
+	"""
+	while True:
+		empty = spool_drain (spool_path, channel_path, timeout)
+		if empty and not forever:
+			return True
+		time.sleep (interval)
+
+
+class Channel:
+	"""! Non-blocking writer for a channel, with optional spool.
+
+	Keeps the channel open between sends. Every send starts lines within
+	timeout seconds only. If no reader is attached or the pipe stays
+	full, the payload lines (not yet started) are appended to the spool.
+	Spooled data is always delivered before new payloads, so order
+	is preserved.
+	"""
+	SENT = 'sent'
+	SPOOLED = 'spooled'
+	FAILED = 'failed'
+
+	def __init__ (self, path, spool_path = None, timeout = DEFAULT_TIMEOUT):
+		self.path = pathlib.Path (path).as_posix ()
+		self.spool_path = spool_path
+		self.timeout = timeout
+		self.fd = -1
+
+	def open (self, timeout = None):
+		"""! Opens channel, waiting up to timeout for a reader."""
+		if 0 > self.fd:
+			self.fd = _open_nonblocking (self.path
+				, self.timeout if timeout is None else timeout
+			)
+		return -1 < self.fd
+
+	def close (self):
+		if -1 < self.fd:
+			os.close (self.fd)
+			self.fd = -1
+
+	def backlog (self):
+		"""! Bytes waiting to be read, in the channel and its spool."""
+		self.open (0)
+		spooled = spool_size (self.spool_path) if self.spool_path else 0
+		return pipe_pending (self.fd) + spooled
+
+	def _spool (self, data: bytes):
+		if not self.spool_path:
+			holz.warn (f'Dropping {len (data)} bytes, no spool configured.')
+			return Channel.FAILED
+		spool_append (self.spool_path, data)
+		return Channel.SPOOLED
+
+	def send (self, payload):
+		"""! Sends payload within the configured timeout.
+		@param payload String or bytes to send.
+		@return Returns one of Channel.SENT, SPOOLED or FAILED.
+		"""
+		data = payload.encode ('utf-8') if isinstance (payload, str) else payload
+		deadline = time.monotonic () + self.timeout
+
+		if not self.open (self.timeout):
+			holz.info (f'No reader on "{self.path}".')
+			return self._spool (data)
+
+		if self.spool_path and 0 < spool_size (self.spool_path):
+			# Flush backlog first, so payloads keep their order.
+			if not _spool_drain_to (self.spool_path, self.fd, deadline):
+				self.close ()
+				return self._spool (data)
+
+		written = _write_lines_until (self.fd, data, deadline)
+		if written < len (data):
+			holz.info (f'Channel "{self.path}" stalled.')
+			self.close ()
+			return self._spool (data[written:])
+
+		return Channel.SENT
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *exc):
+		self.close ()
+		return False
+
+
+# Default channel layout, as used in the documented piper setup.
+CHANNEL_NAMES = ('speak', 'input', 'output')
+# Pipe buffer size requested by default (linux default maximum).
+DEFAULT_PIPE_SIZE = 1 << 20
+# Bytes moved per read when relaying.
+RELAY_CHUNK_SIZE = 1 << 16
+
+
+def channel_setup (root_path, names = CHANNEL_NAMES):
+	"""! Creates channel directory and missing named pipes in it.
+	@param root_path Directory holding the channels.
+	@param names Names of the channels to create.
+	@return Returns a map of channel names to paths.
+	"""
+	root = pathlib.Path (root_path)
+	root.mkdir (parents = True, exist_ok = True)
+
+	channels = {}
+	for name in names:
+		p = root.joinpath (name)
+		if not p.exists ():
+			holz.debug (f'Creating channel "{p}" ...')
+			os.mkfifo (p.as_posix ())
+		channels[name] = p.as_posix ()
+
+	return channels
+
+
+def _pipe_size_max ():
+	"""! Reads the maximum pipe size unprivileged users may request."""
+	try:
+		with open ('/proc/sys/fs/pipe-max-size', 'r') as f:
+			return int (f.read ().strip ())
+	except (OSError, ValueError):
+		return DEFAULT_PIPE_SIZE
+
+
+def pipe_size_set (fd, size):
+	"""! Tries to enlarge buffer of the pipe behind fd (linux only).
+	@param fd File descriptor of a pipe.
+	@param size Requested size in bytes, clamped to the system maximum.
+	@return Returns the resulting pipe size, or -1 if not supported.
+	"""
+	setpipe = getattr (fcntl, 'F_SETPIPE_SZ', None) if fcntl else None
+	if setpipe is None:
+		return -1
+
+	size = min (size, _pipe_size_max ())
+	try:
+		return fcntl.fcntl (fd, setpipe, size)
+	except OSError as e:
+		holz.warn (f'Could not resize pipe to {size} bytes ({e}).')
+		return -1
+
+
+def channel_hold (path, pipe_size = DEFAULT_PIPE_SIZE):
+	"""! Opens a FIFO for reading and writing without blocking.
+
+	Holding both ends keeps the pipe (and its buffer) alive, regardless
+	of other readers and writers coming and going.
+
+	@return Returns a touple of (read_fd, write_fd).
+	"""
+	rfd = os.open (path, os.O_RDONLY | os.O_NONBLOCK)
+	wfd = os.open (path, os.O_WRONLY | os.O_NONBLOCK)
+	if 0 < pipe_size:
+		size = pipe_size_set (wfd, pipe_size)
+		holz.debug (f'Pipe buffer of "{path}" is {size} bytes.')
+	return rfd, wfd
+
+
+def relay (speak_path, input_path
+	, output_path = None
+	, pipe_size = DEFAULT_PIPE_SIZE
+	, spool_path = None
+	, idle_interval = 0.5
+	, stop_event = None
+):
+	"""! Relays payloads written to the speak channel into piper's input.
+
+	Replaces the "tail -F speak | tee input" chain. The input channel is
+	held open, so piper never sees the end of its input when speak
+	clients come and go. Pipe buffers of all channels are enlarged, and
+	the spool of the speak channel is replayed (in whole lines, between
+	lines relayed) whenever the speak channel ran empty.
+
+	@param speak_path Channel receiving payloads (e.g. from speak).
+	@param input_path Channel read by piper.
+	@param output_path	Optional channel written by piper. Its pipe is
+						held open and enlarged as well.
+	@param pipe_size Requested pipe buffer size in bytes.
+	@param spool_path Spool of the speak channel to replay. (optional)
+	@param idle_interval Seconds between checks for spool and stop_event.
+	@param stop_event Optional threading.Event to stop relaying.
+	@return Returns number of bytes relayed.
+	"""
+	held = []
+	relayed = 0
+	try:
+		speak_rfd, speak_wfd = channel_hold (speak_path, pipe_size)
+		held += [speak_rfd, speak_wfd]
+		input_rfd, input_wfd = channel_hold (input_path, pipe_size)
+		held += [input_rfd, input_wfd]
+		if output_path:
+			held += list (channel_hold (output_path, pipe_size))
+
+		holz.info (f'Relaying "{speak_path}" => "{input_path}" ...')
+		# Whether relayed data ends with a whole line, so spooled lines
+		# may go in between.
+		at_line_end = True
+		while not (stop_event and stop_event.is_set ()):
+			# Once the speak channel ran empty, the spool holds the oldest
+			# payloads, as speak clients replay it before sending. So it
+			# goes first, all of it, in whole lines.
+			if at_line_end and spool_path and 0 < spool_size (spool_path) \
+				and 0 == pipe_pending (speak_rfd):
+				deadline = time.monotonic () + idle_interval
+				_spool_drain_to (spool_path, input_wfd, deadline, stop_event)
+				continue
+
+			ready, _, _ = select.select ([speak_rfd], [], [], idle_interval)
+			if not ready:
+				continue
+			try:
+				data = os.read (speak_rfd, RELAY_CHUNK_SIZE)
+			except BlockingIOError:
+				continue
+			if data:
+				at_line_end = data.endswith (b'\n')
+			# Not reading speak while piper's input is full is the
+			# backpressure, which lets speak clients spool once all
+			# buffers are full.
+			view = memoryview (data)
+			while 0 < len (view):
+				if stop_event and stop_event.is_set ():
+					holz.warn (f'Dropping {len (view)} bytes not relayed.')
+					break
+				try:
+					view = view[os.write (input_wfd, view):]
+				except BlockingIOError:
+					select.select ([], [input_wfd], [], idle_interval)
+			relayed += len (data) - len (view)
+	finally:
+		for fd in held:
+			os.close (fd)
+
+	holz.info (f'Relayed {relayed} bytes.')
+	return relayed
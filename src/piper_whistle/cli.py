@@ -13,6 +13,19 @@ sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
 from piper_whistle import holz
 from piper_whistle import db
 from piper_whistle import cmds
+from piper_whistle import formats
+from piper_whistle import channel
+from piper_whistle import worker
+from piper_whistle import router
+from piper_whistle import server
+from piper_whistle import cache
+from piper_whistle import scheduler
+from piper_whistle import fanout
+from piper_whistle import admission
+from piper_whistle import warm
+from piper_whistle import optimize
+from piper_whistle import engine
+from piper_whistle import render
 from piper_whistle import version
 
 
@@ -22,6 +35,16 @@ commands = {
 	'guess': cmds.run_guess,
 	'path': cmds.run_path,
 	'speak': cmds.run_speak,
+	'channel': cmds.run_channel,
+	'serve': cmds.run_serve,
+	'route': cmds.run_route,
+	'listen': cmds.run_listen,
+	'render': cmds.run_render,
+	'fanout': cmds.run_fanout,
+	'bench': cmds.run_bench,
+	'warm': cmds.run_warm,
+	'optimize': cmds.run_optimize,
+	'quantize': cmds.run_quantize,
 	'list': cmds.run_list,
 	'preview': cmds.run_preview,
 	'install': cmds.run_install,
@@ -121,6 +144,50 @@ class WhistleArgsParser (argparse.ArgumentParser):
 		return self._last_error_code, self._last_error_message
 
 
+def _engine_arguments_add (parser, sessions: bool = True):
+	"""! Adds options selecting and tuning the synthesis engine.
+	@param parser Parser of a command.
+	@param sessions Whether the command keeps several sessions per voice.
+	"""
+	parser.add_argument ('-E', '--engine'
+		, type = str
+		, help =
+			'Synthesise with piper processes, or in-process with\n'
+			'onnxruntime. (onnx)'
+		, choices = engine.ENGINES
+		, default = engine.DEFAULT_ENGINE
+	)
+	if sessions:
+		parser.add_argument ('--sessions'
+			, type = int
+			, help = 'onnxruntime sessions per voice. (onnx engine)'
+			, default = 1
+		)
+	parser.add_argument ('--intra-op-threads'
+		, type = int
+		, help = 'Threads within an operator. (onnx engine, 0 for default)'
+		, default = 0
+	)
+	parser.add_argument ('--inter-op-threads'
+		, type = int
+		, help = 'Threads across operators. (onnx engine, 0 for default)'
+		, default = 0
+	)
+
+
+def _placement_arguments_add (parser):
+	"""! Adds options placing workers on CPUs.
+	@param parser Parser of a command.
+	"""
+	parser.add_argument ('--cpus-per-worker'
+		, type = int
+		, help =
+			'Pin each piper worker to this many CPUs, spreading voices\n'
+			'across NUMA nodes. (0 does not pin, piper engine only)'
+		, default = 0
+	)
+
+
 def create_arg_parser (prog: str = 'piper_whistle'):
 	"""! Build argparse command line argument parser."""
 
@@ -223,6 +290,11 @@ def create_arg_parser (prog: str = 'piper_whistle'):
 		, help = 'Selector of voice to search.'
 		, default = ''
 	)
+	selector_args.add_argument ('-O', '--optimized'
+		, action = 'store_true'
+		, help = 'Prefer optimised variants of voices. (see optimize)'
+		, default = False
+	)
 
 	# Setup speak command and options.
 	speak_args = subparsers.add_parser ('speak'
@@ -235,8 +307,9 @@ def create_arg_parser (prog: str = 'piper_whistle'):
 		, default = False
 	)
 	speak_args.add_argument ('something', type = str
+		, nargs = '?'
 		, help = 'Something to speak.'
-		, default = ''
+		, default = None
 	)
 	speak_args.add_argument ('-c', '--channel'
 		, type = str
@@ -262,11 +335,675 @@ def create_arg_parser (prog: str = 'piper_whistle'):
 			' file where speech will be store in.'
 		, default = None
 	)
+	speak_args.add_argument ('-t', '--timeout'
+		, type = float
+		, help =
+			'Seconds to wait for the channel to accept a payload,\n'
+			'before it gets spooled.'
+		, default = channel.DEFAULT_TIMEOUT
+	)
+	speak_args.add_argument ('-V', '--voice'
+		, type = str
+		, help =
+			'Selector of the voice piper speaks with. Enables the\n'
+			'synthesis cache for --output.'
+		, default = None
+	)
+	speak_args.add_argument ('-C', '--cache-size'
+		, type = int
+		, help = 'Size (in MiB) of the synthesis cache. (0 disables it)'
+		, default = cache.DEFAULT_CACHE_SIZE >> 20
+	)
+	speak_args.add_argument ('-s', '--sentences'
+		, action = 'store_true'
+		, help =
+			'Send every sentence as a payload of its own, so audio of the\n'
+			'first sentence plays while the next ones are synthesised.'
+		, default = False
+	)
+	speak_args.add_argument ('-p', '--priority'
+		, type = str
+		, choices = list (scheduler.PRIORITIES.keys ())
+		, help = 'Priority class of the payload. (honoured by route)'
+		, default = None
+	)
+	speak_args.add_argument ('-I', '--interrupt'
+		, action = 'store_true'
+		, help = 'Ask route to cut less urgent audio playing short.'
+		, default = False
+	)
+	speak_args.add_argument ('-B', '--max-backlog'
+		, type = int
+		, help =
+			'Most KiB of payloads waiting in the channel and its spool,\n'
+			'before --overload applies. (0 for no limit)'
+		, default = 0
+	)
+	speak_args.add_argument ('-O', '--overload'
+		, type = str
+		, choices = admission.POLICIES
+		, help =
+			'What to do once the backlog is exceeded. reject exits with\n'
+			f'{admission.EXIT_OVERLOADED}, drop-oldest drops spooled payloads and\n'
+			'degrade asks for a lower quality of --voice.'
+		, default = admission.DEFAULT_POLICY
+	)
+	speak_args.add_argument ('-A', '--max-age'
+		, type = float
+		, help =
+			'Seconds after which serve and route skip the payload,\n'
+			'instead of speaking it late. (0 for no limit)'
+		, default = 0.0
+	)
+	speak_args.add_argument ('-N', '--no-spool'
+		, action = 'store_true'
+		, help = 'Fail instead of spooling payloads the channel did not take.'
+		, default = False
+	)
+	speak_args.add_argument ('-D', '--drain'
+		, action = 'store_true'
+		, help = 'Replay spooled payloads, waiting for a reader if necessary.'
+		, default = False
+	)
+	speak_args.add_argument ('-S', '--stdin', '--follow'
+		, dest = 'follow'
+		, action = 'store_true'
+		, help =
+			'Keep channel open and send every line read from stdin\n'
+			'as a separate payload, as soon as it arrives.'
+		, default = False
+	)
 	speak_args.add_argument ('-v', '--verbose'
 		, action = 'store_true'
 		, help = 'Activate verbose logging.'
 		, default = False
 	)
+	_engine_arguments_add (speak_args, sessions = False)
+
+	# Setup channel command and options.
+	channel_args = subparsers.add_parser ('channel'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	channel_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	channel_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	channel_args.add_argument ('channel_root', type = str
+		, nargs = '?'
+		, help = 'Directory holding the speak, input and output channels.'
+		, default = '/opt/wind/channels'
+	)
+	channel_args.add_argument ('-b', '--pipe-size'
+		, type = int
+		, help = 'Requested pipe buffer size in bytes (linux only).'
+		, default = channel.DEFAULT_PIPE_SIZE
+	)
+	channel_args.add_argument ('-s', '--setup-only'
+		, action = 'store_true'
+		, help = 'Only create the channels, then exit.'
+		, default = False
+	)
+
+	# Setup serve command and options.
+	serve_args = subparsers.add_parser ('serve'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	serve_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	serve_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	serve_args.add_argument ('voice_selector', type = str
+		, help = 'Selector of (installed) voice to serve.'
+	)
+	serve_args.add_argument ('-i', '--input'
+		, type = str
+		, help = 'Channel or file to read payloads from. "-" for stdin.'
+		, default = '-'
+	)
+	serve_args.add_argument ('-o', '--output'
+		, type = str
+		, help = 'Channel or file to write raw audio to. "-" for stdout.'
+		, default = '-'
+	)
+	serve_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	serve_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	serve_args.add_argument ('-r', '--ready-file'
+		, type = str
+		, help =
+			'File holding the pid of piper, while it is ready.\n'
+			'Removed whenever piper is down.'
+		, default = None
+	)
+	serve_args.add_argument ('-b', '--backoff-max'
+		, type = float
+		, help = 'Maximum seconds to wait before restarting crashed piper.'
+		, default = 30.0
+	)
+	serve_args.add_argument ('-c', '--coalesce'
+		, type = float
+		, help =
+			'Seconds to wait for further payloads of a burst. Payloads\n'
+			'only differing in text are merged into one. (0 disables)'
+		, default = 0.0
+	)
+	serve_args.add_argument ('-O', '--optimized'
+		, action = 'store_true'
+		, help = 'Prefer optimised variants of voices. (see optimize)'
+		, default = False
+	)
+	_placement_arguments_add (serve_args)
+
+	# Setup route command and options.
+	route_args = subparsers.add_parser ('route'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	route_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	route_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	route_args.add_argument ('-V', '--voice'
+		, type = str
+		, help = 'Selector of voice speaking payloads not selecting one.'
+		, default = None
+	)
+	route_args.add_argument ('-i', '--input'
+		, type = str
+		, help = 'Channel or file to read payloads from. "-" for stdin.'
+		, default = '-'
+	)
+	route_args.add_argument ('-o', '--output'
+		, type = str
+		, help = 'Channel or file to write raw audio to. "-" for stdout.'
+		, default = '-'
+	)
+	route_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	route_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	route_args.add_argument ('-m', '--memory-budget'
+		, type = int
+		, help = 'Memory (in MiB) loaded voices may use in total.'
+		, default = router.DEFAULT_MEMORY_BUDGET >> 20
+	)
+	route_args.add_argument ('-w', '--max-workers'
+		, type = int
+		, help = 'Maximum number of piper processes. (0 for no limit)'
+		, default = 0
+	)
+	route_args.add_argument ('-W', '--workers-per-voice'
+		, type = int
+		, help =
+			'Maximum number of piper processes per voice, synthesising\n'
+			'consecutive sentences in parallel.'
+		, default = 1
+	)
+	route_args.add_argument ('-g', '--segment'
+		, action = 'store_true'
+		, help =
+			'Synthesise and cache phrase by phrase, so recurring parts of\n'
+			'templated prompts are synthesised once.'
+		, default = False
+	)
+	route_args.add_argument ('-L', '--lookahead'
+		, type = int
+		, help =
+			'Maximum number of sentences handed to piper ahead of playback.\n'
+			'Bounds the wait of urgent requests. (0 for workers per voice + 1)'
+		, default = 0
+	)
+	route_args.add_argument ('-I', '--interrupt'
+		, action = 'store_true'
+		, help = 'Cut audio playing short, when a more urgent request arrives.'
+		, default = False
+	)
+	route_args.add_argument ('-C', '--cache-size'
+		, type = int
+		, help = 'Size (in MiB) of the synthesis cache. (0 disables it)'
+		, default = cache.DEFAULT_CACHE_SIZE >> 20
+	)
+	route_args.add_argument ('-O', '--optimized'
+		, action = 'store_true'
+		, help = 'Prefer optimised variants of voices. (see optimize)'
+		, default = False
+	)
+	_engine_arguments_add (route_args)
+	_placement_arguments_add (route_args)
+
+	# Setup listen command and options.
+	listen_args = subparsers.add_parser ('listen'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	listen_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	listen_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	listen_args.add_argument ('-l', '--listen'
+		, type = str
+		, help = 'HTTP address to listen on ([HOST:]PORT). "" to disable.'
+		, default = server.DEFAULT_LISTEN
+	)
+	listen_args.add_argument ('-s', '--socket'
+		, type = str
+		, help = 'Path of Unix socket to listen on.'
+		, default = None
+	)
+	listen_args.add_argument ('-V', '--voice'
+		, type = str
+		, help = 'Selector of voice speaking requests not selecting one.'
+		, default = None
+	)
+	listen_args.add_argument ('-t', '--timeout'
+		, type = float
+		, help = 'Seconds a request may wait for a voice to be loaded.'
+		, default = 30.0
+	)
+	listen_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	listen_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	listen_args.add_argument ('-m', '--memory-budget'
+		, type = int
+		, help = 'Memory (in MiB) loaded voices may use in total.'
+		, default = router.DEFAULT_MEMORY_BUDGET >> 20
+	)
+	listen_args.add_argument ('-w', '--max-workers'
+		, type = int
+		, help = 'Maximum number of piper processes. (0 for no limit)'
+		, default = 0
+	)
+	listen_args.add_argument ('-W', '--workers-per-voice'
+		, type = int
+		, help =
+			'Maximum number of piper processes per voice, synthesising\n'
+			'consecutive sentences in parallel.'
+		, default = 1
+	)
+	listen_args.add_argument ('-g', '--segment'
+		, action = 'store_true'
+		, help =
+			'Synthesise and cache phrase by phrase, so recurring parts of\n'
+			'templated prompts are synthesised once.'
+		, default = False
+	)
+	listen_args.add_argument ('-C', '--cache-size'
+		, type = int
+		, help = 'Size (in MiB) of the synthesis cache. (0 disables it)'
+		, default = cache.DEFAULT_CACHE_SIZE >> 20
+	)
+	listen_args.add_argument ('-O', '--optimized'
+		, action = 'store_true'
+		, help = 'Prefer optimised variants of voices. (see optimize)'
+		, default = False
+	)
+	_engine_arguments_add (listen_args)
+	_placement_arguments_add (listen_args)
+
+	# Setup render command and options.
+	render_args = subparsers.add_parser ('render'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	render_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	render_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	render_args.add_argument ('script', type = str
+		, help =
+			'Script to render, one line per utterance. "-" for stdin.\n'
+			'Lines are VOICE<tab>SPEAKER<tab>TEXT, VOICE<tab>TEXT, TEXT or\n'
+			'JSON maps with voice, speaker, text and gap.'
+	)
+	render_args.add_argument ('output', type = str
+		, help = 'Wav file to write. "-" for stdout.'
+	)
+	render_args.add_argument ('-V', '--voice'
+		, type = str
+		, help = 'Selector of voice speaking lines not selecting one.'
+		, default = None
+	)
+	render_args.add_argument ('-g', '--gap'
+		, type = float
+		, help = 'Seconds of silence between lines.'
+		, default = render.DEFAULT_GAP
+	)
+	render_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	render_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	render_args.add_argument ('-m', '--memory-budget'
+		, type = int
+		, help = 'Memory (in MiB) loaded voices may use in total.'
+		, default = router.DEFAULT_MEMORY_BUDGET >> 20
+	)
+	render_args.add_argument ('-w', '--max-workers'
+		, type = int
+		, help = 'Maximum number of piper processes. (0 for no limit)'
+		, default = 0
+	)
+	render_args.add_argument ('-W', '--workers-per-voice'
+		, type = int
+		, help =
+			'Maximum number of piper processes per voice, synthesising\n'
+			'lines in parallel.'
+		, default = 2
+	)
+	render_args.add_argument ('-C', '--cache-size'
+		, type = int
+		, help = 'Size (in MiB) of the synthesis cache. (0 disables it)'
+		, default = cache.DEFAULT_CACHE_SIZE >> 20
+	)
+	render_args.add_argument ('-O', '--optimized'
+		, action = 'store_true'
+		, help = 'Prefer optimised variants of voices. (see optimize)'
+		, default = False
+	)
+	_engine_arguments_add (render_args)
+	_placement_arguments_add (render_args)
+
+	# Setup fanout command and options.
+	fanout_args = subparsers.add_parser ('fanout'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	fanout_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	fanout_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	fanout_args.add_argument ('source', type = str
+		, help = 'Channel or file to read raw audio from. "-" for stdin.'
+	)
+	fanout_args.add_argument ('sinks', type = str
+		, nargs = '+'
+		, help =
+			'Destinations of the audio. Either a channel, a file or\n'
+			'unix:PATH to serve monitoring clients on a Unix socket.'
+	)
+	fanout_args.add_argument ('-b', '--buffer-size'
+		, type = int
+		, help =
+			'Size (in KiB) of the ring buffer. Sinks falling further\n'
+			'behind skip ahead.'
+		, default = fanout.DEFAULT_BUFFER_SIZE >> 10
+	)
+	fanout_args.add_argument ('-F', '--frame-size'
+		, type = int
+		, help = 'Bytes per audio frame. Sinks skip whole frames only.'
+		, default = fanout.DEFAULT_FRAME_SIZE
+	)
+
+	# Setup bench command and options.
+	bench_args = subparsers.add_parser ('bench'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	bench_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	bench_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	bench_args.add_argument ('voice_selectors', type = str
+		, nargs = '*'
+		, help = 'Selectors of (installed) voices. All installed by default.'
+	)
+	bench_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	bench_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	bench_args.add_argument ('-c', '--corpus'
+		, type = str
+		, help = 'File with one sentence per line, instead of the built-in.'
+		, default = None
+	)
+	bench_args.add_argument ('-n', '--repeat'
+		, type = int
+		, help = 'Number of times the corpus is synthesised.'
+		, default = 1
+	)
+	bench_args.add_argument ('-t', '--timeout'
+		, type = float
+		, help = 'Seconds to wait for piper synthesising a sentence.'
+		, default = 60.0
+	)
+	bench_args.add_argument ('-f', '--format'
+		, type = str
+		, choices = formats.MACHINE_FORMATS
+		, help = 'Format of the results printed.'
+		, default = 'tsv'
+	)
+	bench_args.add_argument ('-o', '--output'
+		, type = str
+		, help = 'JSON file to write a report (including host details) to.'
+		, default = None
+	)
+	bench_args.add_argument ('-N', '--no-record'
+		, action = 'store_true'
+		, help =
+			'Do not take real-time factors into the db. (see path,\n'
+			'quality auto)'
+		, default = False
+	)
+	_engine_arguments_add (bench_args)
+
+	# Setup warm command and options.
+	warm_args = subparsers.add_parser ('warm'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	warm_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	warm_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	warm_args.add_argument ('voice_selectors', type = str
+		, nargs = '*'
+		, help = 'Selectors of (installed) voices. All installed by default.'
+	)
+	warm_args.add_argument ('-p', '--pin'
+		, action = 'store_true'
+		, help =
+			'Copy models to --pin-root (a tmpfs). path and all commands\n'
+			'running piper use the copy from then on.'
+		, default = False
+	)
+	warm_args.add_argument ('-u', '--unpin'
+		, action = 'store_true'
+		, help = 'Remove pinned copies of the models.'
+		, default = False
+	)
+	warm_args.add_argument ('-r', '--pin-root'
+		, type = str
+		, help = 'Directory on a tmpfs to hold pinned models.'
+		, default = warm.DEFAULT_PIN_ROOT
+	)
+
+	# Setup optimize command and options.
+	optimize_args = subparsers.add_parser ('optimize'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	optimize_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	optimize_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	optimize_args.add_argument ('voice_selectors', type = str
+		, nargs = '*'
+		, help = 'Selectors of (installed) voices. All installed by default.'
+	)
+	optimize_args.add_argument ('-l', '--level'
+		, type = str
+		, help =
+			'Graph optimisation level. Models optimised with all only\n'
+			'run on the CPU they were optimised on.'
+		, choices = list (optimize.LEVELS)
+		, default = optimize.DEFAULT_LEVEL
+	)
+	optimize_args.add_argument ('-F', '--force'
+		, action = 'store_true'
+		, help = 'Optimise again, even if up to date.'
+		, default = False
+	)
+	optimize_args.add_argument ('-r', '--remove'
+		, action = 'store_true'
+		, help = 'Remove optimised variants of the voices.'
+		, default = False
+	)
+
+	# Setup quantize command and options.
+	quantize_args = subparsers.add_parser ('quantize'
+		, formatter_class = argparse.RawTextHelpFormatter
+		, add_help = False
+	)
+	quantize_args.add_argument ('-h', '--help'
+		, action = 'help'
+		, help = 'Show help message.'
+		, default = False
+	)
+	quantize_args.add_argument ('-v', '--verbose'
+		, action = 'store_true'
+		, help = 'Activate verbose logging.'
+		, default = False
+	)
+	quantize_args.add_argument ('voice_selectors', type = str
+		, nargs = '*'
+		, help = 'Selectors of (installed) voices. All installed by default.'
+	)
+	quantize_args.add_argument ('-w', '--weight-type'
+		, type = str
+		, help =
+			'Type of quantised weights. Quantised convolutions of int8\n'
+			'weights are not supported by all CPU kernels.'
+		, choices = list (optimize.WEIGHT_TYPES)
+		, default = optimize.DEFAULT_WEIGHT_TYPE
+	)
+	quantize_args.add_argument ('-C', '--per-channel'
+		, action = 'store_true'
+		, help = 'Quantise weights per channel, instead of per tensor.'
+		, default = False
+	)
+	quantize_args.add_argument ('-F', '--force'
+		, action = 'store_true'
+		, help = 'Quantise again, even if up to date.'
+		, default = False
+	)
+	quantize_args.add_argument ('-r', '--remove'
+		, action = 'store_true'
+		, help = 'Remove quantised variants of the voices.'
+		, default = False
+	)
+	quantize_args.add_argument ('-N', '--no-compare'
+		, action = 'store_true'
+		, help = 'Do not compare quantised variants with the originals.'
+		, default = False
+	)
+	quantize_args.add_argument ('-p', '--piper'
+		, type = str
+		, help = 'Piper executable. (env: PIPER_PATH)'
+		, default = worker.DEFAULT_PIPER
+	)
+	quantize_args.add_argument ('-a', '--piper-args'
+		, type = str
+		, help = 'Additional arguments passed on to piper.'
+		, default = ''
+	)
+	quantize_args.add_argument ('-t', '--timeout'
+		, type = float
+		, help = 'Seconds to wait for piper synthesising a sentence.'
+		, default = 60.0
+	)
+	quantize_args.add_argument ('-f', '--format'
+		, type = str
+		, choices = formats.MACHINE_FORMATS
+		, help = 'Format of the comparison printed.'
+		, default = 'tsv'
+	)
 
 	# Setup list command and options.
 	list_args = subparsers.add_parser ('list'
@@ -305,7 +1042,8 @@ def create_arg_parser (prog: str = 'piper_whistle'):
 	)
 	list_args.add_argument ('-U', '--show-url'
 		, action = 'store_true'
-		, help = 'Show URL of voice on remote host.'
+		, help = 'Show URL of voice on remote host. (and its size and digest'
+			' in machine readable formats)'
 		, default = False
 	)
 	list_args.add_argument ('-S', '--omit-speakers'
@@ -328,6 +1066,19 @@ def create_arg_parser (prog: str = 'piper_whistle'):
 		, help = 'List only specific language voice.'
 		, default = -1
 	)
+	list_args.add_argument ('-n', '--limit'
+		, type = int
+		, help = 'Stop listing after this many entries.'
+		, default = -1
+	)
+	list_args.add_argument ('-f', '--format'
+		, type = str
+		, choices = formats.FORMATS
+		, help =
+			'Output format. Machine readable formats (json, jsonl, tsv, csv)\n'
+			'always include all columns of a view, regardless of -g and -U.'
+		, default = 'text'
+	)
 
 	# Setup preview command and options.
 	preview_args = subparsers.add_parser ('preview'
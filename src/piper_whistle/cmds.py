@@ -5,6 +5,16 @@ Defines functions to handle available CLI commands.
 guess: run_guess
 path: run_path
 speak: run_speak
+channel: run_channel
+serve: run_serve
+route: run_route
+listen: run_listen
+render: run_render
+fanout: run_fanout
+bench: run_bench
+warm: run_warm
+optimize: run_optimize
+quantize: run_quantize
 list: run_list
 preview: run_preview
 install: run_install
@@ -14,15 +24,39 @@ Command handle function get passed whistle context and argparse arguments.
 
 """
 # 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
-import subprocess
+import os
 import sys
 import json
+import time
+import shlex
+import asyncio
+import signal
 import pathlib
+import tempfile
+import threading
+import subprocess
 # Append root package to path so it can be called with absolute path.
 sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
 from piper_whistle import holz
 from piper_whistle import db
 from piper_whistle import util
+from piper_whistle import catalog
+from piper_whistle import formats
+from piper_whistle import channel
+from piper_whistle import worker
+from piper_whistle import router
+from piper_whistle import server
+from piper_whistle import cache
+from piper_whistle import audio
+from piper_whistle import text as whistle_text
+from piper_whistle import fanout
+from piper_whistle import admission
+from piper_whistle import bench
+from piper_whistle import warm
+from piper_whistle import optimize
+from piper_whistle import engine
+from piper_whistle import placement
+from piper_whistle import render
 
 
 def _run_program (params: list):
@@ -42,25 +76,6 @@ def _run_program (params: list):
 	return (p.returncode, out, err)
 
 
-def _parse_voice_selector (selector: str):
-	"""! Get voice details from selector string.
-	@param selector Voice identifying string.
-	@return Returns a touple containgin (name, quality, speaker) of the voice.
-	"""
-	if '-' in selector:
-		code, name, quality = selector.split ('-')
-		return name, quality, 0
-
-	name, rest = selector.split ('@')
-	if '/' in rest:
-		quality, speaker = rest.split ('/')
-	else:
-		quality = rest
-		speaker = 0
-
-	return name, quality, speaker
-
-
 def run_refresh (context, args):
 	"""! Run command 'refresh'
 	@param context Context information and whistle database.
@@ -103,10 +118,10 @@ def run_guess (context, args):
 	matching_code = db.context_guess_language_from_name (context, target_lang)
 
 	if matching_code:
-		lang = context['db']['languages'][matching_code]
+		lang = context['db']['catalog'].language (matching_code)
 		holz.info (
 			f'Best guess for "{target_lang}": '
-			f'{matching_code} ({lang["name_native"]} [{lang["name_english"]}])'
+			f'{matching_code} ({lang.name_native} [{lang.name_english}])'
 		)
 		sys.stdout.write (matching_code)
 		return 0
@@ -115,26 +130,29 @@ def run_guess (context, args):
 	return 13
 
 
+def _resolve_voice_selector (context, selector: str, optimized: bool = False):
+	"""! Resolves a voice selector to an installed model.
+	@param context Context information and whistle database.
+	@param selector Voice identifying string. See @ref "run_path ()".
+	@param optimized Prefer the optimised variant of the model.
+	@return Returns a touple of (model_path, name, quality, speaker).
+			model_path is None, if no matching voice is installed.
+	"""
+	m = db.model_resolve_selector (context['paths'], selector
+		, optimized = optimized
+	)
+	return m['path'], m['name'], m['quality'], m['speaker']
+
+
 def run_path (context, args):
 	"""! Run command 'path'
 	@param context Context information and whistle database.
 	@param args Processed arguments (prepared by argparse).
 	@return Returns 0 on success, otherwise > 0.
 	"""
-	selector = args.voice_selector
-
-	code = None
-	if ':' in selector:
-		code, selector = selector.split (':')
-
-	name, quality, speaker = _parse_voice_selector (selector)
-
-	model_info = {
-		'name': name,
-		'quality': quality,
-		'speaker': speaker
-	}
-	voice_file_path = db.model_resolve_path (context['paths'], model_info)
+	voice_file_path, name, quality, speaker = _resolve_voice_selector (
+		context, args.voice_selector, args.optimized
+	)
 	if not voice_file_path:
 		holz.error (f'Could not find any voice matching {name}!')
 		return 13
@@ -143,35 +161,1132 @@ def run_path (context, args):
 	return 0
 
 
+def _speak_output_path (args):
+	"""! Absolute path of speak's --output (relative to working directory)."""
+	op = pathlib.Path (args.output)
+	if not op.is_absolute ():
+		op = pathlib.Path.cwd ().joinpath (args.output)
+	return op.absolute ().as_posix ()
+
+
+def _speak_cache_create (context, args):
+	"""! Creates the synthesis cache used by speak, if applicable.
+
+	Speak can only use the cache when writing to --output, and when it
+	knows which voice piper on the other end of the channel speaks with.
+
+	@return Returns a touple of (cache.SynthesisCache, voice key, speaker)
+			or (None, None, None) if caching does not apply.
+	"""
+	if not (args.output and args.voice and 0 < args.cache_size):
+		return None, None, None
+	if args.raw or not args.json:
+		return None, None, None
+
+	m = db.model_resolve_selector (context['paths'], args.voice)
+	voice = pathlib.Path (m['path']).stem if m['path'] else args.voice
+	synthesis_cache = cache.SynthesisCache (context['paths']['cache']
+		, args.cache_size << 20
+	)
+	return synthesis_cache, voice, m['speaker']
+
+
+def _speak_payload_build (text: str, args, voice: str = None):
+	"""! Encodes text to be spoken as a single payload line.
+	@param text Text to be spoken.
+	@param args Processed arguments of the speak command.
+	@param voice Selector of the voice to ask for. (optional, JSON only)
+	@return Returns payload string, including trailing newline.
+	"""
+	payload = f'{text}'
+	if args.json and not args.raw:
+		j = {'text': payload}
+		if args.output:
+			j['output_file'] = _speak_output_path (args)
+		if args.priority:
+			j['priority'] = args.priority
+		if args.interrupt:
+			j['interrupt'] = True
+		if voice:
+			j['voice'] = voice
+		if 0 < args.max_age:
+			j['expires'] = round (time.time () + args.max_age, 3)
+		payload = json.dumps (j)
+
+	return payload + '\n'
+
+
+def _speak_admit (context, c, payload: str, args):
+	"""! Applies the --overload policy, if payload exceeds --max-backlog.
+	@param context Context information and whistle database.
+	@param c Channel the payload is sent to.
+	@param payload Payload string.
+	@param args Processed arguments of the speak command.
+	@return Returns a touple of (True if admitted, selector of degraded
+			voice or None).
+	"""
+	limit = args.max_backlog << 10
+	if 0 >= limit or c.backlog () + len (payload) <= limit:
+		return True, None
+
+	if c.spool_path:
+		# Stale payloads would be skipped anyway, so they go first.
+		channel.spool_shed (c.spool_path, outdated = admission.line_expired)
+	backlog = c.backlog ()
+	if backlog + len (payload) <= limit:
+		return True, None
+	holz.warn (f'Backlog full ({backlog} of {limit} bytes taken).')
+
+	if 'drop-oldest' == args.overload and c.spool_path:
+		keep = limit - len (payload) - channel.pipe_pending (c.fd)
+		dropped = channel.spool_shed (c.spool_path, max (0, keep))
+		holz.warn (f'Dropped {dropped} oldest payloads.')
+		return True, None
+
+	if 'degrade' == args.overload and args.voice and args.json \
+		and not args.raw:
+		degraded = admission.voice_degrade (context['paths'], args.voice)
+		if degraded:
+			holz.warn (f'Degrading voice to "{degraded}".')
+			return True, degraded
+
+	holz.error ('Overloaded. Payload rejected.')
+	return False, None
+
+
+def _speak_in_process (context, args, texts):
+	"""! Synthesises texts to --output with the in-process engine.
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@param texts Iterable of texts to speak.
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	if not args.output or not args.voice:
+		holz.error ('The onnx engine requires --output and --voice.')
+		return 13
+	if not _engine_check (args):
+		return 13
+	m = db.model_resolve_selector (context['paths'], args.voice)
+	if not m['path']:
+		holz.error (f'Could not find any voice matching {args.voice}!')
+		return 13
+
+	synthesis_cache, voice, speaker = _speak_cache_create (context, args)
+	settings = _cache_settings (args)
+	output_path = _speak_output_path (args)
+	try:
+		v = engine.Voice (m['path']
+			, intra_op_threads = args.intra_op_threads
+			, inter_op_threads = args.inter_op_threads
+		)
+	except (RuntimeError, OSError, ValueError) as e:
+		holz.error (f'Could not load "{m["path"]}": {e}')
+		return 13
+
+	r = 0
+	try:
+		for text in texts:
+			if not text.strip ():
+				continue
+
+			key = None
+			if synthesis_cache:
+				key = cache.cache_key (text, voice, speaker, settings)
+				if synthesis_cache.fetch (key, output_path):
+					holz.info ('Served from cache.')
+					continue
+
+			try:
+				pcm = v.synthesize (text, m['speaker'])
+				audio.wav_write (output_path, v.config.format, pcm)
+			except Exception as e:
+				holz.error (f'Could not synthesise "{text}": {e}')
+				r = 13
+				continue
+			holz.info (f'Wrote {len (pcm)} bytes of audio.')
+			if key:
+				synthesis_cache.put (key, output_path)
+	finally:
+		v.close ()
+
+	return r
+
+
 def run_speak (context, args):
 	"""! Run command 'speak'
+
+	Payloads are written non-blocking. If no reader is attached to the
+	channel, or it does not accept data within --timeout, payloads are
+	spooled and replayed in order with the next send or via --drain.
+
+	With --sentences, every sentence is sent as a payload of its own, so
+	piper starts streaming audio after the first sentence.
+
+	With --output and --voice, wav files are served from the synthesis
+	cache. Files written by piper are taken into the cache with the next
+	request of the same text.
+
+	With --max-backlog, payloads exceeding the backlog of the channel are
+	handled according to --overload. (see admission module)
+
+	With --engine onnx, speech is synthesised in-process to --output,
+	without a channel and piper. (see engine module)
+
 	@param context Context information and whistle database.
 	@param args Processed arguments (prepared by argparse).
 	@return Returns 0 on success, otherwise > 0.
 	"""
 	p = pathlib.Path (args.channel)
+	in_process = 'onnx' == args.engine and not args.drain
 
-	if not p.exists ():
+	if not in_process and not p.exists ():
 		holz.error (f'No channel at "{p}" found.')
 		return 13
 
-	with open (p, 'w') as f:
-		payload = f'{args.something}'
-		if args.json:
-			j = {'text': payload}
-			if args.output:
-				# If relative path, prepend current working directory.
-				op = pathlib.Path (args.output)
-				if not op.is_absolute ():
-					op = pathlib.Path.cwd ().joinpath (args.output)
-				j['output_file'] = op.absolute ().as_posix ()
-			payload = json.dumps (j)
+	spool_path = None
+	if not args.no_spool:
+		spool_path = channel.spool_path_for (context['paths'], p)
+
+	if args.drain:
+		if not spool_path:
+			holz.error ('Cannot drain with spool disabled.')
+			return 13
+		holz.info (f'Draining "{spool_path}" ...')
+		channel.spool_drain_loop (spool_path, p.as_posix ()
+			, timeout = args.timeout
+		)
+		return 0
+
+	if args.follow:
+		texts = (
+			line.rstrip ('\r\n')
+			for line in iter (sys.stdin.readline, '')
+		)
+	elif args.something is None:
+		holz.error ('Nothing to speak. Pass some text or use --stdin.')
+		return 13
+	else:
+		texts = [args.something]
+
+	if args.sentences and args.output:
+		holz.warn ('Not splitting sentences, as they share one --output.')
+	elif args.sentences:
+		texts = (
+			sentence
+			for t in texts
+			for sentence in whistle_text.sentences_split (t)
+		)
+
+	if in_process:
+		return _speak_in_process (context, args, texts)
+
+	synthesis_cache, voice, speaker = _speak_cache_create (context, args)
+	settings = _cache_settings (args)
+
+	r = 0
+	with channel.Channel (p, spool_path, args.timeout) as c:
+		for text in texts:
+			if not text.strip ():
+				continue
+
+			key = None
+			if synthesis_cache:
+				output_path = _speak_output_path (args)
+				# Whatever the output holds is about to be replaced.
+				synthesis_cache.settle (output_path)
+				key = cache.cache_key (text, voice, speaker, settings)
+				if synthesis_cache.fetch (key, output_path):
+					holz.info ('Served from cache.')
+					continue
+
+			payload = _speak_payload_build (text, args)
+			admitted, degraded = _speak_admit (context, c, payload, args)
+			if not admitted:
+				r = admission.EXIT_OVERLOADED
+				continue
+			if degraded:
+				payload = _speak_payload_build (text, args, voice = degraded)
+				key = None
+
+			if key:
+				# Recorded before piper gets to write the output.
+				synthesis_cache.pending (key, output_path)
+			holz.info (f'Sending {len (payload)} bytes ...')
+			status = c.send (payload)
+			holz.info (f'Payload {status}.')
+			if channel.Channel.SPOOLED == status:
+				holz.warn (f'Channel "{p}" unavailable. Payload spooled.')
+			elif channel.Channel.FAILED == status:
+				holz.error (f'Could not deliver payload to "{p}".')
+				r = 13
+				if key:
+					synthesis_cache.settle (output_path)
+
+	return r
+
+
+def run_channel (context, args):
+	"""! Run command 'channel'
+
+	Creates the speak, input and output channels in given directory and
+	relays payloads from speak to input, until interrupted.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	try:
+		channels = channel.channel_setup (args.channel_root)
+	except OSError as e:
+		holz.error (f'Could not set up channels at "{args.channel_root}": {e}')
+		return 13
+
+	if args.setup_only:
+		for name in channels:
+			sys.stdout.write (f'{name}\t{channels[name]}\n')
+		return 0
+
+	spool_path = channel.spool_path_for (context['paths'], channels['speak'])
+	try:
+		channel.relay (channels['speak'], channels['input']
+			, output_path = channels['output']
+			, pipe_size = args.pipe_size
+			, spool_path = spool_path
+		)
+	except KeyboardInterrupt:
+		holz.info ('Relay interrupted.')
+
+	return 0
+
+
+def _open_serve_stream (path: str, output: bool):
+	"""! Opens input or output stream of 'serve'.
+
+	"-" stands for stdin / stdout. Channels (FIFOs) are held open, so
+	piper never sees their end while readers and writers come and go.
+
+	@return Returns a touple of (fd, list of fds to close when done).
+	"""
+	if '-' == path:
+		return (1 if output else 0), []
+
+	p = pathlib.Path (path)
+	if p.is_fifo ():
+		rfd, wfd = channel.channel_hold (p.as_posix ())
+		if output:
+			os.set_blocking (wfd, True)
+			return wfd, [rfd, wfd]
+		return rfd, [rfd, wfd]
+
+	if output:
+		fd = os.open (p.as_posix (), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+	else:
+		fd = os.open (p.as_posix (), os.O_RDONLY)
+	return fd, [fd]
+
+
+def run_serve (context, args):
+	"""! Run command 'serve'
+
+	Keeps a piper process with the selected voice warm, forwarding every
+	payload line read from input. Piper's raw audio goes to output.
+	Crashed processes are restarted with exponential backoff.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	model_path, name, quality, speaker = _resolve_voice_selector (
+		context, args.voice_selector, args.optimized
+	)
+	if not model_path:
+		holz.error (f'Could not find any voice matching {name}!')
+		return 13
+
+	holz.info (f'Serving "{name}@{quality}" from "{model_path}" ...')
+	to_close = []
+	try:
+		input_fd, fds = _open_serve_stream (args.input, False)
+		to_close += fds
+		output_fd, fds = _open_serve_stream (args.output, True)
+		to_close += fds
+	except OSError as e:
+		holz.error (f'Could not open streams: {e}')
+		for fd in to_close:
+			os.close (fd)
+		return 13
+
+	params = worker.piper_command_build (args.piper, model_path
+		, speaker = speaker
+		, extra_args = shlex.split (args.piper_args)
+	)
+
+	cpu_placement = _placement_options (args)['cpu_placement']
+
+	def _worker_create ():
+		w = worker.PiperWorker (params, stdout = output_fd)
+		if cpu_placement:
+			w.cpus = cpu_placement.assign (model_path, w)
+		return w
+
+	supervisor = worker.Supervisor (_worker_create
+		, ready_path = args.ready_file
+		, backoff_max = args.backoff_max
+	)
+
+	stop = threading.Event ()
+
+	def _on_terminate (signum, frame):
+		stop.set ()
+
+	previous = signal.signal (signal.SIGTERM, _on_terminate)
+	try:
+		count = worker.serve (supervisor, input_fd
+			, stop_event = stop
+			, coalesce = args.coalesce
+		)
+		holz.info (f'Forwarded {count} payloads.')
+	except KeyboardInterrupt:
+		holz.info ('Serving interrupted.')
+	finally:
+		signal.signal (signal.SIGTERM, previous)
+		supervisor.stop ()
+		for fd in to_close:
+			os.close (fd)
+
+	return 0
+
+
+def _cache_settings (args):
+	"""! Piper settings making up the cache keys of a command."""
+	piper_args = getattr (args, 'piper_args', '')
+	return {'piper_args': piper_args} if piper_args else {}
+
+
+def _engine_check (args):
+	"""! Checks if the engine selected by args is available, and takes the
+	options given.
+	@return Returns True if it is, otherwise logs an error.
+	"""
+	if 'onnx' == args.engine and 0 < getattr (args, 'cpus_per_worker', 0):
+		holz.error (
+			'--cpus-per-worker pins piper processes, '
+			'so it can not be used with --engine onnx.'
+		)
+		return False
+	if 'onnx' == args.engine and not engine.available ():
+		holz.error (
+			'The onnx engine requires onnxruntime and numpy. '
+			'(pip install piper_whistle[onnx])'
+		)
+		return False
+	return True
+
+
+def _engine_options (args):
+	"""! Sessions and threads of the onnx engine, as given by args."""
+	return {
+		'sessions': args.sessions,
+		'intra_op_threads': args.intra_op_threads,
+		'inter_op_threads': args.inter_op_threads
+	}
+
+
+def _placement_options (args):
+	"""! CPU placement of workers, as given by args."""
+	cpu_placement = None
+	if 0 < args.cpus_per_worker:
+		cpu_placement = placement.Placement (args.cpus_per_worker)
+	return {
+		'cpu_placement': cpu_placement
+	}
+
+
+def _router_create (context, args, output_dir: str):
+	"""! Creates a router with a worker pool as configured by args.
+	@param context Context information and whistle database.
+	@param args	Processed arguments, containing piper, piper_args,
+				memory_budget (MiB), max_workers, workers_per_voice,
+				cache_size (MiB), optimized, the engine options
+				(see _engine_options) and the placement options.
+				(see _placement_options)
+	@param output_dir Directory piper writes wav files to.
+	@return Returns a router.Router.
+	"""
+	factory = engine.worker_factory (args.engine, args.piper, output_dir
+		, extra_args = shlex.split (args.piper_args)
+		, **_engine_options (args)
+		, **_placement_options (args)
+	)
+	pool = router.WorkerPool (factory
+		, memory_budget = args.memory_budget << 20
+		, max_workers = args.max_workers
+		, workers_per_voice = args.workers_per_voice
+	)
+	synthesis_cache = None
+	if 0 < args.cache_size:
+		synthesis_cache = cache.SynthesisCache (context['paths']['cache']
+			, args.cache_size << 20
+		)
+	return router.Router (context['paths'], pool
+		, synthesis_cache = synthesis_cache
+		, settings = _cache_settings (args)
+		, scratch_dir = output_dir
+		, optimized = args.optimized
+	)
+
+
+def run_route (context, args):
+	"""! Run command 'route'
+
+	Routes payload lines read from input to warm piper processes of the
+	voices they select, loading and evicting voices within the memory
+	budget. Raw audio is written to output in order of input, unless a
+	payload carries an output_file.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	if not _engine_check (args):
+		return 13
+	if args.voice:
+		m = db.model_resolve_selector (context['paths'], args.voice)
+		if not m['path']:
+			holz.error (f'Could not find any voice matching {args.voice}!')
+			return 13
+
+	to_close = []
+	try:
+		input_fd, fds = _open_serve_stream (args.input, False)
+		to_close += fds
+		output_fd, fds = _open_serve_stream (args.output, True)
+		to_close += fds
+	except OSError as e:
+		holz.error (f'Could not open streams: {e}')
+		for fd in to_close:
+			os.close (fd)
+		return 13
+
+	stop = threading.Event ()
+
+	def _on_terminate (signum, frame):
+		stop.set ()
+
+	previous = signal.signal (signal.SIGTERM, _on_terminate)
+	with tempfile.TemporaryDirectory (prefix = 'whistle-route-') as tmp:
+		r = _router_create (context, args, tmp)
+		try:
+			count = router.route (r, input_fd, output_fd
+				, default_selector = args.voice
+				, stop_event = stop
+				, segmented = args.segment
+				, lookahead = args.lookahead or args.workers_per_voice + 1
+				, interrupt = args.interrupt
+			)
+			holz.info (
+				f'Routed {count} payloads ({r.pool.evictions} evictions).'
+			)
+		except KeyboardInterrupt:
+			holz.info ('Routing interrupted.')
+		finally:
+			signal.signal (signal.SIGTERM, previous)
+			r.stop ()
+			for fd in to_close:
+				os.close (fd)
+
+	return 0
+
+
+def run_listen (context, args):
+	"""! Run command 'listen'
+
+	Serves the local synthesis API via HTTP on --listen and / or the
+	Unix socket --socket, streaming audio back to callers.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	if not args.listen and not args.socket:
+		holz.error ('Nothing to listen on. Use --listen and / or --socket.')
+		return 13
+	if not _engine_check (args):
+		return 13
+	if args.voice:
+		m = db.model_resolve_selector (context['paths'], args.voice)
+		if not m['path']:
+			holz.error (f'Could not find any voice matching {args.voice}!')
+			return 13
+
+	async def _listen (r):
+		stop = asyncio.Event ()
+		loop = asyncio.get_running_loop ()
+		for signum in (signal.SIGTERM, signal.SIGINT):
+			loop.add_signal_handler (signum, stop.set)
+		s = server.SynthesisServer (r, args.voice
+			, timeout = args.timeout
+			, segmented = args.segment
+		)
+		await s.run (stop, listen = args.listen, socket_path = args.socket)
+
+	with tempfile.TemporaryDirectory (prefix = 'whistle-listen-') as tmp:
+		r = _router_create (context, args, tmp)
+		try:
+			asyncio.run (_listen (r))
+		except OSError as e:
+			holz.error (f'Could not listen: {e}')
+			return 13
+		finally:
+			r.stop ()
+
+	return 0
+
+
+def run_render (context, args):
+	"""! Run command 'render'
+
+	Renders a script of (voice, speaker, text) lines into a single wav
+	file, synthesising lines concurrently with pooled workers and joining
+	their audio in script order.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	if not _engine_check (args):
+		return 13
+	try:
+		if '-' == args.script:
+			script = render.script_parse (sys.stdin, args.voice)
+		else:
+			with open (args.script, 'r', encoding = 'utf-8') as f:
+				script = render.script_parse (f, args.voice)
+	except (OSError, ValueError) as e:
+		holz.error (f'Could not read script: {e}')
+		return 13
+	if not script:
+		holz.error ('Script has no lines to render.')
+		return 13
+
+	started = time.monotonic ()
+	with tempfile.TemporaryDirectory (prefix = 'whistle-render-') as tmp:
+		r = _router_create (context, args, tmp)
+		try:
+			fmt, pcm = render.render (r, script
+				, gap = args.gap
+				, workers_per_voice = args.workers_per_voice
+				, max_workers = args.max_workers
+			)
+		except (LookupError, ValueError, RuntimeError) as e:
+			holz.error (f'Could not render script: {e}')
+			return 13
+		except KeyboardInterrupt:
+			holz.info ('Rendering interrupted.')
+			return 13
+		finally:
+			r.stop ()
 
-		payload = payload + '\n'
+	try:
+		if '-' == args.output:
+			sys.stdout.buffer.write (audio.wav_header (fmt, len (pcm)) + pcm)
+			sys.stdout.buffer.flush ()
+		else:
+			audio.wav_write (args.output, fmt, pcm)
+	except OSError as e:
+		holz.error (f'Could not write "{args.output}": {e}')
+		return 13
 
-		holz.info (f'Sending {len (payload)} bytes ...')
-		r = f.write (payload)
-		holz.info (f'{r} bytes sent.')
+	duration = len (pcm) / (fmt.sample_rate * fmt.frame_size)
+	holz.info (
+		f'Rendered {len (script)} lines ({duration:.1f}s of audio) '
+		f'in {time.monotonic () - started:.1f}s.'
+	)
+	return 0
+
+
+def run_fanout (context, args):
+	"""! Run command 'fanout'
+
+	Reads raw audio from a channel once and broadcasts it to several
+	sinks (FIFOs, files, Unix socket clients), each written from its own
+	position in a ring buffer.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	to_close = []
+	listeners = []
+	try:
+		source_fd, to_close = _open_serve_stream (args.source, False)
+		sinks, listeners = fanout.sinks_create (args.sinks)
+	except OSError as e:
+		holz.error (f'Could not set up fan-out: {e}')
+		for fd in to_close:
+			os.close (fd)
+		for listener in listeners:
+			listener.close ()
+		return 13
+
+	stop = threading.Event ()
+
+	def _on_terminate (signum, frame):
+		stop.set ()
+
+	previous = signal.signal (signal.SIGTERM, _on_terminate)
+	try:
+		n = fanout.fanout (source_fd, sinks, listeners
+			, buffer_size = args.buffer_size << 10
+			, frame_size = args.frame_size
+			, stop_event = stop
+		)
+		holz.info (f'Broadcast {n} bytes.')
+	except KeyboardInterrupt:
+		holz.info ('Fan-out interrupted.')
+	finally:
+		signal.signal (signal.SIGTERM, previous)
+		for s in sinks:
+			holz.info (f'"{s.name}": {s.written} written, {s.dropped} dropped.')
+			s.close ()
+		for listener in listeners:
+			path = listener.getsockname ()
+			listener.close ()
+			pathlib.Path (path).unlink (missing_ok = True)
+		for fd in to_close:
+			os.close (fd)
+
+	return 0
+
+
+def _installed_models (paths, selectors):
+	"""! Resolves selectors to installed models (all if none are given).
+	@return Returns a list of model maps (see db.query_installed), or None
+			if a selector matches no installed voice.
+	"""
+	if not selectors:
+		return db.model_list_installed (paths)
+
+	models = []
+	for selector in selectors:
+		try:
+			m = db.model_resolve_selector (paths, selector)
+		except ValueError:
+			m = {'path': None}
+		key = pathlib.Path (m['path']).stem if m['path'] else None
+		found = list (db.query_installed (paths
+			, predicate = lambda model: model['key'] == key
+			, limit = 1
+		))
+		if not found:
+			holz.error (f'No installed voice matches "{selector}".')
+			return None
+		models += found
+	return models
+
+
+def run_bench (context, args):
+	"""! Run command 'bench'
+
+	Runs a fixed corpus through piper for every installed voice (or the
+	ones selected) and reports load time, time to first audio, chars/s
+	and real-time factor. Real-time factors are taken into the db, for
+	voice selectors picking their quality automatically.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	if not _engine_check (args):
+		return 13
+	paths = context['paths']
+	models = _installed_models (paths, args.voice_selectors)
+	if models is None:
+		return 13
+	if not models:
+		holz.error ('No voices installed.')
+		return 13
+
+	corpus = bench.CORPUS
+	if args.corpus:
+		try:
+			with open (args.corpus, 'r') as f:
+				corpus = [line.strip () for line in f if line.strip ()]
+		except OSError as e:
+			holz.error (f'Could not read corpus: {e}')
+			return 13
+		if not corpus:
+			holz.error (f'Corpus "{args.corpus}" is empty.')
+			return 13
+
+	r = 0
+	results = []
+	for model in models:
+		holz.info (f'Benchmarking {model["key"]} ...')
+		try:
+			result = bench.voice_bench (args.piper, model, corpus
+				, repeat = max (1, args.repeat)
+				, extra_args = shlex.split (args.piper_args)
+				, timeout = args.timeout
+				, engine = args.engine
+				, engine_options = _engine_options (args)
+			)
+		except (RuntimeError, OSError, TimeoutError) as e:
+			holz.error (f'Could not benchmark {model["key"]}: {e}')
+			r = 13
+			continue
+		results.append (result)
+		if not args.no_record and result['rtf'] is not None:
+			db.perf_record (paths, result['key'], result['rtf']
+				, result['sentences']
+			)
+
+	with formats.RowWriter (formats.BufferedWriter (sys.stdout)
+		, args.format
+		, bench.COLUMNS
+	) as rw:
+		for result in results:
+			rw.row (result)
+
+	if args.output:
+		report = {
+			'host': bench.host_info (),
+			'piper': args.piper,
+			'piper_args': args.piper_args,
+			'engine': args.engine,
+			'engine_options': _engine_options (args),
+			'corpus': list (corpus),
+			'repeat': args.repeat,
+			'results': results
+		}
+		try:
+			with open (args.output, 'w') as f:
+				json.dump (report, f, indent = 4)
+		except OSError as e:
+			holz.error (f'Could not write report: {e}')
+			return 13
+
+	return r
+
+
+def run_warm (context, args):
+	"""! Run command 'warm'
+
+	Reads installed models (all, or the ones selected) into the page
+	cache. With --pin, models are copied to a tmpfs instead, and voice
+	selectors resolve to the copy from then on. --unpin removes copies.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	paths = context['paths']
+	models = _installed_models (paths, args.voice_selectors)
+	if models is None:
+		return 13
+	if not models:
+		holz.error ('No voices installed.')
+		return 13
+
+	r = 0
+	for model in models:
+		key = model['key']
+		try:
+			if args.unpin:
+				if warm.unpin (paths, key):
+					sys.stdout.write (f'{key}\tunpinned\n')
+				continue
+			if args.pin:
+				path = warm.pin (paths, model, args.pin_root)
+				size = sum (os.path.getsize (p) for p in warm.model_files (path))
+			else:
+				# Pinned copies are in memory already.
+				path = db.model_pinned_path (paths, key) or model['path']
+				size = sum (warm.prefetch (p) for p in warm.model_files (path))
+		except OSError as e:
+			holz.error (f'Could not warm {key}: {e}')
+			r = 13
+			continue
+		sys.stdout.write (f'{key}\t{size}\t{path}\n')
+
+	return r
+
+
+def _variants_produce (context, args, variant: str, produce):
+	"""! Produces a variant of installed models, as optimize and quantize do.
+	@param context Context information and whistle database.
+	@param args	Processed arguments, containing voice_selectors, force and
+				remove.
+	@param variant Name of the variant. (see db.VARIANTS)
+	@param produce Callable taking a model path, producing the variant.
+	@return Returns a touple of (return code, list of (model, variant path)).
+	"""
+	paths = context['paths']
+	models = _installed_models (paths, args.voice_selectors)
+	if models is None:
+		return 13, []
+	if not models:
+		holz.error ('No voices installed.')
+		return 13, []
+	if not args.remove and not optimize.available ():
+		holz.error (
+			f'Producing {variant} variants requires onnxruntime. '
+			f'(pip install piper_whistle[onnx])'
+		)
+		return 13, []
+
+	r = 0
+	produced = []
+	for model in models:
+		key = model['key']
+		if args.remove:
+			if optimize.variant_remove (model['path'], variant):
+				sys.stdout.write (f'{key}+{variant}\tremoved\n')
+			continue
+
+		path = db.model_variant_path (model['path'], variant)
+		if path and not args.force:
+			holz.info (f'{key}+{variant} is up to date.')
+		else:
+			holz.info (f'Producing {key}+{variant} ...')
+			try:
+				path = produce (model['path'])
+			except Exception as e:
+				holz.error (f'Could not produce {key}+{variant}: {e}')
+				r = 13
+				continue
+		produced.append ((model, path))
+
+	return r, produced
+
+
+def run_optimize (context, args):
+	"""! Run command 'optimize'
+
+	Optimises the graphs of installed models (all, or the ones selected)
+	with onnxruntime, once, so piper loads the optimised variant when
+	selected with --optimized. Up to date variants are kept, unless
+	--force is given. --remove deletes the optimised variants.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	r, produced = _variants_produce (context, args, db.OPTIMIZED_VARIANT
+		, lambda model_path: optimize.model_optimize (model_path, args.level)
+	)
+	for model, path in produced:
+		key = model['key']
+		sys.stdout.write (f'{key}\t{os.path.getsize (path)}\t{path}\n')
+	return r
+
+
+def run_quantize (context, args):
+	"""! Run command 'quantize'
+
+	Quantises the weights of installed models (all, or the ones selected)
+	to 8bit integers. The variant is selected by appending +int8 to the
+	quality of a selector (e.g. alba@medium+int8). Unless --no-compare is
+	given, variant and original are benchmarked and their audio compared,
+	and the comparison is recorded in the variant's provenance.
+
+	@param context Context information and whistle database.
+	@param args Processed arguments (prepared by argparse).
+	@return Returns 0 on success, otherwise > 0.
+	"""
+	variant = db.INT8_VARIANT
+	r, produced = _variants_produce (context, args, variant
+		, lambda model_path: optimize.model_quantize (model_path
+			, weight_type = args.weight_type
+			, per_channel = args.per_channel
+		)
+	)
+	if not produced:
+		return r
+	if args.no_compare:
+		for model, path in produced:
+			key = model['key']
+			sys.stdout.write (
+				f'{key}+{variant}\t{os.path.getsize (path)}\t{path}\n'
+			)
+		return r
+
+	rows = []
+	for model, path in produced:
+		key = model['key']
+		holz.info (f'Comparing {key}+{variant} with {key} ...')
+		variant_model = dict (model, key = f'{key}+{variant}', path = path)
+		try:
+			comparison = bench.voice_compare (args.piper, model, variant_model
+				, extra_args = shlex.split (args.piper_args)
+				, timeout = args.timeout
+			)
+		except (RuntimeError, OSError, TimeoutError) as e:
+			holz.error (f'Could not compare {key}+{variant}: {e}')
+			r = 13
+			continue
+		optimize.provenance_update (model['path'], variant
+			, comparison = comparison
+		)
+		rows += comparison
+
+	with formats.RowWriter (formats.BufferedWriter (sys.stdout)
+		, args.format
+		, bench.COMPARE_COLUMNS
+	) as rw:
+		for row in rows:
+			rw.row (row)
+
+	return r
+
+
+# Stable column sets of the machine readable list formats.
+LIST_COLUMNS = {
+	'languages': [
+		'code', 'family', 'region',
+		'name_native', 'name_english', 'country_english', 'voices'
+	],
+	'voices': [
+		'code', 'index', 'key', 'name', 'quality', 'selector',
+		'num_speakers', 'training', 'license', 'reference', 'dataset_url',
+		'model_url', 'model_size', 'model_md5'
+	],
+	'installed': [
+		'code', 'key', 'name', 'quality', 'selector', 'path',
+		'training', 'license', 'reference', 'dataset_url', 'model_url',
+		'variants'
+	],
+	'speakers': [
+		'code', 'index', 'key', 'selector', 'speaker_id', 'speaker_name'
+	]
+}
+
+
+def _legal_info (context, key):
+	"""! Fetches legal info of voice with given key (fields may be None)."""
+	legal = context['db'].get ('legal', None) or {}
+	lgl = legal.get (key, None) or {}
+	return {
+		'training': lgl.get ('training', None),
+		'license': lgl.get ('license', None),
+		'reference': lgl.get ('reference', None),
+		'dataset_url': lgl.get ('dataset-url', None)
+	}
+
+
+def _legal_text (lgl):
+	"""! Formats legal info as human readable text."""
+	return f"Voice[{lgl['training']}]: {lgl['license']}, " \
+		f"Reference: {lgl['reference']}, " \
+		f"Dataset: {lgl['dataset_url']}"
+
+
+def _model_url (context, key):
+	"""! Looks up remote model URL of voice with given key, or None."""
+	download_info = db.download_info_by_key (context, key)
+	if download_info and download_info['model']:
+		return download_info['model']['url']
+	return None
+
+
+def _list_voice_row (context, voice_i, voice, show_url = False):
+	"""! Builds row map of a catalog voice (see LIST_COLUMNS).
+	Model URL, size and digest are only looked up if show_url is set.
+	"""
+	row = {
+		'code': voice.code,
+		'index': voice_i,
+		'key': voice.key,
+		'name': voice.name,
+		'quality': voice.quality,
+		'selector': voice.selection_name,
+		'num_speakers': voice.num_speakers,
+		'model_url': None,
+		'model_size': None,
+		'model_md5': None
+	}
+	row.update (_legal_info (context, voice.key))
+	if not show_url:
+		return row
+	download_info = db.download_info_by_key (context, voice.key)
+	if download_info and download_info['model']:
+		row['model_url'] = download_info['model']['url']
+		row['model_size'] = download_info['model']['size']
+		row['model_md5'] = download_info['model']['md5']
+	return row
+
+
+def _run_list_rows (context, args, out, limit):
+	"""! Renders list views in one of the machine readable formats."""
+	if args.languages:
+		with formats.RowWriter (out, args.format, LIST_COLUMNS['languages']) as rw:
+			for lang in db.query_languages (context, limit = limit):
+				rw.row ({
+					'code': lang.code,
+					'family': lang.family,
+					'region': lang.region,
+					'name_native': lang.name_native,
+					'name_english': lang.name_english,
+					'country_english': lang.country_english,
+					'voices': len (lang.voices)
+				})
+		return 0
+
+	if args.installed:
+		with formats.RowWriter (out, args.format, LIST_COLUMNS['installed']) as rw:
+			for model in db.query_installed (context['paths'], limit = limit):
+				key = model['key']
+				row = {
+					'code': model['code'],
+					'key': key,
+					'name': model['name'],
+					'quality': model['quality'],
+					'selector':
+						f"{model['code']}:{model['name']}@{model['quality']}",
+					'path': model['path'],
+					'model_url':
+						_model_url (context, key) if args.show_url else None,
+					'variants': ','.join (db.model_variants (model['path']))
+				}
+				row.update (_legal_info (context, key))
+				rw.row (row)
+		return 0
+
+	code = None if args.all else args.language_code
+	if code and not context['db']['catalog'].language (code):
+		holz.error (f'Could not find language with code "{code}".')
+		return 13
+
+	if args.all or 0 > args.voice_index:
+		with formats.RowWriter (out, args.format, LIST_COLUMNS['voices']) as rw:
+			for voice_i, voice in db.query_voices (context, code, limit = limit):
+				rw.row (_list_voice_row (context, voice_i, voice, args.show_url))
+		return 0
+
+	voice_i = args.voice_index
+	voice = context['db']['catalog'].voice_at (code, voice_i)
+	if not voice:
+		holz.error (f'Could not find voice {voice_i} for "{code}".')
+		return 13
+
+	if args.omit_speakers:
+		with formats.RowWriter (out, args.format, LIST_COLUMNS['voices']) as rw:
+			rw.row (_list_voice_row (context, voice_i, voice, args.show_url))
+		return 0
+
+	with formats.RowWriter (out, args.format, LIST_COLUMNS['speakers']) as rw:
+		speakers = list (voice.speakers ())
+		if 0 == len (speakers):
+			speakers = [catalog.Speaker (None, 0)]
+		for speaker in speakers:
+			rw.row ({
+				'code': code,
+				'index': voice_i,
+				'key': voice.key,
+				'selector': voice.selection_name,
+				'speaker_id': speaker.id,
+				'speaker_name': speaker.name
+			})
 
 	return 0
 
@@ -182,122 +1297,101 @@ def run_list (context, args):
 	@param args Processed arguments (prepared by argparse).
 	@return Returns 0 on success, otherwise > 0.
 	"""
-	langdb = context['db']['languages']
+	limit = args.limit if -1 < args.limit else None
+	out = formats.BufferedWriter (sys.stdout)
+
+	if args.format in formats.MACHINE_FORMATS:
+		return _run_list_rows (context, args, out, limit)
 
 	if args.languages:
-		available_lang_codes = '\n'.join ([c for c in langdb])
-		sys.stdout.write (f'{available_lang_codes}')
+		with out:
+			for lang in db.query_languages (context, limit = limit):
+				out.write (f'{lang.code}\n')
 		return 0
 
 	if args.installed:
-		voice_i = 0
-		for model in db.model_list_installed (context['paths']):
-			code = model['code']
-			sys.stdout.write (
-				f"\t{code}:{model['name']}@{model['quality']}"
-			)
-			if args.verbose:
-				sys.stdout.write (f"\t{model['path']}")
-			if args.legal:
-				lgl = context['db']['legal'][model['name']]
-				a = f"Voice[{lgl['training']}]: {lgl['license']}, " \
-					f"Reference: {lgl['reference']}, " \
-					f"Dataset: {lgl['dataset-url']}"
-				sys.stdout.write (f"\t{a}")
-			if args.show_url:
-				download_info = db.assemble_download_info (context
-					, code
-					, voice_i
+		with out:
+			for model in db.query_installed (context['paths'], limit = limit):
+				key = model['key']
+				out.write (
+					f"\t{model['code']}:{model['name']}@{model['quality']}"
 				)
-				sys.stdout.write (f"\t{download_info['model']['url']}")
-			sys.stdout.write ("\n")
-			voice_i += 1
+				if args.verbose:
+					out.write (f"\t{model['path']}")
+				if args.legal:
+					out.write (f"\t{_legal_text (_legal_info (context, key))}")
+				if args.show_url:
+					out.write (f"\t{_model_url (context, key)}")
+				out.write ("\n")
+				for variant in db.model_variants (model['path']):
+					out.write (
+						f"\t{model['code']}:{model['name']}@{model['quality']}"
+						f"+{variant}\n"
+					)
 
 		return 0
 
 	if args.all:
-		for code in langdb:
-			lang = langdb[code]
-
-			sys.stdout.write (f'Voices for "{code}":\n')
-			voice_i = 0
-			for voice_name in lang['voices']:
-				details = voice_name
+		with out:
+			last_code = None
+			for voice_i, voice in db.query_voices (context, limit = limit):
+				code = voice.code
+				if code != last_code:
+					out.write (f'Voices for "{code}":\n')
+					last_code = code
+
+				details = voice.key
 				if args.legal:
-					lgl = context['db']['legal'][voice_name]
-					a = f"Voice[{lgl['training']}]: {lgl['license']}, " \
-						f"Reference: {lgl['reference']}, " \
-						f"Dataset: {lgl['dataset-url']}"
+					a = _legal_text (_legal_info (context, voice.key))
 					details = f"{details}\t({a})"
 				if args.show_url:
-					download_info = db.assemble_download_info (context
-						, code
-						, voice_i
-					)
-					details = f"{a}\t{download_info['model']['url']}"
-				sys.stdout.write (f"\t{voice_i}: {details}\n")
-
-				voice_i = voice_i + 1
+					details = f"{details}\t{_model_url (context, voice.key)}"
+				out.write (f"\t{voice_i}: {details}\n")
 
 		return 0
 
 	code = args.language_code
-	if code not in langdb:
+	lang = context['db']['catalog'].language (code)
+	if not lang:
 		holz.error (f'Could not find language with code "{code}".')
 		return 13
 
-	lang = langdb[code]
 	voice_i = args.voice_index
-	index = context['db']['index']
 
 	if -1 < voice_i:
-		voice_name = lang['voices'][voice_i]
-
-		sys.stdout.write (f'{voice_name}\t{voice_i}')
-		if args.legal:
-			lgl = context['db']['legal'][voice_name]
-			a = f"Voice[{lgl['training']}]: {lgl['license']}, "\
-				f"Reference: {lgl['reference']}, " \
-				f"Dataset: {lgl['dataset-url']}"
-			sys.stdout.write (f'\t{a}')
-		if args.show_url:
-			download_info = db.assemble_download_info (context
-				, code
-				, voice_i
-			)
-			sys.stdout.write (f"\t{download_info['model']['url']}")
-
-		sys.stdout.write ('\n')
-
-		if not args.omit_speakers:
-			speakers = index[voice_name]['speaker_id_map']
+		voice = context['db']['catalog'].voice_at (code, voice_i)
+		if not voice:
+			holz.error (f'Could not find voice {voice_i} for "{code}".')
+			return 13
 
-			sys.stdout.write (f'Speakers:\n')
-			if 0 == len (speakers):
-				sys.stdout.write (f'\t\t0 (no-name)')
-			else:
-				for speaker_id in speakers:
-					sys.stdout.write (f'\t\t{speakers[speaker_id]:3} ({speaker_id})')
-	else:
-		sys.stdout.write (f'Available voices ({code}):\n')
-		voice_i = 0
-		for voice_name in lang['voices']:
-			sys.stdout.write (f"\t{voice_i}: {voice_name}")
+		with out:
+			out.write (f'{voice.key}\t{voice_i}')
 			if args.legal:
-				lgl = context['db']['legal'][voice_name]
-				a = f"Voice[{lgl['training']}]: {lgl['license']}, " \
-					f"Reference: {lgl['reference']}, " \
-					f"Dataset: {lgl['dataset-url']}"
-				sys.stdout.write (f'\t{a}')
+				out.write (f'\t{_legal_text (_legal_info (context, voice.key))}')
 			if args.show_url:
-				download_info = db.assemble_download_info (context
-					, code
-					, voice_i
-				)
-				sys.stdout.write (f"\t{download_info['model']['url']}")
-			sys.stdout.write ('\n')
+				out.write (f"\t{_model_url (context, voice.key)}")
+
+			out.write ('\n')
 
-			voice_i += 1
+			if not args.omit_speakers:
+				speakers = list (voice.speakers ())
+
+				out.write (f'Speakers:\n')
+				if 0 == len (speakers):
+					out.write (f'\t\t0 (no-name)')
+				else:
+					for speaker in speakers:
+						out.write (f'\t\t{speaker.id:3} ({speaker.name})')
+	else:
+		with out:
+			out.write (f'Available voices ({code}):\n')
+			for voice_i, voice in db.query_voices (context, code, limit = limit):
+				out.write (f"\t{voice_i}: {voice.key}")
+				if args.legal:
+					out.write (f'\t{_legal_text (_legal_info (context, voice.key))}')
+				if args.show_url:
+					out.write (f"\t{_model_url (context, voice.key)}")
+				out.write ('\n')
 
 	return 0
 
@@ -458,19 +1552,24 @@ def run_remove (context, args):
 	@param args Processed arguments (prepared by argparse).
 	@return Returns 0 on success, otherwise > 0.
 	"""
-	selector = args.voice_selector
-
-	code = None
-	if ':' in selector:
-		code, selector = selector.split (':')
-
-	name, quality, speaker = _parse_voice_selector (selector)
+	model_info = db.selector_parse (args.voice_selector)
+	name = model_info['name']
+	quality = model_info['quality']
+	variant = model_info['variant']
+	installed = db.model_resolve_path (context['paths']
+		, dict (model_info, variant = None)
+		, pinned = False
+	)
+	if variant:
+		# Only the variant goes, the voice (and its pin) stays.
+		if not installed or not optimize.variant_remove (installed, variant):
+			holz.error (f'Could not remove "{name}@{quality}+{variant}"!')
+			return 13
+		sys.stdout.write (f'Removed "{name}@{quality}+{variant}".\n')
+		return 0
 
-	model_info = {
-		'name': name,
-		'quality': quality,
-		'speaker': speaker
-	}
+	if installed:
+		warm.unpin (context['paths'], pathlib.Path (installed).stem)
 	did_remove = db.model_remove (context['paths'], model_info)
 	if not did_remove:
 		holz.error (f'Could not remove "{name}@{quality}"!')
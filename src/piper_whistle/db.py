@@ -25,10 +25,13 @@ URL:
 
 """
 # 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
 import sys
 import json
+import itertools
 import userpaths
 import time
+import shutil
 import pathlib
 import tempfile
 # Append root package to path so it can be called with absolute path.
@@ -37,6 +40,22 @@ sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
 from piper_whistle import holz
 from piper_whistle import util
 from piper_whistle import search
+from piper_whistle import catalog
+
+
+# Voice qualities, fastest first.
+QUALITIES = ('x_low', 'low', 'medium', 'high')
+# Quality of selectors picking the quality by performance.
+AUTO_QUALITY = 'auto'
+# Real-time factor budget of automatic quality selection.
+DEFAULT_RTF_BUDGET = 0.5
+# Number of samples real-time factors are (roughly) averaged over.
+PERF_HISTORY = 20
+# Variants of installed models. Each is stored in a directory of its
+# name, inside the voice's directory.
+OPTIMIZED_VARIANT = 'optimized'
+INT8_VARIANT = 'int8'
+VARIANTS = (OPTIMIZED_VARIANT, INT8_VARIANT)
 
 
 def data_paths (appdata_root_path = userpaths.get_appdata ()):
@@ -47,8 +66,14 @@ def data_paths (appdata_root_path = userpaths.get_appdata ()):
 	* data: Root path of whistle data.
 	* voices: Storage path for voice data.
 	* index: Language details cached from huggingface repository (JSON).
-	* languages: 	Language data lookup (JSON), built from index.
-					Uses language code as keys.
+	* downloads: 	Download table (JSON), built from index.
+					Uses voice keys as keys.
+	* spool: Storage path for payloads waiting for a channel reader.
+	* cache: Storage path for synthesised audio.
+	* perf: Real-time factors measured on this machine (JSON).
+			Uses voice keys as keys.
+	* pins: Copies of models pinned in memory (JSON).
+			Uses voice keys as keys.
 	* last-updated: 	A flat file containig the timestamp when whistle data
 						was refreshed last.
 
@@ -63,7 +88,11 @@ def data_paths (appdata_root_path = userpaths.get_appdata ()):
 		'repo': whistle_data_path.joinpath ('repo.json').as_posix (),
 		'voices': whistle_data_path.joinpath ('voices').as_posix (),
 		'index': whistle_data_path.joinpath ('index.json').as_posix (),
-		'languages': whistle_data_path.joinpath ('languages.json').as_posix (),
+		'downloads': whistle_data_path.joinpath ('downloads.json').as_posix (),
+		'spool': whistle_data_path.joinpath ('spool').as_posix (),
+		'cache': whistle_data_path.joinpath ('cache').as_posix (),
+		'perf': whistle_data_path.joinpath ('perf.json').as_posix (),
+		'pins': whistle_data_path.joinpath ('pins.json').as_posix (),
 		'last-updated': whistle_data_path.joinpath ('last-updated').as_posix ()
 	}
 
@@ -136,6 +165,112 @@ def remote_repo_build_index_url (repo_info):
 	return index_url
 
 
+def _download_entry_build (voice, base_url):
+	"""! Compiles download information for a single catalog voice.
+	@param voice Voice record. See catalog.Voice.
+	@param base_url Repository root URL, including the branch.
+	@return Returns a download information map.
+	"""
+	code = voice.code
+	download_info = {
+		'langugage': code,
+		'model': None,
+		'config': None,
+		'card': None,
+		'samples': [],
+		'local_path_relative': f'{code}/{voice.key}',
+		'selection_name': voice.selection_name
+	}
+
+	# Identify onnx speech model files.
+	for file in voice.files:
+		kind = file.kind
+		if kind in download_info:
+			download_info[kind] = {
+				'url': f'{base_url}/{file.path}',
+				'size': file.size,
+				'md5': file.md5
+			}
+
+	# Get voice URL where path is one layer up (omitting model name).
+	voice_base_url = util.url_path_cut (download_info['model']['url'], 1)
+
+	def build_sample_url (base, speaker_name, speaker_id, ext = 'mp3'):
+		return f'{base}/samples/{speaker_name}_{speaker_id}.{ext}'
+
+	# samples are based on speakers.
+	# there is always a speaker 0 by default.
+	if 1 >= voice.num_speakers:
+		speaker_url = build_sample_url (voice_base_url, 'speaker', 0)
+		download_info['samples'].append (speaker_url)
+	else:
+		for speaker in voice.speakers ():
+			speaker_url = build_sample_url (
+				voice_base_url, 'speaker', speaker.id
+			)
+			download_info['samples'].append (speaker_url)
+
+	return download_info
+
+
+def download_table_build (voice_catalog, repo_info):
+	"""! Precomputes download information for every voice of the catalog.
+
+	The table is built on refresh and stored at the "downloads" data path,
+	so listing and installing voices can look up URLs, sizes and digests
+	directly. See @ref "assemble_download_info ()" for the entry layout.
+
+	@param voice_catalog Voice catalog. See catalog.catalog_build.
+	@param repo_info	Remote repo information map.
+						Can be obtained via @ref "remote_repo_config ()".
+	@return Returns a map of voice keys to download information.
+	"""
+	# For example: "https://huggingface.co/rhasspy/piper-voices/resolve/main"
+	base_url = remote_repo_build_branch_root (repo_info)
+
+	table = {}
+	for key, voice in voice_catalog.voices.items ():
+		table[key] = _download_entry_build (voice, base_url)
+
+	return table
+
+
+def download_table (context):
+	"""! Fetches the download table, loading it on first use.
+
+	Only listing URLs and installing voices need the table, so it is not
+	loaded along with the context. Data roots refreshed by earlier versions
+	have no table stored, so it is built in memory from the catalog.
+
+	@param context Context information and whistle database.
+	@return Returns a map of voice keys to download information.
+	"""
+	if context['db'].get ('downloads', None) is not None:
+		return context['db']['downloads']
+
+	table = {}
+	p_downloads = pathlib.Path (context['paths']['downloads'])
+	if p_downloads.exists ():
+		with open (p_downloads, 'r') as f:
+			table = json.load (f)
+	elif context['db']['catalog']:
+		holz.info ('No download table found. Building it in memory ...')
+		table = download_table_build (context['db']['catalog'], context['repo'])
+	context['db']['downloads'] = table
+
+	return table
+
+
+def download_info_by_key (context, key):
+	"""! Looks up download details of a voice by its key.
+	@param context Context information and whistle database.
+	@param key Voice key (e.g. de_DE-eva_k-x_low).
+	@return	Returns a map containing download information,
+			or None if voice is unknown.
+	"""
+	return download_table (context).get (key, None)
+
+
 def assemble_download_info (context, code, voice_i):
 	"""! Compile details used to download voice data.
 
@@ -152,6 +287,11 @@ def assemble_download_info (context, code, voice_i):
 			'size': 777,
 			'md5': some md5 hash
 		},
+		'card': {
+			'url': "https://...",
+			'size': 777,
+			'md5': some md5 hash
+		},
 		'samples': [
 			list of URLs to a sample voice reading for each speaker
 		],
@@ -159,91 +299,30 @@ def assemble_download_info (context, code, voice_i):
 		'selection_name': selector name,
 	}
 
+	Details are read from the download table precomputed on refresh.
+	See @ref "download_table_build ()".
+
 	@param context Context information and whistle database.
 	@param code Language code of voice to be downloaded.
 	@param voice_i Voice index to be downloaded.
 	@return Returns a map containing download information.
 	"""
-	index = context['db']['index']
-	langdb = context['db']['languages']
-	# For example: "https://huggingface.co/rhasspy/piper-voices/resolve/main"
-	base_url = remote_repo_build_branch_root (context['repo'])
+	voice_catalog = context['db']['catalog']
 
 	# Check if given code is available and collect meta info for later
 	# download and storage.
-	if code in langdb:
-		lang = langdb[code]
-		voices = lang["voices"]
-		# Select specific voice by index.
-		if -1 < voice_i and voice_i < len (voices):
-			voice_name = voices[voice_i]
-			holz.info (f'Requesting "{voice_name}" ...')
-			voice_details = index[voice_name]
-
-			selection_name = \
-				f"{code}:{voice_details['name']}" \
-				f"@{voice_details['quality']}"
-			download_info = {
-				'langugage': code,
-				'model': None,
-				'config': None,
-				'card': None,
-				'samples': [],
-				'local_path_relative': f'{code}/{voice_name}',
-				'selection_name': selection_name
-			}
-
-			# Identify onnx speech model files.
-			for file in voice_details['files']:
-				if file.endswith ('.onnx'):
-					download_info['model'] = {
-						'url': f'{base_url}/{file}',
-						'size': voice_details['files'][file]['size_bytes'],
-						'md5': voice_details['files'][file]['md5_digest']
-					}
-				elif file.endswith ('.onnx.json'):
-					download_info['config'] = {
-						'url': f'{base_url}/{file}',
-						'size': voice_details['files'][file]['size_bytes'],
-						'md5': voice_details['files'][file]['md5_digest']
-					}
-				elif file.endswith ('MODEL_CARD'):
-					download_info['card'] = {
-						'url': f'{base_url}/{file}',
-						'size': voice_details['files'][file]['size_bytes'],
-						'md5': voice_details['files'][file]['md5_digest']
-					}
-
-			# Get voice URL where path is one layer up (omitting model name).
-			voice_base_url = util.url_path_cut (
-				download_info['model']['url'], 1
-			)
-
-			def build_sample_url (base, speaker_name, speaker_id, ext = 'mp3'):
-				return f'{base}/samples/{speaker_name}_{speaker_id}.{ext}'
-
-			# samples are based on speakers.
-			# there is always a speaker 0 by default.
-			if 1 >= int (voice_details['num_speakers']):
-				speaker_url = build_sample_url (voice_base_url, 'speaker', 0)
-				download_info['samples'].append (speaker_url)
-			else:
-				for speaker_name in voice_details['speaker_id_map']:
-					speaker_id = int (
-						voice_details['speaker_id_map'][speaker_name]
-					)
-					speaker_url = build_sample_url (
-						voice_base_url, 'speaker', speaker_id
-					)
-					download_info['samples'].append (speaker_url)
-
-			return download_info
-		else:
-			holz.error (f'Invalid voice index!')
-	else:
+	if not voice_catalog.language (code):
 		holz.error (f'Cannot recognize: "{code}"')
+		return None
 
-	return None
+	# Select specific voice by index.
+	voice = voice_catalog.voice_at (code, voice_i)
+	if not voice:
+		holz.error (f'Invalid voice index!')
+		return None
+
+	holz.info (f'Requesting "{voice.key}" ...')
+	return download_info_by_key (context, voice.key)
 
 
 def _fetch_url_raw (url, as_binary = False):
@@ -378,18 +457,11 @@ def index_download_and_rebuild (paths, repo_info):
 	with open (paths['index'], 'w') as f:
 		json.dump (index, f, indent = 4)
 
-	holz.info ('Rebuilding language database ...')
-	langdb = {}
-	holz.debug (f'Processing {len (index)} voices for lookup ...')
-	for voice in index:
-		voice_lang = index[voice]['language']
-		if not (voice_lang['code'] in langdb):
-			langdb[voice_lang['code']] = voice_lang
-			langdb[voice_lang['code']]['voices'] = []
-		langdb[voice_lang['code']]['voices'].append (index[voice]['key'])
-
-	with open (paths['languages'], 'w') as f:
-		json.dump (langdb, f, indent = 4)
+	holz.info ('Precomputing download table ...')
+	voice_catalog = catalog.catalog_build (index)
+	downloads = download_table_build (voice_catalog, repo_info)
+	with open (paths['downloads'], 'w') as f:
+		json.dump (downloads, f, indent = 4)
 
 	holz.info ('Updating timestamp ...')
 	last_update = time.time ()
@@ -402,24 +474,15 @@ def index_download_and_rebuild (paths, repo_info):
 	legal = {}
 	if True:
 		holz.debug ('Building legal information lookup ...')
-		base_url = remote_repo_build_branch_root (repo_info)
 
-		holz.debug (f'Processing {len (langdb)} languages ...')
-		for code in langdb:
-			holz.info (f'Processing {langdb[code]["voices"]} languages for "{code}":')
+		languages = voice_catalog.languages
+		holz.debug (f'Processing {len (languages)} languages ...')
+		for code in languages:
+			holz.info (f'Processing {languages[code].voices} languages for "{code}":')
 			voice_i = 0
-			for voice_name in langdb[code]['voices']:
+			for voice_name in languages[code].voices:
 				holz.info (f"\tFetching model card for {voice_i}: {voice_name}")
-				dl_info = None
-				voice_details = index[voice_name]
-				# Identify onnx speech model files.
-				for file in voice_details['files']:
-					if file.endswith ('MODEL_CARD'):
-						dl_info = {
-							'url': f'{base_url}/{file}',
-							'size': voice_details['files'][file]['size_bytes'],
-							'md5': voice_details['files'][file]['md5_digest']
-						}
+				dl_info = downloads[voice_name]['card']
 
 				model_card_text = _fetch_url_raw (dl_info['url'])
 				card = _parse_model_card (model_card_text)
@@ -451,12 +514,8 @@ def _context_is_valid (context):
 	db_ok = (
 		'db' in context
 		and (
-			'index' in context['db']
-			and isinstance (context['db']['index'], dict)
-		)
-		and (
-			'languages' in context['db']
-			and isinstance (context['db']['languages'], dict)
+			'catalog' in context['db']
+			and isinstance (context['db']['catalog'], catalog.Catalog)
 		)
 	)
 	if not db_ok:
@@ -473,14 +532,18 @@ def _context_is_valid (context):
 def context_create (paths, repo_info):
 	"""! Creates context map object.
 
-	Loads and parses whistle JSON databases (raw index and language lookup).
+	Loads and parses the whistle JSON index and builds the voice catalog
+	from it. The raw index is dropped after the catalog has been built.
 
 	Returs a map containing:
 
 	* paths: Data paths. See @ref "data_paths ()".
 	* db: Voice and languages information. Contains following keys:
-		* index: Voice index fetched from huggingface repository.
-		* language: Generated language lookup to select voices by language code.
+		* catalog: Voice and language records (see catalog.Catalog),
+			built from the index fetched from huggingface repository.
+		* downloads: Download table, loaded on first use.
+			See @ref "download_table ()".
+		* legal: Legal information lookup, parsed from model cards.
 	* repo: Repo config. See @ref "remote_repo_config ()".
 
 	@param paths Paths map. Can be obtained via @ref "data_paths ()".
@@ -490,8 +553,8 @@ def context_create (paths, repo_info):
 	@return Returns voice and language lookups.
 	"""
 	db = {
-		'index': None,
-		'languages': None
+		'catalog': None,
+		'downloads': None
 	}
 
 	p_index = pathlib.Path (paths['index'])
@@ -499,14 +562,7 @@ def context_create (paths, repo_info):
 		holz.error ('No database index found!')
 	else:
 		with open (p_index, 'r') as f:
-			db['index'] = json.load (f)
-
-	p_languages = pathlib.Path (paths['languages'])
-	if not p_languages.exists ():
-		holz.error ('No language lookup found!')
-	else:
-		with open (p_languages, 'r') as f:
-			db['languages'] = json.load (f)
+			db['catalog'] = catalog.catalog_build (json.load (f))
 
 	lgl_path = pathlib.Path (paths['data'])
 	lgl_path = lgl_path.joinpath ('legal.json')
@@ -543,28 +599,29 @@ def context_guess_language_from_name (context, needle):
 	@return	Returns the corresponding country code,
 			or None if no match could be found.
 	"""
-	langdb = context['db']['languages']
+	languages = context['db']['catalog'].languages
 	matching_code = None
 
-	for lang_code in langdb:
+	for lang_code in languages:
+		lang = languages[lang_code]
 		matched, c = search.looks_like (needle, lang_code, 0.91, False)
 		if matched:
 			holz.info (f'{needle} ~ {lang_code}')
 			matching_code = lang_code
 			break
-		lang_name_native = langdb[lang_code]['name_native']
+		lang_name_native = lang.name_native
 		matched, c = search.looks_like (needle, lang_name_native, 0.8)
 		if matched:
 			holz.info (f'{needle} ~ {lang_name_native} (native)')
 			matching_code = lang_code
 			break
-		lang_name_en = langdb[lang_code]['name_english']
+		lang_name_en = lang.name_english
 		matched, c = search.looks_like (needle, lang_name_en, 0.8)
 		if matched:
 			holz.info (f'{needle} ~ {lang_name_en} (english)')
 			matching_code = lang_code
 			break
-		lang_country = langdb[lang_code]['country_english']
+		lang_country = lang.country_english
 		matched, c = search.looks_like (needle, lang_country, 0.7)
 		if matched:
 			matching_code = lang_code
@@ -576,47 +633,222 @@ def context_guess_language_from_name (context, needle):
 	return matching_code
 
 
+def _take (iterable, limit = None):
+	"""! Lazily limits given iterable to at most limit elements.
+	@param iterable Any iterable.
+	@param limit Maximum number of elements to yield. None yields all.
+	@return Returns an iterator over the (limited) elements.
+	"""
+	if limit is None:
+		return iter (iterable)
+	return itertools.islice (iterable, max (0, int (limit)))
+
+
+def query_languages (context, predicate = None, limit = None):
+	"""! Lazily yields languages of the catalog.
+
+	@param context	Context map containig whistle catalog.
+					Can be created via @ref "context_create ()".
+	@param predicate	Optional callable taking a catalog.Language and
+						returning True if it should be yielded.
+	@param limit Maximum number of languages to yield. (default all)
+
+	@return Returns a generator of catalog.Language objects.
+	"""
+	languages = context['db']['catalog'].languages.values ()
+	if predicate:
+		languages = filter (predicate, languages)
+	yield from _take (languages, limit)
+
+
+def query_voices (context, code = None, predicate = None, limit = None):
+	"""! Lazily yields voices of the catalog, grouped by language.
+
+	Every voice is yielded together with its index within its language,
+	which is the index used when installing or previewing a voice.
+
+	@param context	Context map containig whistle catalog.
+					Can be created via @ref "context_create ()".
+	@param code	Only yield voices of this language code. (default all)
+	@param predicate	Optional callable taking a catalog.Voice and
+						returning True if it should be yielded.
+	@param limit Maximum number of voices to yield. (default all)
+
+	@return Returns a generator of (voice_index, catalog.Voice) touples.
+	"""
+	voice_catalog = context['db']['catalog']
+
+	def _walk ():
+		if code is None:
+			languages = voice_catalog.languages.values ()
+		else:
+			lang = voice_catalog.language (code)
+			languages = [lang] if lang else []
+		for lang in languages:
+			for voice_i, key in enumerate (lang.voices):
+				voice = voice_catalog.voices[key]
+				if predicate and not predicate (voice):
+					continue
+				yield voice_i, voice
+
+	yield from _take (_walk (), limit)
+
+
+def query_installed (paths, predicate = None, limit = None):
+	"""! Lazily yields models installed in the piper-whistle cache.
+
+	Walks the voice storage path and yields a map per model with the
+	following keys:
+
+	* key: Voice key. (e.g. en_GB-alba-medium)
+	* name: Clean voice name.
+	* quality: Voice quality.
+	* code: Language / Country code. (e.g. en_GB)
+	* path: The absolute path to the onnx model.
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@param predicate	Optional callable taking a model map and
+						returning True if it should be yielded.
+	@param limit Maximum number of models to yield. (default all)
+
+	@return Returns a generator of installed model maps.
+	"""
+	def _walk ():
+		p = pathlib.Path (paths['voices'])
+		if not p.exists ():
+			return
+		for lang_dir in p.iterdir ():
+			code = lang_dir.name
+			for voice_dir in lang_dir.iterdir ():
+				onnx_file_path = voice_dir.joinpath (f'{voice_dir.name}.onnx')
+				if not onnx_file_path.exists ():
+					continue
+
+				# name has language code prepended. remove.
+				rest = voice_dir.name.replace (f'{code}-', '')
+				# now split off quality
+				voice_name, voice_quality = rest.split ('-')
+				model = {
+					'key': voice_dir.name,
+					'name': voice_name,
+					'quality': voice_quality,
+					'code': code,
+					'path': onnx_file_path.as_posix ()
+				}
+				if predicate and not predicate (model):
+					continue
+				yield model
+
+	yield from _take (_walk (), limit)
+
+
 def model_list_installed (paths):
 	"""! Searches piper-whistle cache for all models installed.
 
 	Checks the user cache path (i.e. ~/.config/piper-whistle on *nix)
+	See @ref "query_installed ()" for the keys of the model maps and
+	a lazy variant.
 
-	The returned list contains map object with the following keys:
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
 
-	' name: Clean voice name.
-	' quality: Voice quality.
-	' code: Language / Country code. (e.g. en_GB)
-	' path: The absolute path to the onnx model.
+	@return Returns a list containing all installed models.
+	"""
+	return list (query_installed (paths))
 
-	@param context	Context map containig whistle index and language info.
-					Can be created via @ref "context_create ()".
 
-	@return Returns a list containing all installed models.
+def pins_load (paths):
+	"""! Loads the map of pinned models.
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@return Returns a map of voice keys to the path of their pinned copy.
 	"""
-	models = []
-	p = pathlib.Path (paths['voices'])
-	for lang_dir in p.iterdir ():
-		code = lang_dir.name
-		for voice_dir in lang_dir.iterdir ():
-			onnx_file_path = voice_dir.joinpath (f'{voice_dir.name}.onnx')
-			if not onnx_file_path.exists ():
-				continue
-
-			# name has language code prepended. remove.
-			rest = voice_dir.name.replace (f'{code}-', '')
-			# now split off quality
-			voice_name, voice_quality = rest.split ('-')
-			models.append ({
-				'name': voice_name,
-				'quality': voice_quality,
-				'code': code,
-				'path': onnx_file_path.as_posix ()
-			})
+	try:
+		with open (paths['pins'], 'r') as f:
+			return json.load (f)
+	except (OSError, ValueError):
+		return {}
+
+
+def pins_save (paths, pins: dict):
+	"""! Stores the map of pinned models. See @ref "pins_load ()"."""
+	p = pathlib.Path (paths['pins'])
+	p.parent.mkdir (parents = True, exist_ok = True)
+	tmp = p.with_suffix (f'.{os.getpid ()}.tmp')
+	with open (tmp, 'w') as f:
+		json.dump (pins, f, indent = 4)
+	os.replace (tmp, p)
+
+
+def model_pinned_path (paths, key: str):
+	"""! Looks up the pinned copy of a model.
+
+	Pinned copies live in memory (tmpfs) and vanish with a reboot, in
+	which case the installed model is used again.
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@param key Voice key. (e.g. en_GB-alba-medium)
+	@return Returns the path of the pinned copy, or None.
+	"""
+	pinned = pins_load (paths).get (key, None)
+	if pinned and pathlib.Path (pinned).exists ():
+		return pinned
+	return None
+
+
+def model_variant_dir (model_path: str, variant: str):
+	"""! Directory holding a variant of an installed model.
 
-	return models
+	Next to the variant's model (named ${KEY}+${VARIANT}.onnx) and its
+	config, it holds provenance.json, describing how the variant was
+	derived from which source model.
+
+	@param model_path Path to the installed onnx model.
+	@param variant Name of the variant. (see VARIANTS)
+	@return Returns the path of the directory.
+	"""
+	return pathlib.Path (model_path).parent.joinpath (variant).as_posix ()
+
+
+def model_variant_path (model_path: str, variant: str):
+	"""! Looks up a variant of an installed model.
+
+	Variants are only used while their source model is unchanged (same
+	size and modification time as recorded in their provenance).
+
+	@param model_path Path to the installed onnx model.
+	@param variant Name of the variant. (see VARIANTS)
+	@return Returns the path of the variant's model, or None.
+	"""
+	d = pathlib.Path (model_variant_dir (model_path, variant))
+	p = pathlib.Path (model_path)
+	variant_path = d.joinpath (f'{p.stem}+{variant}{p.suffix}')
+	try:
+		with open (d.joinpath ('provenance.json'), 'r') as f:
+			provenance = json.load (f)
+		st = os.stat (model_path)
+	except (OSError, ValueError):
+		return None
+	if not variant_path.exists ():
+		return None
+	source = provenance.get ('source', {})
+	stat = (source.get ('size', None), source.get ('mtime_ns', None))
+	if (st.st_size, st.st_mtime_ns) != stat:
+		holz.warn (f'Variant {variant} of "{model_path}" is outdated.')
+		return None
+	return variant_path.as_posix ()
 
 
-def model_resolve_path (paths, model_info):
+def model_variants (model_path: str):
+	"""! Lists the (up to date) variants of an installed model.
+	@param model_path Path to the installed onnx model.
+	@return Returns a list of variant names.
+	"""
+	return [v for v in VARIANTS if model_variant_path (model_path, v)]
+
+
+def model_resolve_path (paths, model_info
+	, pinned: bool = True
+	, optimized: bool = False
+):
 	"""! Searches piper-whistle cache for a model corresponding to given specs.
 
 	Checks the user cache path (i.e. ~/.config/piper-whistle on *nix)
@@ -631,6 +863,12 @@ def model_resolve_path (paths, model_info):
 
 	@param paths Paths map. Can be obtained via @ref "data_paths ()".
 	@param model_info Map containing name, quality and speaker.
+	@param pinned	Prefer the pinned copy of the model, if there is one.
+					(see @ref "model_pinned_path ()")
+	@param optimized	Prefer the optimised variant of the model, if there
+						is one. (see @ref "model_variant_path ()")
+
+	If model_info names a variant, only that variant is returned.
 
 	@return Returns the path to the model, or None if nothing is found.
 	"""
@@ -638,29 +876,207 @@ def model_resolve_path (paths, model_info):
 	quality = model_info['quality']
 	# TODO: constraint speaker = model_info['speaker']
 
-	voice_file_path = None
-	p = pathlib.Path (paths['voices'])
-	for lang_dir in p.iterdir ():
-		code = lang_dir.name
-		for voice_dir in lang_dir.iterdir ():
-			# name has language code prepended. remove.
-			rest = voice_dir.name.replace (f'{code}-', '')
-			# now split off quality
-			voice_name, voice_quality = rest.split ('-')
-			if voice_name == name and voice_quality == quality:
-				filename = f'{voice_dir.name}.onnx'
-				voice_file_path = voice_dir.joinpath (filename).as_posix ()
-				break
+	def _matches (model):
+		return model['name'] == name and model['quality'] == quality
+
+	for model in query_installed (paths, predicate = _matches, limit = 1):
+		variant = model_info.get ('variant', None)
+		if variant:
+			return model_variant_path (model['path'], variant)
+		if optimized:
+			optimized_path = model_variant_path (model['path'], OPTIMIZED_VARIANT)
+			if optimized_path:
+				return optimized_path
+		if pinned:
+			return model_pinned_path (paths, model['key']) or model['path']
+		return model['path']
+
+	return None
+
+
+def selector_parse (selector: str):
+	"""! Splits a voice selector into its parts.
+
+	Accepts ${NAME}@${QUALITY}[/${SPEAKER}], optionally prefixed with the
+	language code (${CODE}:), or a voice key (${CODE}-${NAME}-${QUALITY}).
+	Variants of a model (see VARIANTS) are selected by appending their
+	name to the quality (e.g. alba@medium+int8).
+
+	@param selector Voice identifying string.
+	@return Returns a map containing code, name, quality, variant and
+			speaker. code and variant are None if not given, speaker
+			defaults to 0.
+	"""
+	code = None
+	if ':' in selector:
+		code, selector = selector.split (':')
+
+	speaker = 0
+	if '-' in selector:
+		code, name, quality = selector.split ('-')
+	else:
+		name, rest = selector.split ('@')
+		if '/' in rest:
+			quality, speaker = rest.split ('/')
+		else:
+			quality = rest
+
+	variant = None
+	if '+' in quality:
+		quality, variant = quality.split ('+')
+
+	return {
+		'code': code,
+		'name': name,
+		'quality': quality,
+		'variant': variant,
+		'speaker': speaker
+	}
+
+
+def model_resolve_selector (paths, selector: str, optimized: bool = False):
+	"""! Resolves a voice selector to an installed model.
+
+	The quality "auto" (e.g. alba@auto) picks the best quality installed,
+	which meets the real-time factor budget. See @ref "quality_auto ()".
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@param selector Voice identifying string. See @ref "selector_parse ()".
+	@param optimized Prefer the optimised variant of the model.
+	@return Returns the map of @ref "selector_parse ()", with an additional
+			path key holding the model path (None if not installed).
+	"""
+	model_info = selector_parse (selector)
+	if AUTO_QUALITY == model_info['quality']:
+		model_info['quality'] = quality_auto (paths
+			, model_info['name']
+			, model_info['code']
+		)
+	model_info['path'] = None
+	if model_info['quality']:
+		model_info['path'] = model_resolve_path (paths, model_info
+			, optimized = optimized
+		)
+	return model_info
+
+
+def perf_load (paths):
+	"""! Loads performance measurements of this machine.
+
+	The map returned comes with the following fields.
+
+	voices: Map of voice keys to a map holding the real-time factor (rtf,
+			seconds of synthesis per second of audio), the number of
+			samples it is based on and the unix time it was updated.
+	rtf-budget: Real-time factor budget of @ref "quality_auto ()".
+				(optional)
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@return Returns the measurements map.
+	"""
+	try:
+		with open (paths['perf'], 'r') as f:
+			perf = json.load (f)
+	except (OSError, ValueError):
+		perf = {}
+	perf.setdefault ('voices', {})
+	return perf
+
+
+def perf_record (paths, key: str, rtf: float, samples: int = 1):
+	"""! Takes a real-time factor measurement of a voice into the db.
+
+	Measurements are averaged over the last PERF_HISTORY samples or so,
+	so the value follows changes of the machine.
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@param key Voice key. (e.g. en_GB-alba-medium)
+	@param rtf Real-time factor measured.
+	@param samples Number of syntheses rtf is the mean of.
+	@return Returns the updated real-time factor of the voice.
+	"""
+	perf = perf_load (paths)
+	entry = perf['voices'].get (key, {'rtf': rtf, 'samples': 0})
+	known = min (entry['samples'], PERF_HISTORY)
+	entry['rtf'] = (entry['rtf'] * known + rtf * samples) / (known + samples)
+	entry['samples'] += samples
+	entry['updated'] = time.time ()
+	perf['voices'][key] = entry
+
+	p = pathlib.Path (paths['perf'])
+	p.parent.mkdir (parents = True, exist_ok = True)
+	tmp = p.with_suffix (f'.{os.getpid ()}.tmp')
+	with open (tmp, 'w') as f:
+		json.dump (perf, f, indent = 4)
+	os.replace (tmp, p)
+	return entry['rtf']
+
+
+def rtf_budget (paths):
+	"""! Returns the real-time factor budget of @ref "quality_auto ()".
+
+	Taken from environment (PIPER_WHISTLE_RTF_BUDGET), the rtf-budget of
+	the perf db or defaults to DEFAULT_RTF_BUDGET.
+	"""
+	budget = os.environ.get ('PIPER_WHISTLE_RTF_BUDGET', None)
+	if budget is None:
+		budget = perf_load (paths).get ('rtf-budget', DEFAULT_RTF_BUDGET)
+	return float (budget)
+
+
+def quality_auto (paths, name: str, code: str = None, budget: float = None):
+	"""! Picks the quality of a voice, meeting a real-time factor budget.
+
+	Chooses the highest quality installed, whose measured real-time factor
+	is within budget. If none is, the lowest quality installed is chosen,
+	as it is the fastest.
+
+	@param paths Paths map. Can be obtained via @ref "data_paths ()".
+	@param name Voice name. (e.g. alba)
+	@param code Language code. (optional)
+	@param budget Real-time factor budget. Defaults to @ref "rtf_budget ()".
+	@return Returns the quality, or None if the voice is not installed.
+	"""
+	def _matches (model):
+		return model['name'] == name and (not code or model['code'] == code)
+
+	def _rank (model):
+		q = model['quality']
+		return QUALITIES.index (q) if q in QUALITIES else -1
 
-	return voice_file_path
+	installed = sorted (query_installed (paths, predicate = _matches)
+		, key = _rank
+		, reverse = True
+	)
+	if not installed:
+		return None
+
+	budget = rtf_budget (paths) if budget is None else budget
+	voices = perf_load (paths)['voices']
+	for model in installed:
+		measured = voices.get (model['key'], None)
+		if measured and measured['rtf'] <= budget:
+			holz.debug (
+				f'Picked {model["key"]} (rtf {measured["rtf"]:.3f} '
+				f'within {budget}).'
+			)
+			return model['quality']
+
+	holz.debug (f'No quality of "{name}" measured within {budget}.')
+	return installed[-1]['quality']
 
 
 def model_remove (paths, model_info):
 	"""! Removes given model from piper-whistle cache.
 
+	Removes the voice along with all its variants, even if model_info
+	selects a variant. (see optimize.variant_remove to remove one)
+
 	@return Returns the true if remove, false otherwise.
 	"""
-	model_path = model_resolve_path (paths, model_info)
+	model_path = model_resolve_path (paths, dict (model_info, variant = None)
+		, pinned = False
+	)
 	if not model_path:
 		holz.warn (
 			f'Could not find model with name '
@@ -673,7 +1089,10 @@ def model_remove (paths, model_info):
 
 	for model_part in pr.iterdir ():
 		holz.debug (f'Removing "{model_part}" ...')
-		model_part.unlink ()
+		if model_part.is_dir ():
+			shutil.rmtree (model_part)
+		else:
+			model_part.unlink ()
 
 	holz.debug (f'Removing "{pr}" ...')
 	pr.rmdir ()
@@ -0,0 +1,450 @@
+"""In-process synthesis engine.
+
+Synthesises speech with onnxruntime inside the whistle process, instead
+of going through piper processes and channels. Text is turned into
+phonemes as configured in the voice's .onnx.json (espeak-ng via
+piper_phonemize, or plain codepoints), mapped to phoneme ids and run
+through the voice model.
+
+Every voice keeps a pool of onnxruntime sessions, so several requests
+are synthesised at once. The threads onnxruntime uses within an
+operator (intra op) and across operators (inter op) are tunable per
+session.
+
+EngineWorker answers requests like a piper worker in request mode (see
+worker.PiperWorker), so the router's pool can hold it instead of piper.
+
+Requires the optional dependencies onnxruntime and numpy, and
+piper_phonemize for voices using espeak phonemes.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import sys
+import json
+import time
+import uuid
+import queue
+import pathlib
+import threading
+import unicodedata
+import contextlib
+import concurrent.futures
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import audio
+from piper_whistle import worker
+from piper_whistle import placement
+
+try:
+	import numpy
+	import onnxruntime
+except ImportError:
+	numpy = None
+	onnxruntime = None
+
+try:
+	import piper_phonemize
+except ImportError:
+	piper_phonemize = None
+
+
+# Synthesis engines to choose from.
+ENGINES = ('piper', 'onnx')
+DEFAULT_ENGINE = 'piper'
+# Special phonemes, as piper maps them.
+PAD = '_'
+BOS = '^'
+EOS = '$'
+MAX_WAV_VALUE = 32767.0
+
+
+def available ():
+	"""! Checks if onnxruntime and numpy are installed.
+	@return Returns True if the engine can synthesise.
+	"""
+	return onnxruntime is not None and numpy is not None
+
+
+class VoiceConfig:
+	"""! Settings of a voice, read from its config (.onnx.json)."""
+	def __init__ (self, config: dict):
+		self.sample_rate = int (config['audio']['sample_rate'])
+		self.phoneme_type = config.get ('phoneme_type', 'espeak')
+		self.espeak_voice = config.get ('espeak', {}).get ('voice', 'en-us')
+		self.phoneme_id_map = config['phoneme_id_map']
+		self.num_speakers = int (config.get ('num_speakers', 1))
+		self.speaker_id_map = config.get ('speaker_id_map', {})
+		inference = config.get ('inference', {})
+		self.noise_scale = float (inference.get ('noise_scale', 0.667))
+		self.length_scale = float (inference.get ('length_scale', 1.0))
+		self.noise_w = float (inference.get ('noise_w', 0.8))
+
+	@property
+	def format (self):
+		return audio.AudioFormat (self.sample_rate)
+
+	@classmethod
+	def load (cls, model_path: str):
+		"""! Reads the config of a voice model.
+		@param model_path Path to voice model (onnx).
+		@return Returns a VoiceConfig.
+		@throws OSError if the config can not be read.
+		@throws ValueError if the config is malformed.
+		"""
+		with open (f'{model_path}.json', 'r') as f:
+			config = json.load (f)
+		try:
+			return cls (config)
+		except (KeyError, TypeError) as e:
+			raise ValueError (f'Malformed voice config of "{model_path}": {e}')
+
+	def speaker_id (self, speaker):
+		"""! Resolves a speaker id or name.
+		@return Returns the speaker id, or None for single speaker voices.
+		"""
+		if 1 >= self.num_speakers:
+			return None
+		if speaker is None or '' == speaker:
+			return 0
+		if str (speaker).isdigit ():
+			return int (speaker)
+		if speaker not in self.speaker_id_map:
+			raise ValueError (f'Unknown speaker "{speaker}".')
+		return int (self.speaker_id_map[speaker])
+
+
+def phonemize (text: str, config: VoiceConfig):
+	"""! Turns text into phonemes, as configured for the voice.
+	@param text Text to be spoken.
+	@param config VoiceConfig of the voice.
+	@return Returns a list of sentences, each a list of phonemes.
+	@throws RuntimeError if piper_phonemize is required, but missing.
+	"""
+	if 'text' == config.phoneme_type:
+		return [list (unicodedata.normalize ('NFD', text.lower ()))]
+	if piper_phonemize is None:
+		raise RuntimeError ('Phonemes of espeak require piper_phonemize.')
+	return piper_phonemize.phonemize_espeak (text, config.espeak_voice)
+
+
+def phoneme_ids (phonemes: list, id_map: dict):
+	"""! Maps phonemes to the ids a voice model takes.
+
+	Phonemes are framed by the begin and end markers, and followed by a
+	pad each. Phonemes missing from the map are skipped.
+
+	@param phonemes List of phonemes.
+	@param id_map Map of phonemes to lists of ids.
+	@return Returns a list of ids.
+	"""
+	ids = list (id_map[BOS]) + list (id_map[PAD])
+	for p in phonemes:
+		if p not in id_map:
+			holz.debug (f'Skipping unknown phoneme "{p}".')
+			continue
+		ids += id_map[p]
+		ids += id_map[PAD]
+	ids += id_map[EOS]
+	return ids
+
+
+class SessionPool:
+	"""! Sessions of a voice model, each running one request at a time.
+
+	Sessions are created on demand, up to size.
+	"""
+	def __init__ (self, model_path: str
+		, size: int = 1
+		, intra_op_threads: int = 0
+		, inter_op_threads: int = 0
+	):
+		"""! Creates pool.
+		@param model_path Path to voice model (onnx).
+		@param size Maximum number of sessions.
+		@param intra_op_threads Threads within an operator. (0 for default)
+		@param inter_op_threads Threads across operators. (0 for default)
+		"""
+		self.model_path = model_path
+		self.size = max (1, size)
+		self.intra_op_threads = intra_op_threads
+		self.inter_op_threads = inter_op_threads
+		self.created = 0
+		self._idle = queue.Queue ()
+		self._lock = threading.Lock ()
+
+	def _create (self):
+		options = onnxruntime.SessionOptions ()
+		options.intra_op_num_threads = self.intra_op_threads
+		options.inter_op_num_threads = self.inter_op_threads
+		if 1 < self.inter_op_threads:
+			options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+		return onnxruntime.InferenceSession (self.model_path, options
+			, providers = ['CPUExecutionProvider']
+		)
+
+	@contextlib.contextmanager
+	def session (self):
+		"""! Borrows a session, waiting for one if all are busy."""
+		s = None
+		with self._lock:
+			if self._idle.empty () and self.created < self.size:
+				self.created += 1
+				create = True
+			else:
+				create = False
+		try:
+			s = self._create () if create else self._idle.get ()
+		except Exception:
+			with self._lock:
+				self.created -= 1
+			raise
+		try:
+			yield s
+		finally:
+			self._idle.put (s)
+
+	def close (self):
+		with self._lock:
+			while not self._idle.empty ():
+				self._idle.get ()
+			self.created = 0
+
+
+class Voice:
+	"""! A voice loaded into onnxruntime."""
+	def __init__ (self, model_path: str
+		, sessions: int = 1
+		, intra_op_threads: int = 0
+		, inter_op_threads: int = 0
+	):
+		"""! Loads voice. See @ref "SessionPool" for the parameters.
+		@throws RuntimeError if onnxruntime or numpy is missing.
+		@throws OSError if the voice config can not be read.
+		"""
+		if not available ():
+			raise RuntimeError (
+				'The onnx engine requires onnxruntime and numpy.'
+			)
+		self.model_path = model_path
+		self.config = VoiceConfig.load (model_path)
+		self.pool = SessionPool (model_path, sessions
+			, intra_op_threads
+			, inter_op_threads
+		)
+		# Load the first session up front, so requests do not wait for it.
+		with self.pool.session ():
+			pass
+
+	def synthesize (self, text: str, speaker = None):
+		"""! Synthesises text.
+		@param text Text to be spoken.
+		@param speaker Speaker id or name. (optional)
+		@return Returns 16bit PCM in the voice's format.
+		"""
+		c = self.config
+		scales = numpy.array ([c.noise_scale, c.length_scale, c.noise_w]
+			, dtype = numpy.float32
+		)
+		sid = c.speaker_id (speaker)
+		pcms = []
+		for phonemes in phonemize (text, c):
+			ids = phoneme_ids (phonemes, c.phoneme_id_map)
+			inputs = {
+				'input': numpy.array ([ids], dtype = numpy.int64),
+				'input_lengths': numpy.array ([len (ids)], dtype = numpy.int64),
+				'scales': scales
+			}
+			if sid is not None:
+				inputs['sid'] = numpy.array ([sid], dtype = numpy.int64)
+			with self.pool.session () as s:
+				samples = s.run (None, inputs)[0].squeeze ()
+			peak = max (0.01, float (numpy.max (numpy.abs (samples))))
+			samples = numpy.clip (samples * (MAX_WAV_VALUE / peak)
+				, -MAX_WAV_VALUE, MAX_WAV_VALUE
+			)
+			pcms.append (samples.astype ('<i2').tobytes ())
+		return b''.join (pcms)
+
+	def close (self):
+		self.pool.close ()
+
+
+class EngineWorker:
+	"""! Serves a voice in-process, answering like a piper worker.
+
+	Payloads submitted are synthesised to wav files (their output_file,
+	or a file in output_dir), on up to sessions threads. The returned
+	futures resolve to the path of the wav file.
+	"""
+	def __init__ (self, model_path: str, output_dir: str
+		, sessions: int = 1
+		, intra_op_threads: int = 0
+		, inter_op_threads: int = 0
+	):
+		self.model_path = model_path
+		self.output_dir = output_dir
+		self.sessions = max (1, sessions)
+		self.intra_op_threads = intra_op_threads
+		self.inter_op_threads = inter_op_threads
+		self.name = f'engine:{pathlib.Path (model_path).stem}'
+		self.voice = None
+		self.error = None
+		self.started_at = None
+		self.ready_at = None
+		self._ready = threading.Event ()
+		self._stopped = threading.Event ()
+		self._lock = threading.Lock ()
+		self._pending = 0
+		self._executor = None
+
+	@property
+	def pid (self):
+		# Shares the process with whistle, so it has no memory of its own.
+		return None
+
+	@property
+	def returncode (self):
+		return 13 if self.error else None
+
+	@property
+	def alive (self):
+		return self._executor is not None and self.error is None \
+			and not self._stopped.is_set ()
+
+	@property
+	def ready (self):
+		return self.alive and self._ready.is_set ()
+
+	@property
+	def pending (self):
+		"""! Number of submitted payloads not synthesised yet."""
+		with self._lock:
+			return self._pending
+
+	@property
+	def load_time (self):
+		"""! Seconds it took to become ready, or None."""
+		if self.ready_at is None:
+			return None
+		return self.ready_at - self.started_at
+
+	def _load (self):
+		try:
+			self.voice = Voice (self.model_path, self.sessions
+				, self.intra_op_threads
+				, self.inter_op_threads
+			)
+			self.ready_at = time.monotonic ()
+			holz.debug (f'[{self.name}] Loaded voice in {self.load_time:.3f}s.')
+		except Exception as e:
+			holz.error (f'[{self.name}] Could not load voice: {e}')
+			self.error = e
+		self._ready.set ()
+
+	def start (self):
+		"""! Loads the voice in the background."""
+		self.started_at = time.monotonic ()
+		self._ready.clear ()
+		self._stopped.clear ()
+		self._executor = concurrent.futures.ThreadPoolExecutor (
+			max_workers = self.sessions
+			, thread_name_prefix = self.name
+		)
+		self._executor.submit (self._load)
+		return self
+
+	def wait_ready (self, timeout = None):
+		"""! Waits until the voice is loaded.
+		@return Returns True if worker is ready.
+		"""
+		self._ready.wait (timeout)
+		return self.ready
+
+	def _synthesize (self, payload):
+		try:
+			self._ready.wait ()
+			if self.error:
+				raise RuntimeError (f'{self.name} failed: {self.error}')
+			speaker = payload.get ('speaker_id', payload.get ('speaker', None))
+			pcm = self.voice.synthesize (payload['text'], speaker)
+			output_file = payload.get ('output_file', None)
+			if not output_file:
+				output_file = pathlib.Path (self.output_dir) \
+					.joinpath (f'{uuid.uuid4 ().hex}.wav').as_posix ()
+			audio.wav_write (output_file, self.voice.config.format, pcm)
+			return output_file
+		finally:
+			with self._lock:
+				self._pending -= 1
+
+	def submit (self, payload):
+		"""! Submits a payload (JSON string or map) for synthesis.
+		@return Returns a concurrent.futures.Future resolving to the path
+				of the wav file written.
+		"""
+		if not self.alive:
+			future = concurrent.futures.Future ()
+			future.set_exception (RuntimeError (f'{self.name} not available.'))
+			return future
+		if isinstance (payload, str):
+			payload = json.loads (payload)
+		with self._lock:
+			self._pending += 1
+		return self._executor.submit (self._synthesize, payload)
+
+	def stop (self, timeout = 5.0):
+		"""! Finishes pending payloads and unloads the voice.
+		@return Returns the exit code (13 if the voice failed to load).
+		"""
+		self._stopped.set ()
+		if self._executor:
+			self._executor.shutdown (wait = True)
+		if self.voice:
+			self.voice.close ()
+			self.voice = None
+		return self.returncode
+
+
+def worker_factory (engine: str, piper, output_dir: str
+	, extra_args = None
+	, sessions: int = 1
+	, intra_op_threads: int = 0
+	, inter_op_threads: int = 0
+	, cpu_placement: placement.Placement = None
+):
+	"""! Creates a factory of request mode workers for given engine.
+	@param engine Name of the engine. (see ENGINES)
+	@param piper Piper executable, used by the piper engine.
+	@param output_dir Directory wav files are written to.
+	@param extra_args Additional parameters passed on to piper. (optional)
+	@param sessions Sessions per voice of the onnx engine.
+	@param intra_op_threads Threads within an operator. (0 for default)
+	@param inter_op_threads Threads across operators. (0 for default)
+	@param cpu_placement	Placement pinning piper workers to CPUs.
+							(optional, see placement module)
+	@throws ValueError if cpu_placement is given for the onnx engine.
+	@return Returns a callable taking a model path, and returning a
+			(not yet started) worker.
+	"""
+	if 'onnx' == engine:
+		if cpu_placement:
+			raise ValueError ('The onnx engine can not be pinned to CPUs.')
+
+		def _engine_worker (model_path):
+			return EngineWorker (model_path, output_dir
+				, sessions = sessions
+				, intra_op_threads = intra_op_threads
+				, inter_op_threads = inter_op_threads
+			)
+		return _engine_worker
+
+	def _piper_worker (model_path):
+		params = worker.piper_command_build (piper, model_path
+			, output_dir = output_dir
+			, extra_args = extra_args
+		)
+		w = worker.PiperWorker (params)
+		if cpu_placement:
+			w.cpus = cpu_placement.assign (model_path, w)
+		return w
+	return _piper_worker
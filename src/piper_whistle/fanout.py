@@ -0,0 +1,278 @@
+"""Output fan-out.
+
+Reads piper's raw audio once and broadcasts it to several sinks, e.g. a
+FIFO read by aplay, a recording file and monitoring clients connected to
+a Unix socket. Replaces chains of tee.
+
+Audio passes through a ring buffer. Every sink is written non-blocking
+from its own position in the buffer, so a slow sink never holds back
+the others. Sinks start with the audio read after they attached. A
+sink falling behind by more than the buffer holds skips
+ahead to the oldest audio still buffered (keeping frames intact), and
+counts the bytes it dropped.
+
+Sinks are given as:
+
+* unix:PATH - Listen on a Unix socket. Each client becomes a sink.
+* PATH of a FIFO - Written once a reader is attached, reopened when
+	the reader goes away.
+* Any other PATH - File, appended to.
+
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import stat
+import time
+import errno
+import select
+import socket
+import pathlib
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+# Bytes per frame of piper's raw output (16bit mono).
+DEFAULT_FRAME_SIZE = 2
+READ_SIZE = 1 << 16
+REOPEN_INTERVAL = 1.0
+
+
+class RingBuffer:
+	"""! Fixed size buffer of the latest bytes of a stream.
+
+	Positions are absolute stream offsets. Bytes from start to end are
+	available.
+	"""
+	def __init__ (self, capacity: int):
+		self.capacity = capacity
+		self.end = 0
+		self._buf = bytearray (capacity)
+
+	@property
+	def start (self):
+		return max (0, self.end - self.capacity)
+
+	def write (self, data: bytes):
+		if self.capacity <= len (data):
+			self.end += len (data) - self.capacity
+			data = data[-self.capacity:]
+		i = self.end % self.capacity
+		first = min (len (data), self.capacity - i)
+		self._buf[i:i + first] = data[:first]
+		self._buf[:len (data) - first] = data[first:]
+		self.end += len (data)
+
+	def read (self, offset: int, limit: int):
+		"""! Reads up to limit bytes at offset (without wrapping around).
+		@return Returns a memoryview of the bytes.
+		"""
+		i = offset % self.capacity
+		n = min (limit, self.end - offset, self.capacity - i)
+		return memoryview (self._buf)[i:i + n]
+
+
+class Sink:
+	"""! A destination of the broadcast, written from its own position."""
+	def __init__ (self, name: str, opener = None, fd: int = None
+		, owner = None
+	):
+		"""! Creates sink.
+		@param name Name used in logs.
+		@param opener	Callable returning a non-blocking fd, or None if
+						the sink is not available (yet). Sinks with an
+						opener are reopened after failures.
+		@param fd Already opened non-blocking fd. (instead of opener)
+		@param owner Object owning fd (e.g. a socket), kept alive.
+		"""
+		self.name = name
+		self.opener = opener
+		self.fd = fd
+		self.owner = owner
+		self.offset = None
+		self.written = 0
+		self.dropped = 0
+		self._opened_at = 0.0
+
+	@property
+	def closed (self):
+		return self.fd is None
+
+	def attach (self, ring: RingBuffer, frame_size: int):
+		"""! Positions sink at the live end of the buffer."""
+		self.offset = ring.end - ring.end % frame_size
+
+	def open (self, now: float, ring: RingBuffer, frame_size: int):
+		if self.opener is None or now - self._opened_at < REOPEN_INTERVAL:
+			return
+		self._opened_at = now
+		self.fd = self.opener ()
+		if self.fd is not None:
+			self.attach (ring, frame_size)
+			holz.info (f'Sink "{self.name}" attached.')
+
+	def close (self):
+		if self.fd is not None:
+			if self.owner:
+				self.owner.close ()
+			else:
+				os.close (self.fd)
+		self.fd = None
+		self.offset = None
+
+	def flush (self, ring: RingBuffer, frame_size: int):
+		"""! Writes buffered audio, as much as the sink takes right now."""
+		if self.offset < ring.start:
+			# Keep as far into a frame as the sink is, after partial writes.
+			skip_to = ring.start + (self.offset - ring.start) % frame_size
+			self.dropped += skip_to - self.offset
+			self.offset = skip_to
+		while self.offset < ring.end:
+			data = ring.read (self.offset, READ_SIZE)
+			try:
+				n = os.write (self.fd, data)
+			except BlockingIOError:
+				return
+			except OSError as e:
+				holz.info (f'Sink "{self.name}" detached ({e}).')
+				self.close ()
+				return
+			self.offset += n
+			self.written += n
+			if n < len (data):
+				return
+
+
+def _fifo_opener (path):
+	def _open ():
+		try:
+			return os.open (path, os.O_WRONLY | os.O_NONBLOCK)
+		except OSError as e:
+			if errno.ENXIO != e.errno:
+				holz.warn (f'Could not open "{path}": {e}')
+			return None
+	return _open
+
+
+def _file_opener (path):
+	def _open ():
+		try:
+			return os.open (path
+				, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_NONBLOCK
+				, 0o644
+			)
+		except OSError as e:
+			holz.warn (f'Could not open "{path}": {e}')
+			return None
+	return _open
+
+
+def sinks_create (specs):
+	"""! Creates sinks and socket listeners from their specs.
+	@param specs List of sink specs (see module description).
+	@return Returns a touple of (list of Sink, list of listening sockets).
+	"""
+	sinks = []
+	listeners = []
+	for spec in specs:
+		if spec.startswith ('unix:'):
+			path = spec[len ('unix:'):]
+			pathlib.Path (path).unlink (missing_ok = True)
+			s = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+			s.bind (path)
+			s.listen ()
+			s.setblocking (False)
+			listeners.append (s)
+			continue
+		try:
+			is_fifo = stat.S_ISFIFO (os.stat (spec).st_mode)
+		except FileNotFoundError:
+			is_fifo = False
+		opener = _fifo_opener (spec) if is_fifo else _file_opener (spec)
+		sinks.append (Sink (spec, opener))
+	return sinks, listeners
+
+
+def fanout (source_fd, sinks: list
+	, listeners: list = None
+	, buffer_size: int = DEFAULT_BUFFER_SIZE
+	, frame_size: int = DEFAULT_FRAME_SIZE
+	, stop_event = None
+	, interval: float = 0.25
+	, drain_timeout: float = 1.0
+):
+	"""! Broadcasts everything read from source_fd to all sinks.
+
+	Runs until source_fd reaches its end or stop_event is set. Sinks
+	then get up to drain_timeout seconds to take the rest of the buffer.
+
+	@param source_fd File descriptor to read audio from.
+	@param sinks List of Sink objects. Clients of listeners are added.
+	@param listeners Listening sockets, accepting monitor clients.
+	@param buffer_size Bytes the ring buffer holds.
+	@param frame_size Bytes per audio frame. Sinks skip whole frames only.
+	@param stop_event Optional threading.Event to stop broadcasting.
+	@param interval Seconds between checks for stop_event and reopening.
+	@param drain_timeout Seconds to flush sinks after the source ended.
+	@return Returns number of bytes read from source_fd.
+	"""
+	listeners = listeners or []
+	ring = RingBuffer (buffer_size)
+	source_open = True
+	deadline = None
+	while True:
+		now = time.monotonic ()
+		if source_open and stop_event and stop_event.is_set ():
+			source_open = False
+		if not source_open:
+			deadline = deadline or now + drain_timeout
+			pending = [s for s in sinks if not s.closed and s.offset < ring.end]
+			if not pending or now >= deadline:
+				break
+
+		for s in sinks:
+			if s.closed:
+				s.open (now, ring, frame_size)
+
+		rlist = list (listeners)
+		if source_open:
+			rlist.append (source_fd)
+		wlist = [s.fd for s in sinks if not s.closed and s.offset < ring.end]
+		readable, writable, _ = select.select (rlist, wlist, [], interval)
+
+		if source_fd in readable:
+			try:
+				data = os.read (source_fd, READ_SIZE)
+			except BlockingIOError:
+				data = None
+			if data == b'':
+				source_open = False
+			elif data:
+				ring.write (data)
+
+		for listener in listeners:
+			if listener not in readable:
+				continue
+			try:
+				conn, _ = listener.accept ()
+			except BlockingIOError:
+				continue
+			conn.setblocking (False)
+			client = Sink (f'client {conn.fileno ()}'
+				, fd = conn.fileno ()
+				, owner = conn
+			)
+			client.attach (ring, frame_size)
+			sinks.append (client)
+			holz.info (f'Monitor client {conn.fileno ()} attached.')
+
+		for s in sinks:
+			if not s.closed:
+				s.flush (ring, frame_size)
+
+		# Clients can not be reopened. Forget them once gone.
+		sinks[:] = [s for s in sinks if s.opener or not s.closed]
+
+	return ring.end
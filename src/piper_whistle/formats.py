@@ -0,0 +1,142 @@
+"""Output formatting.
+
+Buffered writer and row renderers used by commands producing listings.
+Rows are maps rendered with a fixed list of columns, either as human
+readable text or one of the machine readable formats:
+
+* json: A single JSON array of objects.
+* jsonl: One JSON object per line.
+* tsv: Tab separated values with a header line. Tabs, newlines and
+	backslashes in values are escaped (\\t, \\n, \\\\).
+* csv: Comma separated values with a header line (RFC 4180 quoting).
+
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import io
+import csv
+import json
+
+
+FORMATS = ('text', 'json', 'jsonl', 'tsv', 'csv')
+MACHINE_FORMATS = FORMATS[1:]
+
+
+class BufferedWriter:
+	"""! Collects written text and passes it on in large chunks.
+
+	Keeps the number of writes to the underlying stream low, while
+	still bounding memory by flushing once threshold characters are
+	buffered.
+	"""
+	def __init__ (self, stream, threshold: int = 1 << 16):
+		self.stream = stream
+		self.threshold = threshold
+		self._parts = []
+		self._size = 0
+
+	def write (self, s: str):
+		self._parts.append (s)
+		self._size += len (s)
+		if self.threshold <= self._size:
+			self.flush ()
+		return len (s)
+
+	def flush (self):
+		if self._parts:
+			self.stream.write (''.join (self._parts))
+			self._parts.clear ()
+			self._size = 0
+		self.stream.flush ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *exc):
+		self.flush ()
+		return False
+
+
+def _as_text (value):
+	"""! Renders a single value for delimiter separated formats."""
+	if value is None:
+		return ''
+	if isinstance (value, bool):
+		return 'true' if value else 'false'
+	return str (value)
+
+
+def _tsv_escape (value):
+	"""! Escapes characters which would break a TSV row."""
+	return _as_text (value) \
+		.replace ('\\', '\\\\') \
+		.replace ('\t', '\\t') \
+		.replace ('\n', '\\n') \
+		.replace ('\r', '\\r')
+
+
+class RowWriter:
+	"""! Renders rows of a fixed column set in a machine readable format.
+
+	Use as a context manager, so headers and closing brackets are
+	written, and the underlying writer gets flushed.
+	"""
+	def __init__ (self, writer, fmt: str, columns: list):
+		if fmt not in MACHINE_FORMATS:
+			raise ValueError (f'Unknown row format "{fmt}".')
+		self.writer = writer
+		self.fmt = fmt
+		self.columns = list (columns)
+		self._count = 0
+		self._csv = None
+		if 'csv' == fmt:
+			self._csv = csv.writer (writer, lineterminator = '\n')
+
+	def begin (self):
+		if 'json' == self.fmt:
+			self.writer.write ('[')
+		elif 'tsv' == self.fmt:
+			self.writer.write ('\t'.join (self.columns) + '\n')
+		elif 'csv' == self.fmt:
+			self._csv.writerow (self.columns)
+
+	def row (self, values: dict):
+		ordered = [values.get (c, None) for c in self.columns]
+		if 'json' == self.fmt:
+			sep = ',\n' if 0 < self._count else '\n'
+			obj = dict (zip (self.columns, ordered))
+			self.writer.write (sep + json.dumps (obj, ensure_ascii = False))
+		elif 'jsonl' == self.fmt:
+			obj = dict (zip (self.columns, ordered))
+			self.writer.write (json.dumps (obj, ensure_ascii = False) + '\n')
+		elif 'tsv' == self.fmt:
+			self.writer.write ('\t'.join (_tsv_escape (v) for v in ordered) + '\n')
+		elif 'csv' == self.fmt:
+			self._csv.writerow ([_as_text (v) for v in ordered])
+		self._count += 1
+
+	def end (self):
+		if 'json' == self.fmt:
+			self.writer.write ('\n]\n' if 0 < self._count else ']\n')
+		self.writer.flush ()
+
+	def __enter__ (self):
+		self.begin ()
+		return self
+
+	def __exit__ (self, *exc):
+		self.end ()
+		return False
+
+
+def render_rows (fmt: str, columns: list, rows) -> str:
+	"""! Renders rows to a string. Mostly useful for tests and libraries.
+	@param fmt One of the machine readable formats.
+	@param columns List of column names, in output order.
+	@param rows Iterable of row maps.
+	@return Returns rendered rows as string.
+	"""
+	out = io.StringIO ()
+	with RowWriter (BufferedWriter (out), fmt, columns) as rw:
+		for r in rows:
+			rw.row (r)
+	return out.getvalue ()
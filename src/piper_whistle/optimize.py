@@ -0,0 +1,226 @@
+"""Offline optimisation of installed voices.
+
+Produces variants of installed models (see db.VARIANTS):
+
+* optimized: Piper loads voice models without letting onnxruntime
+	optimise their graph, as doing so on every start roughly doubles the
+	load time. Running the optimisation once, offline, gets the faster
+	inference of an optimised graph, without paying for it on start-up.
+* int8: Weights are quantised to 8bit integers (dynamic quantisation),
+	which shrinks models (and the memory piper needs) and speeds up
+	inference on CPUs, for a little loss in quality.
+
+A variant is stored in a directory of its name inside the voice's
+directory, along with a copy of the voice config and a provenance
+record (provenance.json) naming the source model, the settings and the
+onnxruntime version used. The db resolves selectors to variants (see
+db.model_variant_path).
+
+Requires the optional dependency onnxruntime (and onnx for quantising).
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import pathlib
+import platform
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import db
+
+try:
+	import onnxruntime
+except ImportError:
+	onnxruntime = None
+
+
+# Optimisation levels, mapped to their onnxruntime name. Graphs optimised
+# with "all" carry layouts specific to the CPU they were optimised on.
+LEVELS = {
+	'basic': 'ORT_ENABLE_BASIC',
+	'extended': 'ORT_ENABLE_EXTENDED',
+	'all': 'ORT_ENABLE_ALL'
+}
+DEFAULT_LEVEL = 'extended'
+# Weight types of quantisation, mapped to their onnxruntime name. The CPU
+# kernels of quantised convolutions only take unsigned weights.
+WEIGHT_TYPES = {
+	'uint8': 'QUInt8',
+	'int8': 'QInt8'
+}
+DEFAULT_WEIGHT_TYPE = 'uint8'
+READ_SIZE = 1 << 20
+
+
+def available ():
+	"""! Checks if onnxruntime is installed.
+	@return Returns True if variants can be produced.
+	"""
+	return onnxruntime is not None
+
+
+def _sha256 (path: str):
+	h = hashlib.sha256 ()
+	with open (path, 'rb') as f:
+		for chunk in iter (lambda: f.read (READ_SIZE), b''):
+			h.update (chunk)
+	return h.hexdigest ()
+
+
+def provenance_build (model_path: str, variant: str, settings: dict):
+	"""! Describes how a variant of a model came about.
+	@param model_path Path to the installed (source) onnx model.
+	@param variant Name of the variant. (see db.VARIANTS)
+	@param settings Map of settings the variant was produced with.
+	@return Returns the provenance map.
+	"""
+	st = os.stat (model_path)
+	return {
+		'source': {
+			'path': pathlib.Path (model_path).resolve ().as_posix (),
+			'size': st.st_size,
+			'mtime_ns': st.st_mtime_ns,
+			'sha256': _sha256 (model_path)
+		},
+		'variant': variant,
+		'settings': settings,
+		'onnxruntime': onnxruntime.__version__ if onnxruntime else None,
+		'machine': platform.machine (),
+		'time': time.time ()
+	}
+
+
+def provenance_load (model_path: str, variant: str):
+	"""! Loads the provenance record of a variant.
+	@param model_path Path to the installed onnx model.
+	@param variant Name of the variant. (see db.VARIANTS)
+	@return Returns the provenance map, or None.
+	"""
+	d = pathlib.Path (db.model_variant_dir (model_path, variant))
+	try:
+		with open (d.joinpath ('provenance.json'), 'r') as f:
+			return json.load (f)
+	except (OSError, ValueError):
+		return None
+
+
+def provenance_update (model_path: str, variant: str, **fields):
+	"""! Adds fields to the provenance record of a variant."""
+	provenance = provenance_load (model_path, variant) or {}
+	provenance.update (fields)
+	d = pathlib.Path (db.model_variant_dir (model_path, variant))
+	with open (d.joinpath ('provenance.json'), 'w') as f:
+		json.dump (provenance, f, indent = 4)
+
+
+def _variant_write (model_path: str, variant: str, settings: dict, produce):
+	"""! Produces a variant of a model, along with its config and provenance.
+	@param model_path Path to the installed onnx model.
+	@param variant Name of the variant. (see db.VARIANTS)
+	@param settings Map of settings, recorded in the provenance.
+	@param produce Callable taking the path to write the variant's model to.
+	@return Returns the path of the variant's model.
+	"""
+	if not available ():
+		raise RuntimeError ('Producing variants requires onnxruntime.')
+
+	d = pathlib.Path (db.model_variant_dir (model_path, variant))
+	d.mkdir (parents = True, exist_ok = True)
+	p = pathlib.Path (model_path)
+	variant_path = d.joinpath (f'{p.stem}+{variant}{p.suffix}')
+	tmp = d.joinpath (f'.{variant_path.stem}.{os.getpid ()}.tmp{p.suffix}')
+	try:
+		started = time.monotonic ()
+		produce (tmp.as_posix ())
+		holz.debug (
+			f'Produced {variant} of "{model_path}" '
+			f'in {time.monotonic () - started:.2f}s.'
+		)
+		os.replace (tmp, variant_path)
+	finally:
+		tmp.unlink (missing_ok = True)
+
+	config_path = pathlib.Path (f'{model_path}.json')
+	if config_path.exists ():
+		shutil.copyfile (config_path, f'{variant_path}.json')
+	with open (d.joinpath ('provenance.json'), 'w') as f:
+		json.dump (provenance_build (model_path, variant, settings), f
+			, indent = 4
+		)
+
+	return variant_path.as_posix ()
+
+
+def model_optimize (model_path: str, level: str = DEFAULT_LEVEL):
+	"""! Optimises the graph of an installed model.
+	@param model_path Path to the installed onnx model.
+	@param level Optimisation level. (see LEVELS)
+	@return Returns the path of the optimised model.
+	@throws RuntimeError if onnxruntime is not installed.
+	@throws ValueError if level is unknown.
+	"""
+	if level not in LEVELS:
+		raise ValueError (f'Unknown optimisation level "{level}".')
+
+	def _produce (output_path):
+		options = onnxruntime.SessionOptions ()
+		options.graph_optimization_level = getattr (
+			onnxruntime.GraphOptimizationLevel, LEVELS[level]
+		)
+		options.optimized_model_filepath = output_path
+		onnxruntime.InferenceSession (model_path, options
+			, providers = ['CPUExecutionProvider']
+		)
+
+	return _variant_write (model_path, db.OPTIMIZED_VARIANT
+		, {'level': level}
+		, _produce
+	)
+
+
+def model_quantize (model_path: str
+	, weight_type: str = DEFAULT_WEIGHT_TYPE
+	, per_channel: bool = False
+):
+	"""! Quantises the weights of an installed model to 8bit integers.
+	@param model_path Path to the installed onnx model.
+	@param weight_type Type of quantised weights. (see WEIGHT_TYPES)
+	@param per_channel Quantise weights per channel, instead of per tensor.
+	@return Returns the path of the quantised model.
+	@throws RuntimeError if onnxruntime is not installed.
+	@throws ValueError if weight_type is unknown.
+	"""
+	if weight_type not in WEIGHT_TYPES:
+		raise ValueError (f'Unknown weight type "{weight_type}".')
+
+	def _produce (output_path):
+		# Imports onnx, which only quantising requires.
+		from onnxruntime import quantization
+		quantization.quantize_dynamic (model_path, output_path
+			, weight_type = getattr (
+				quantization.QuantType, WEIGHT_TYPES[weight_type]
+			)
+			, per_channel = per_channel
+		)
+
+	return _variant_write (model_path, db.INT8_VARIANT
+		, {'weight_type': weight_type, 'per_channel': per_channel}
+		, _produce
+	)
+
+
+def variant_remove (model_path: str, variant: str):
+	"""! Removes a variant of an installed model.
+	@param model_path Path to the installed onnx model.
+	@param variant Name of the variant. (see db.VARIANTS)
+	@return Returns True if there was one.
+	"""
+	d = pathlib.Path (db.model_variant_dir (model_path, variant))
+	if not d.exists ():
+		return False
+	shutil.rmtree (d)
+	return True
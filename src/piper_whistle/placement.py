@@ -0,0 +1,185 @@
+"""Placement of workers on CPUs.
+
+By default every piper process may run on every core, and onnxruntime
+starts a thread per core in each of them. With several workers, they
+fight over the same cores and throughput collapses. Placement pins each
+worker to a set of cores of its own.
+
+Piper has no option capping the threads of onnxruntime, nor does
+onnxruntime read OMP_NUM_THREADS, so threads are not capped. Affinity
+alone keeps a worker on its cores: threads beyond them share the cores,
+instead of spilling onto the cores of other workers.
+
+Voices are spread across NUMA nodes, each voice staying on the node it
+was first placed on, so its workers share the node's memory. Within a
+node, workers get the adjacent cores least used by other workers.
+
+CPU affinity is Linux only. Elsewhere, workers are not pinned.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import pathlib
+import threading
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+
+
+NODE_ROOT = '/sys/devices/system/node'
+
+
+def cpulist_parse (text: str):
+	"""! Parses a list of CPUs, as the kernel prints them. (e.g. 0-3,8)
+	@return Returns a sorted list of CPU numbers.
+	@throws ValueError if text is malformed.
+	"""
+	cpus = set ()
+	for part in text.strip ().split (','):
+		if not part:
+			continue
+		if '-' in part:
+			first, last = part.split ('-')
+			cpus.update (range (int (first), int (last) + 1))
+		else:
+			cpus.add (int (part))
+	return sorted (cpus)
+
+
+def cpulist_format (cpus):
+	"""! Formats CPU numbers as a list of ranges. (e.g. 0-3,8)"""
+	ranges = []
+	for cpu in sorted (cpus):
+		if ranges and ranges[-1][1] + 1 == cpu:
+			ranges[-1][1] = cpu
+		else:
+			ranges.append ([cpu, cpu])
+	return ','.join (f'{a}-{b}' if a != b else f'{a}' for a, b in ranges)
+
+
+def cpus_available ():
+	"""! Lists the CPUs whistle may run on.
+	@return Returns a sorted list of CPU numbers.
+	"""
+	if hasattr (os, 'sched_getaffinity'):
+		return sorted (os.sched_getaffinity (0))
+	return list (range (os.cpu_count () or 1))
+
+
+def numa_nodes (root: str = NODE_ROOT):
+	"""! Lists the CPUs of every NUMA node, which whistle may run on.
+	@param root Directory the kernel lists nodes in.
+	@return Returns a map of node numbers to sorted lists of CPUs. Without
+			NUMA information, all CPUs belong to node 0.
+	"""
+	available = set (cpus_available ())
+	nodes = {}
+	for p in sorted (pathlib.Path (root).glob ('node[0-9]*')):
+		try:
+			cpus = cpulist_parse (p.joinpath ('cpulist').read_text ())
+		except (OSError, ValueError):
+			continue
+		cpus = [cpu for cpu in cpus if cpu in available]
+		if cpus:
+			nodes[int (p.name[len ('node'):])] = cpus
+	return nodes or {0: sorted (available)}
+
+
+def affinity_apply (pid: int, cpus):
+	"""! Pins all threads of a process to given CPUs.
+	@param pid Process id.
+	@param cpus Iterable of CPU numbers.
+	@return Returns True if the process was pinned.
+	"""
+	if not hasattr (os, 'sched_setaffinity'):
+		return False
+	tids = [pid]
+	try:
+		tids = [int (t.name) for t in pathlib.Path (f'/proc/{pid}/task').iterdir ()]
+	except (OSError, ValueError):
+		pass
+	pinned = False
+	for tid in tids:
+		try:
+			os.sched_setaffinity (tid, cpus)
+			pinned = True
+		except OSError as e:
+			holz.debug (f'Could not pin {tid} to {cpulist_format (cpus)}: {e}')
+	return pinned
+
+
+class Placement:
+	"""! Hands out sets of CPUs to the workers of voices."""
+	def __init__ (self, cpus_per_worker: int, nodes: dict = None):
+		"""! Creates placement.
+		@param cpus_per_worker CPUs a worker is pinned to.
+		@param nodes	Map of NUMA nodes to their CPUs. (defaults to
+						@ref "numa_nodes ()")
+		"""
+		self.cpus_per_worker = max (1, cpus_per_worker)
+		self.nodes = nodes or numa_nodes ()
+		self._load = {cpu: 0 for cpus in self.nodes.values () for cpu in cpus}
+		self._voice_node = {}
+		# Lists of [owner, voice, cpus], for workers holding CPUs.
+		self._placed = []
+		self._lock = threading.Lock ()
+
+	def _reclaim (self):
+		"""! Takes back CPUs of workers which exited."""
+		placed = []
+		for entry in self._placed:
+			owner, voice, cpus = entry
+			if owner is None or owner.returncode is None:
+				placed.append (entry)
+				continue
+			for cpu in cpus:
+				self._load[cpu] -= 1
+		self._placed = placed
+		voices = set (voice for _, voice, _ in placed)
+		for voice in list (self._voice_node):
+			if voice not in voices:
+				del self._voice_node[voice]
+
+	def _node_for (self, voice):
+		node = self._voice_node.get (voice, None)
+		if node is None:
+			voices = list (self._voice_node.values ())
+
+			def _usage (n):
+				load = sum (self._load[cpu] for cpu in self.nodes[n])
+				return (voices.count (n), load / len (self.nodes[n]), n)
+
+			node = min (self.nodes, key = _usage)
+			self._voice_node[voice] = node
+		return node
+
+	def assign (self, voice: str, owner = None):
+		"""! Picks the CPUs for a worker of a voice.
+
+		CPUs of workers, which exited since (their returncode is set), are
+		taken back first.
+
+		@param voice Key identifying the voice. (e.g. its model path)
+		@param owner Worker the CPUs are assigned to.
+		@return Returns a set of CPU numbers.
+		"""
+		with self._lock:
+			self._reclaim ()
+			node = self._node_for (voice)
+			cpus = self.nodes[node]
+			n = min (self.cpus_per_worker, len (cpus))
+			windows = [cpus[i:i + n] for i in range (len (cpus) - n + 1)]
+			best = min (windows
+				, key = lambda w: sum (self._load[cpu] for cpu in w)
+			)
+			for cpu in best:
+				self._load[cpu] += 1
+			self._placed.append ([owner, voice, best])
+		holz.debug (f'Placing "{voice}" on node {node}: {cpulist_format (best)}')
+		return set (best)
+
+	def usage (self):
+		"""! Number of workers per CPU."""
+		with self._lock:
+			self._reclaim ()
+			return dict (self._load)
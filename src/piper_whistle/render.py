@@ -0,0 +1,205 @@
+"""Rendering of scripts into a single audio file.
+
+A script has one line per utterance, naming voice, speaker and text.
+Lines are synthesised concurrently by the workers of a router's pool
+(see router.WorkerPool), and their audio is assembled in script order,
+separated by gaps of silence.
+
+Lines are handed to workers longest first, as soon as a worker of their
+voice is free, so the longest lines do not end up last, keeping all
+others waiting. Rendering thus takes about the total synthesis time
+divided by the number of workers, instead of the sum over all lines.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import sys
+import json
+import pathlib
+import collections
+import threading
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import audio
+
+
+# Seconds of silence between lines.
+DEFAULT_GAP = 0.4
+
+
+def script_parse (lines, default_selector: str = None):
+	"""! Parses the lines of a script.
+
+	Every line is either tab separated, as in VOICE, SPEAKER and TEXT,
+	VOICE and TEXT, or just TEXT (spoken by the default voice), or a JSON
+	map with text, voice, speaker and gap. (seconds of silence following
+	the line, overriding the default) Empty lines and lines starting
+	with # are skipped.
+
+	@param lines Iterable of script lines.
+	@param default_selector Voice of lines not selecting one.
+	@return Returns a list of maps with voice, speaker, text and gap.
+	@throws ValueError if a line is malformed.
+	"""
+	script = []
+	for number, line in enumerate (lines, 1):
+		line = line.strip ('\r\n')
+		if not line.strip () or line.lstrip ().startswith ('#'):
+			continue
+		if line.startswith ('{'):
+			try:
+				j = json.loads (line)
+			except json.JSONDecodeError as e:
+				raise ValueError (f'Line {number}: {e}')
+		else:
+			fields = line.split ('\t', 2)
+			j = {'text': fields[-1]}
+			if 1 < len (fields):
+				j['voice'] = fields[0]
+			if 3 == len (fields):
+				j['speaker'] = fields[1]
+		entry = {
+			'voice': j.get ('voice', None) or default_selector,
+			'speaker': j.get ('speaker', None) or None,
+			'text': str (j.get ('text', '')).strip (),
+			'gap': j.get ('gap', None)
+		}
+		if not entry['voice'] or not entry['text']:
+			raise ValueError (f'Line {number}: Missing voice or text.')
+		if entry['gap'] is not None:
+			try:
+				entry['gap'] = max (0.0, float (entry['gap']))
+			except (TypeError, ValueError):
+				raise ValueError (f'Line {number}: Invalid gap "{entry["gap"]}".')
+		script.append (entry)
+	return script
+
+
+def _voices_resolve (router, script):
+	"""! Resolves the voices of a script to their model paths.
+	@return Returns a list of model paths, one per line.
+	@throws LookupError if a voice is not installed.
+	@throws ValueError if the voices differ in sample rate.
+	"""
+	paths = {}
+	formats = {}
+	for entry in script:
+		selector = entry['voice']
+		if selector in paths:
+			continue
+		try:
+			m = router.resolve (selector)
+		except ValueError:
+			m = {'path': None}
+		if not m['path']:
+			raise LookupError (f'No voice matches "{selector}".')
+		paths[selector] = m['path']
+		fmt = audio.voice_format (m['path'])
+		if fmt:
+			formats[selector] = fmt
+	rates = set (fmt.sample_rate for fmt in formats.values ())
+	if 1 < len (rates):
+		raise ValueError (
+			f'Voices differ in sample rate ({sorted (rates)}), '
+			'so their audio can not be joined.'
+		)
+	return [paths[entry['voice']] for entry in script]
+
+
+def render (router, script
+	, gap: float = DEFAULT_GAP
+	, workers_per_voice: int = 1
+	, max_workers: int = 0
+):
+	"""! Synthesises the lines of a script and joins their audio in order.
+	@param router Router (see router.Router) to synthesise lines with.
+	@param script List of line maps. (see script_parse)
+	@param gap Seconds of silence between lines, unless a line has its own.
+	@param workers_per_voice Lines of a voice synthesised at once.
+	@param max_workers Lines synthesised at once in total. (0 for no limit)
+	@return Returns a tuple of (AudioFormat, pcm bytes), or (None, b'') if
+			the script is empty.
+	@throws LookupError if a voice is not installed.
+	@throws ValueError if the audio of the lines differs in format.
+	@throws RuntimeError if a line could not be synthesised.
+	"""
+	if not script:
+		return None, b''
+
+	models = _voices_resolve (router, script)
+	workers_per_voice = max (1, workers_per_voice)
+	pending = sorted (range (len (script))
+		, key = lambda i: len (script[i]['text'])
+		, reverse = True
+	)
+	futures = [None] * len (script)
+	inflight = collections.Counter ()
+	cond = threading.Condition ()
+
+	def _next ():
+		"""! Picks the longest pending line a worker is free for, preferring
+		voices which are loaded already.
+		"""
+		if 0 < max_workers and max_workers <= sum (inflight.values ()):
+			return None
+		loaded = set (router.pool.loaded ())
+		free = [
+			i for i in pending
+			if inflight[models[i]] < workers_per_voice
+		]
+		return min (free
+			, key = lambda i: models[i] not in loaded
+			, default = None
+		)
+
+	def _done (model_path):
+		def _release (f):
+			with cond:
+				inflight[model_path] -= 1
+				cond.notify_all ()
+		return _release
+
+	try:
+		while pending:
+			with cond:
+				i = _next ()
+				while i is None:
+					cond.wait ()
+					i = _next ()
+				pending.remove (i)
+				inflight[models[i]] += 1
+			entry = script[i]
+			holz.debug (f'Rendering line {i + 1} with "{entry["voice"]}" ...')
+			futures[i] = router.submit (entry['voice'], entry['text']
+				, speaker = entry['speaker']
+			)
+			futures[i].add_done_callback (_done (models[i]))
+
+		fmt = None
+		parts = []
+		for i, f in enumerate (futures):
+			try:
+				part_fmt, pcm = audio.wav_read (f.result ())
+			except Exception as e:
+				raise RuntimeError (f'Could not render line {i + 1}: {e}')
+			fmt = fmt or part_fmt
+			if part_fmt != fmt:
+				raise ValueError (
+					f'Audio of line {i + 1} ({part_fmt}) does not match '
+					f'preceding lines ({fmt}).'
+				)
+			if parts:
+				previous = script[i - 1]['gap']
+				parts.append (audio.pcm_silence (fmt
+					, gap if previous is None else previous
+				))
+			parts.append (pcm)
+	finally:
+		for f in futures:
+			if f is None:
+				continue
+			# Wait for lines still in flight, before removing their files.
+			f.exception ()
+			if f.exception () is None:
+				pathlib.Path (f.result ()).unlink (missing_ok = True)
+
+	return fmt, b''.join (parts)
@@ -0,0 +1,750 @@
+"""Multi-voice routing.
+
+Routes synthesis requests carrying a voice selector to warm piper
+workers, one per voice model. Selectors are resolved through the
+installed voices of the whistle database.
+
+Loaded voices are kept in a pool bounded by a memory budget. When a voice
+which is not loaded yet gets requested and the budget is exhausted, the
+least recently used idle voice is stopped to make room. If all loaded
+voices are busy, the request waits until one of them becomes idle.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import time
+import uuid
+import select
+import pathlib
+import threading
+import collections
+import concurrent.futures
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import db
+from piper_whistle import audio
+from piper_whistle import cache
+from piper_whistle import scheduler
+from piper_whistle import text as whistle_text
+from piper_whistle import admission
+
+
+# Memory used by a piper process, besides its voice model.
+PROCESS_OVERHEAD = 32 << 20
+# onnxruntime needs noticeably more memory than the model file size.
+MODEL_MEMORY_FACTOR = 2.0
+DEFAULT_MEMORY_BUDGET = 1 << 30
+# Bytes of audio written at once, between checks for interruption.
+CHUNK_SIZE = 1 << 13
+
+
+def memory_estimate (model_path: str):
+	"""! Estimates memory needed by a piper process serving given model.
+	@param model_path Path to voice model (onnx).
+	@return Returns estimated number of bytes.
+	"""
+	try:
+		size = os.path.getsize (model_path)
+	except OSError:
+		size = 0
+	return PROCESS_OVERHEAD + int (size * MODEL_MEMORY_FACTOR)
+
+
+def process_rss (pid: int):
+	"""! Reads resident memory of a process (Linux only).
+	@param pid Process id.
+	@return Returns resident set size in bytes, or None if unknown.
+	"""
+	try:
+		with open (f'/proc/{pid}/status', 'r') as f:
+			for line in f:
+				if line.startswith ('VmRSS:'):
+					return int (line.split ()[1]) * 1024
+	except (OSError, ValueError, IndexError):
+		pass
+	return None
+
+
+class _Slot:
+	"""! A worker of a loaded voice within the pool."""
+	__slots__ = ('worker', 'estimate', 'inflight')
+
+	def __init__ (self, worker, estimate: int):
+		self.worker = worker
+		self.estimate = estimate
+		self.inflight = 0
+
+
+def _workers_stop (workers: list):
+	"""! Stops workers, emptying the list."""
+	while workers:
+		workers.pop ().stop ()
+
+
+class WorkerPool:
+	"""! Pool of warm workers, keyed by model path and evicted LRU.
+
+	The memory of a worker is its estimate (see memory_estimate), or the
+	resident memory of its process, whichever is larger. A single worker
+	is always admitted, even if it exceeds the budget on its own.
+
+	A voice may have up to workers_per_voice workers. Another one is
+	started when all workers of the voice are busy and it fits into the
+	budget as is (other voices are not evicted for it). Otherwise requests
+	queue up at the least busy worker of the voice.
+	"""
+	def __init__ (self, factory
+		, memory_budget: int = DEFAULT_MEMORY_BUDGET
+		, max_workers: int = 0
+		, workers_per_voice: int = 1
+	):
+		"""! Creates pool.
+		@param factory	Callable taking a model path and returning a
+						(not yet started) worker.PiperWorker.
+		@param memory_budget Bytes loaded voices may use in total.
+		@param max_workers Maximum number of workers. (0 for no limit)
+		@param workers_per_voice Maximum number of workers per voice.
+		"""
+		self.factory = factory
+		self.memory_budget = memory_budget
+		self.max_workers = max_workers
+		self.workers_per_voice = max (1, workers_per_voice)
+		self.evictions = 0
+		# Model path to list of slots, least recently used first.
+		self._voices = collections.OrderedDict ()
+		self._cond = threading.Condition ()
+
+	def _slots (self):
+		for group in self._voices.values ():
+			yield from group
+
+	def _cost (self, slot):
+		rss = process_rss (slot.worker.pid) if slot.worker.alive else None
+		return max (slot.estimate, rss or 0)
+
+	def _used (self):
+		return sum (self._cost (s) for s in self._slots ())
+
+	def _fits (self, estimate):
+		count = sum (1 for _ in self._slots ())
+		if 0 == count:
+			return True
+		if 0 < self.max_workers and self.max_workers <= count:
+			return False
+		return self._used () + estimate <= self.memory_budget
+
+	def _evict_one (self, to_stop: list):
+		"""! Takes the least recently used idle voice out of the pool.
+		@param to_stop List collecting workers to stop, once unlocked.
+		@return Returns True if a voice was evicted.
+		"""
+		for key, group in self._voices.items ():
+			if all (0 == slot.inflight for slot in group):
+				del self._voices[key]
+				holz.info (f'Evicting "{key}" ...')
+				to_stop += [slot.worker for slot in group]
+				self.evictions += 1
+				return True
+		return False
+
+	def _start (self, model_path, estimate):
+		holz.info (f'Loading "{model_path}" ...')
+		slot = _Slot (self.factory (model_path).start (), estimate)
+		self._voices.setdefault (model_path, []).append (slot)
+		return slot
+
+	def _prune (self, model_path, to_stop: list):
+		"""! Drops crashed workers of a voice, returning the others.
+		@param to_stop List collecting workers to stop, once unlocked.
+		"""
+		group = self._voices.get (model_path, [])
+		alive = []
+		for slot in group:
+			if slot.worker.alive:
+				alive.append (slot)
+				continue
+			holz.warn (
+				f'Worker of "{model_path}" exited '
+				f'({slot.worker.returncode}). Restarting ...'
+			)
+			to_stop.append (slot.worker)
+		if alive:
+			self._voices[model_path] = alive
+			self._voices.move_to_end (model_path)
+		elif group:
+			del self._voices[model_path]
+		return alive
+
+	@property
+	def used (self):
+		"""! Bytes currently accounted to loaded voices."""
+		with self._cond:
+			return self._used ()
+
+	def loaded (self):
+		"""! Lists model paths of loaded voices, least recently used first."""
+		with self._cond:
+			return list (self._voices.keys ())
+
+	def workers (self, model_path: str):
+		"""! Number of workers of given voice."""
+		with self._cond:
+			return len (self._voices.get (model_path, []))
+
+	def acquire (self, model_path: str, timeout: float = None):
+		"""! Fetches a worker of a model, starting one if necessary.
+
+		The worker counts as busy until @ref "release ()" is called.
+
+		@param model_path Path to voice model (onnx).
+		@param timeout	Seconds to wait for room in the pool.
+						(None waits forever)
+		@return Returns a started worker.PiperWorker.
+		@throws TimeoutError if no room could be made in time.
+		"""
+		deadline = None if timeout is None else time.monotonic () + timeout
+		# Workers taken out of the pool are stopped without holding the
+		# lock, as stopping waits for them to exit.
+		to_stop = []
+		try:
+			with self._cond:
+				while True:
+					group = self._prune (model_path, to_stop)
+					slot = min (group, key = lambda s: s.inflight, default = None)
+					if slot and 0 == slot.inflight:
+						break
+
+					estimate = memory_estimate (model_path)
+					if group:
+						if len (group) < self.workers_per_voice \
+							and self._fits (estimate):
+							slot = self._start (model_path, estimate)
+						break
+
+					while not self._fits (estimate) and self._evict_one (to_stop):
+						pass
+					if self._fits (estimate):
+						slot = self._start (model_path, estimate)
+						break
+
+					if to_stop:
+						self._cond.release ()
+						try:
+							_workers_stop (to_stop)
+						finally:
+							self._cond.acquire ()
+						continue
+
+					remaining = None
+					if deadline is not None:
+						remaining = deadline - time.monotonic ()
+						if 0 >= remaining:
+							raise TimeoutError (f'No room to load "{model_path}".')
+					self._cond.wait (remaining)
+
+				slot.inflight += 1
+				return slot.worker
+		finally:
+			_workers_stop (to_stop)
+
+	def release (self, model_path: str, w = None):
+		"""! Marks one request on a worker of given model as done.
+		@param model_path Path to voice model (onnx).
+		@param w The worker returned by @ref "acquire ()".
+		"""
+		with self._cond:
+			for slot in self._voices.get (model_path, []):
+				if (w is None or slot.worker is w) and 0 < slot.inflight:
+					slot.inflight -= 1
+					break
+			self._cond.notify_all ()
+
+	def stop (self):
+		"""! Stops all workers."""
+		with self._cond:
+			slots = list (self._slots ())
+			self._voices.clear ()
+			self._cond.notify_all ()
+		for slot in slots:
+			slot.worker.stop ()
+
+
+class Router:
+	"""! Dispatches requests to the pooled worker of their voice.
+
+	If a synthesis cache is given, requests are answered from it when
+	possible, and audio produced by piper is stored in it.
+
+	The real-time factor of requests piper worked on alone (not queued
+	behind others) is measured, and taken into the db when stopping.
+	"""
+	def __init__ (self, paths: dict, pool: WorkerPool
+		, synthesis_cache: cache.SynthesisCache = None
+		, settings: dict = None
+		, scratch_dir: str = None
+		, optimized: bool = False
+	):
+		"""! Creates router.
+		@param paths Paths map. Can be obtained via @ref "db.data_paths ()".
+		@param pool WorkerPool with workers running in request mode.
+		@param synthesis_cache Cache consulted before piper. (optional)
+		@param settings Map of piper settings, being part of cache keys.
+		@param scratch_dir	Directory for wav files of cache hits without
+							output_file. (required with a cache)
+		@param optimized Prefer optimised variants of models.
+		"""
+		self.paths = paths
+		self.pool = pool
+		self.cache = synthesis_cache
+		self.settings = settings or {}
+		self.scratch_dir = scratch_dir
+		self.optimized = optimized
+		self._resolved = {}
+		self._perf = collections.defaultdict (lambda: [0.0, 0])
+		self._lock = threading.Lock ()
+
+	def resolve (self, selector: str):
+		"""! Resolves selector to an installed model (cached once found).
+		@return Returns the map of @ref "db.model_resolve_selector ()".
+		"""
+		with self._lock:
+			m = self._resolved.get (selector, None)
+		if m is None:
+			m = db.model_resolve_selector (self.paths, selector
+				, optimized = self.optimized
+			)
+			if m['path']:
+				with self._lock:
+					self._resolved[selector] = m
+		return m
+
+	def submit (self, selector: str, text: str
+		, speaker = None
+		, output_file: str = None
+		, timeout: float = None
+	):
+		"""! Sends text to be spoken by the voice selected.
+		@param selector Voice identifying string.
+		@param text Text to be spoken.
+		@param speaker	Speaker id or name, overriding the one of the
+						selector. (optional)
+		@param output_file Path of the wav file to write. (optional)
+		@param timeout Seconds to wait for room in the pool.
+		@return Returns a concurrent.futures.Future resolving to the path
+				of the written wav file.
+		"""
+		future = concurrent.futures.Future ()
+		try:
+			m = self.resolve (selector)
+		except ValueError:
+			m = {'path': None}
+		if not m['path']:
+			future.set_exception (LookupError (f'No voice matches "{selector}".'))
+			return future
+
+		speaker = m['speaker'] if speaker is None else speaker
+		key = None
+		if self.cache:
+			key = cache.cache_key (text, pathlib.Path (m['path']).stem
+				, speaker, self.settings
+			)
+			dest = output_file or pathlib.Path (self.scratch_dir) \
+				.joinpath (f'cached-{uuid.uuid4 ().hex}.wav').as_posix ()
+			if self.cache.fetch (key, dest, link = not output_file):
+				future.set_result (dest)
+				return future
+
+		try:
+			w = self.pool.acquire (m['path'], timeout)
+		except TimeoutError as e:
+			future.set_exception (e)
+			return future
+
+		payload = {'text': text}
+		if str (speaker).isdigit ():
+			payload['speaker_id'] = int (speaker)
+		elif speaker:
+			payload['speaker'] = speaker
+		if output_file:
+			payload['output_file'] = output_file
+
+		# Measure piper at work only, not loading or busy with others.
+		alone = w.ready and 0 == w.pending
+		started = time.monotonic ()
+		answer = w.submit (payload)
+		answer.add_done_callback (lambda f: self.pool.release (m['path'], w))
+		if alone:
+			answer.add_done_callback (
+				lambda f: self._measure (m['path'], started, f)
+			)
+		if key is None:
+			return answer
+
+		def _store (f):
+			# Store before resolving, as callers may consume the file.
+			if f.exception () is not None:
+				future.set_exception (f.exception ())
+				return
+			self.cache.put (key, f.result (), link = not output_file)
+			future.set_result (f.result ())
+
+		answer.add_done_callback (_store)
+		return future
+
+	def submit_segmented (self, selector: str, text: str
+		, speaker = None
+		, output_file: str = None
+		, timeout: float = None
+	):
+		"""! Like @ref "submit ()", but synthesises text phrase by phrase.
+
+		Every phrase is a request of its own, so phrases are answered from
+		the cache individually and only uncached ones go to piper. Their
+		audio is stitched into one wav file, in the format configured for
+		the voice (see audio.voice_format).
+
+		@return Returns a concurrent.futures.Future resolving to the path
+				of the written wav file.
+		"""
+		phrases = whistle_text.phrases_split (text)
+		if 2 > len (phrases):
+			return self.submit (selector, text, speaker, output_file, timeout)
+
+		future = concurrent.futures.Future ()
+		try:
+			m = self.resolve (selector)
+		except ValueError:
+			m = {'path': None}
+		if not m['path']:
+			future.set_exception (LookupError (f'No voice matches "{selector}".'))
+			return future
+
+		fmt = audio.voice_format (m['path'])
+		dest = output_file or pathlib.Path (self.scratch_dir) \
+			.joinpath (f'stitched-{uuid.uuid4 ().hex}.wav').as_posix ()
+		parts = [
+			self.submit (selector, p, speaker, timeout = timeout)
+			for p in phrases
+		]
+		remaining = [len (parts)]
+		lock = threading.Lock ()
+
+		def _stitch (_):
+			with lock:
+				remaining[0] -= 1
+				if 0 < remaining[0]:
+					return
+			try:
+				fmt_used = fmt
+				pcms = []
+				for f in parts:
+					part_fmt, pcm = audio.wav_read (f.result ())
+					fmt_used = fmt_used or part_fmt
+					if part_fmt != fmt_used:
+						raise ValueError (
+							f'Phrase audio ({part_fmt}) does not match '
+							f'voice ({fmt_used}).'
+						)
+					pcms.append (pcm)
+				audio.wav_write (dest, fmt_used, audio.pcm_join (pcms, fmt_used))
+				future.set_result (dest)
+			except Exception as e:
+				future.set_exception (e)
+			finally:
+				for f in parts:
+					if f.exception () is None:
+						pathlib.Path (f.result ()).unlink (missing_ok = True)
+
+		for f in parts:
+			f.add_done_callback (_stitch)
+		return future
+
+	def _measure (self, model_path, started, f):
+		elapsed = time.monotonic () - started
+		if f.exception () is not None:
+			return
+		duration = audio.wav_duration (f.result ())
+		if not duration:
+			return
+		with self._lock:
+			entry = self._perf[pathlib.Path (model_path).stem]
+			entry[0] += elapsed / duration
+			entry[1] += 1
+
+	def perf_flush (self):
+		"""! Takes real-time factors measured so far into the db."""
+		with self._lock:
+			perf = dict (self._perf)
+			self._perf.clear ()
+		for key, (rtf_sum, samples) in perf.items ():
+			try:
+				rtf = db.perf_record (self.paths, key, rtf_sum / samples, samples)
+				holz.info (f'Real-time factor of {key}: {rtf:.3f}')
+			except OSError as e:
+				holz.warn (f'Could not record performance of {key}: {e}')
+
+	def stop (self):
+		self.pool.stop ()
+		self.perf_flush ()
+
+
+def _write_all (fd, data):
+	view = memoryview (data)
+	while view:
+		n = os.write (fd, view)
+		view = view[n:]
+
+
+def _request_parse (line: str, default_selector: str):
+	"""! Parses a payload line into a request map, or None if invalid."""
+	if line.startswith ('{'):
+		try:
+			j = json.loads (line)
+		except json.JSONDecodeError as e:
+			holz.warn (f'Skipping invalid payload: {e}')
+			return None
+	else:
+		j = {'text': line}
+	j.setdefault ('voice', default_selector)
+	if not j.get ('voice', None) or not j.get ('text', None):
+		holz.warn (f'Skipping payload without voice or text: {line}')
+		return None
+	return j
+
+
+class _Playback:
+	"""! Tracks what route plays, so more urgent requests preempt it.
+
+	Once a request more urgent than the one playing is queued, delivery
+	is restricted to requests at least as urgent, until all of them have
+	been delivered. If interruption is enabled, the utterance playing is
+	cut short as well.
+	"""
+	def __init__ (self, interrupt: bool = False):
+		self.interrupt = interrupt
+		self.playing = None
+		self.bound = None
+		self._cut = False
+		self._outstanding = collections.Counter ()
+		self._lock = threading.Lock ()
+
+	def queued (self, priority: int, interrupt: bool = False):
+		"""! Registers a queued piece.
+		@return Returns True if it preempts the piece playing.
+		"""
+		with self._lock:
+			self._outstanding[priority] += 1
+			if self.playing is None or self.playing <= priority:
+				return False
+			if self.bound is None or priority < self.bound:
+				self.bound = priority
+			self._cut = self._cut or self.interrupt or interrupt
+			return True
+
+	def admit (self, priority: int):
+		bound = self.bound
+		return bound is None or priority <= bound
+
+	def start (self, priority: int):
+		self.playing = priority
+
+	def done (self, priority: int):
+		with self._lock:
+			self._outstanding[priority] -= 1
+			self.playing = None
+			if self.bound is None:
+				return
+			if not any (self._outstanding[p] for p in range (self.bound + 1)):
+				self.bound = None
+				self._cut = False
+
+	def interrupted (self):
+		"""! Checks if the piece playing should be cut short."""
+		bound = self.bound
+		playing = self.playing
+		return self._cut and bound is not None \
+			and playing is not None and bound < playing
+
+
+def _deliver_one (future, keep, output_fd, playback):
+	try:
+		wav_path = future.result ()
+	except Exception as e:
+		holz.error (f'Request failed: {e}')
+		return
+	if keep:
+		return
+	try:
+		_, pcm = audio.wav_read (wav_path)
+		for offset in range (0, len (pcm), CHUNK_SIZE):
+			if playback.interrupted ():
+				holz.info ('Interrupted by a more urgent request.')
+				break
+			_write_all (output_fd, pcm[offset:offset + CHUNK_SIZE])
+	except OSError as e:
+		holz.error (f'Could not deliver "{wav_path}": {e}')
+	finally:
+		pathlib.Path (wav_path).unlink (missing_ok = True)
+
+
+def _deliver (dispatched, output_fd, window, playback):
+	"""! Writes audio of dispatched pieces to output, most urgent first."""
+	while True:
+		entry = dispatched.get (playback.admit)
+		if entry is None:
+			return
+		priority, _, (future, keep) = entry
+		playback.start (priority)
+		try:
+			_deliver_one (future, keep, output_fd, playback)
+		finally:
+			playback.done (priority)
+			window.release ()
+			dispatched.wake ()
+
+
+def _pieces (r, segmented):
+	"""! Splits a request into the pieces scheduled for synthesis.
+
+	Audio streamed to the output is requested sentence by sentence (or
+	phrase by phrase), so the first sentence plays while the next ones
+	are still being synthesised.
+	"""
+	piece = {
+		'voice': r['voice'],
+		'speaker': r.get ('speaker', None),
+		'output_file': r.get ('output_file', None),
+		'expires': r.get ('expires', None),
+		'segmented': segmented
+	}
+	if piece['output_file']:
+		yield dict (piece, text = r['text'])
+		return
+
+	split = whistle_text.sentences_split
+	if segmented:
+		split = whistle_text.phrases_split
+	for text in split (r['text']):
+		yield dict (piece, text = text)
+
+
+def _dispatch (router, scheduled, dispatched, window):
+	"""! Submits scheduled pieces, keeping at most window in flight."""
+	while True:
+		window.acquire ()
+		entry = scheduled.get ()
+		if entry is None:
+			dispatched.close ()
+			return
+		priority, seq, piece = entry
+		if admission.expired (piece):
+			# Expired while waiting for its turn.
+			holz.warn ('Skipping expired payload.')
+			future = concurrent.futures.Future ()
+			future.set_result (None)
+			dispatched.put (priority, (future, True), seq)
+			continue
+		submit = router.submit
+		if piece['output_file'] and piece['segmented']:
+			submit = router.submit_segmented
+		future = submit (piece['voice'], piece['text']
+			, speaker = piece['speaker']
+			, output_file = piece['output_file']
+		)
+		dispatched.put (priority, (future, bool (piece['output_file'])), seq)
+
+
+def route (router: Router, input_fd, output_fd
+	, default_selector: str = None
+	, stop_event = None
+	, interval: float = 0.25
+	, segmented: bool = False
+	, lookahead: int = 2
+	, interrupt: bool = False
+):
+	"""! Routes payload lines read from input_fd to the voices they select.
+
+	Lines are either JSON maps with text, voice, speaker, output_file,
+	priority and interrupt, or plain text spoken by the default voice.
+	Raw audio of requests without output_file is written to output_fd.
+	These are requested sentence by sentence, which lets several workers
+	of a voice (see WorkerPool) synthesise them in parallel.
+
+	Expired requests (see admission module) are skipped.
+
+	Requests are played in order of priority (see scheduler.PRIORITIES)
+	and arrival. Only lookahead pieces are handed to piper ahead of
+	playback, so urgent requests overtake all others not yet dispatched.
+
+	@param router Router to dispatch requests with.
+	@param input_fd File descriptor delivering payload lines.
+	@param output_fd File descriptor receiving raw audio.
+	@param default_selector Voice of requests not selecting one.
+	@param stop_event Optional threading.Event to stop routing.
+	@param interval Seconds between checks of stop_event.
+	@param segmented Synthesise (and cache) requests phrase by phrase.
+	@param lookahead Maximum number of pieces dispatched ahead.
+	@param interrupt	Cut the utterance playing short, when a more urgent
+						request arrives. (requests may ask for it as well)
+	@return Returns number of requests routed.
+	"""
+	count = 0
+	buffer = b''
+	scheduled = scheduler.Scheduler ()
+	dispatched = scheduler.Scheduler ()
+	window = threading.Semaphore (max (1, lookahead))
+	playback = _Playback (interrupt)
+	threads = [
+		threading.Thread (target = _dispatch
+			, args = (router, scheduled, dispatched, window)
+			, daemon = True
+		),
+		threading.Thread (target = _deliver
+			, args = (dispatched, output_fd, window, playback)
+			, daemon = True
+		)
+	]
+	for t in threads:
+		t.start ()
+	try:
+		while not (stop_event and stop_event.is_set ()):
+			ready, _, _ = select.select ([input_fd], [], [], interval)
+			if not ready:
+				continue
+			try:
+				data = os.read (input_fd, 1 << 16)
+			except BlockingIOError:
+				continue
+			if not data:
+				break
+			buffer += data
+			*lines, buffer = buffer.split (b'\n')
+			for raw in lines:
+				line = raw.decode ('utf-8', 'replace').strip ()
+				if not line:
+					continue
+				r = _request_parse (line, default_selector)
+				if r is None:
+					continue
+				if admission.expired (r):
+					holz.warn ('Skipping expired payload.')
+					continue
+				try:
+					priority = scheduler.priority_parse (r.get ('priority', None))
+				except ValueError as e:
+					holz.warn (f'Skipping payload: {e}')
+					continue
+				for piece in _pieces (r, segmented):
+					if playback.queued (priority, bool (r.get ('interrupt', False))):
+						holz.info (f'Preempting for priority {priority} ...')
+						dispatched.wake ()
+					scheduled.put (priority, piece)
+				count += 1
+	finally:
+		scheduled.close ()
+		for t in threads:
+			t.join ()
+
+	return count
@@ -0,0 +1,96 @@
+"""Priority scheduling of speak requests.
+
+Requests carry one of the priority classes below (lower value is more
+urgent). Within a class, requests keep their order of arrival.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import heapq
+import itertools
+import threading
+
+
+PRIORITIES = {
+	'critical': 0,
+	'high': 1,
+	'normal': 2,
+	'low': 3
+}
+DEFAULT_PRIORITY = 'normal'
+
+
+def priority_parse (value):
+	"""! Maps a priority class name (or number) to its value.
+	@param value Class name, number or None (for the default class).
+	@return Returns the priority value.
+	@throws ValueError if value is no known priority.
+	"""
+	if value is None:
+		return PRIORITIES[DEFAULT_PRIORITY]
+	if isinstance (value, str) and value in PRIORITIES:
+		return PRIORITIES[value]
+	p = int (value)
+	if p not in PRIORITIES.values ():
+		raise ValueError (f'Unknown priority "{value}".')
+	return p
+
+
+class Scheduler:
+	"""! Blocking priority queue, ordered by (priority, arrival)."""
+	def __init__ (self):
+		self._heap = []
+		self._seq = itertools.count ()
+		self._closed = False
+		self._cond = threading.Condition ()
+
+	def put (self, priority: int, item, seq: int = None):
+		"""! Queues item.
+		@param priority Priority value. (see priority_parse)
+		@param item Anything.
+		@param seq	Position within its priority class. Defaults to order
+					of arrival. Pass it on when moving items between
+					schedulers, to keep their relative order.
+		@return Returns seq of the item.
+		"""
+		if seq is None:
+			seq = next (self._seq)
+		with self._cond:
+			heapq.heappush (self._heap, (priority, seq, item))
+			self._cond.notify ()
+		return seq
+
+	def _ready (self, admit):
+		if not self._heap:
+			return False
+		return admit is None or admit (self._heap[0][0]) or self._closed
+
+	def get (self, admit = None):
+		"""! Waits for the most urgent item.
+		@param admit	Optional callable taking a priority and returning
+						True if items of it may be taken now. Call
+						@ref "wake ()" when its answer changes.
+		@return Returns a touple of (priority, seq, item), or None once
+				closed and empty.
+		"""
+		with self._cond:
+			while not self._ready (admit) and not (
+				self._closed and not self._heap
+			):
+				self._cond.wait ()
+			if not self._heap:
+				return None
+			return heapq.heappop (self._heap)
+
+	def wake (self):
+		"""! Lets waiting getters re-evaluate their admit callable."""
+		with self._cond:
+			self._cond.notify_all ()
+
+	def close (self):
+		"""! Lets get return None, once all queued items are taken."""
+		with self._cond:
+			self._closed = True
+			self._cond.notify_all ()
+
+	def __len__ (self):
+		with self._cond:
+			return len (self._heap)
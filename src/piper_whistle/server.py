@@ -0,0 +1,311 @@
+"""Local synthesis API.
+
+Asyncio HTTP server, listening on localhost and / or a Unix socket, which
+returns the audio of a request to its caller. Text is split into
+sentences, which are synthesised in order by the pooled worker of the
+selected voice (see router). Audio of each sentence is streamed back as
+soon as it is done, using chunked transfer encoding, so callers get their
+first audio after the first sentence instead of the whole text.
+
+Endpoints:
+
+* GET /health: Answers "ok".
+* GET|POST /synthesize: Parameters text, voice, speaker and format
+	(wav or raw) are taken from the query string and / or a JSON body.
+	Raw responses are 16bit PCM, with the sample rate in the
+	X-Sample-Rate header.
+
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import sys
+import json
+import time
+import asyncio
+import pathlib
+import urllib.parse
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import audio
+from piper_whistle import text as whistle_text
+
+
+DEFAULT_LISTEN = '127.0.0.1:5050'
+CHUNK_SIZE = 1 << 13
+MAX_BODY_SIZE = 1 << 20
+AUDIO_FORMATS = ('wav', 'raw')
+_REASONS = {
+	200: 'OK',
+	400: 'Bad Request',
+	404: 'Not Found',
+	405: 'Method Not Allowed',
+	413: 'Payload Too Large',
+	500: 'Internal Server Error',
+	503: 'Service Unavailable'
+}
+
+
+class HttpError (Exception):
+	"""! Error answered with given HTTP status."""
+	def __init__ (self, status: int, message: str):
+		super ().__init__ (message)
+		self.status = status
+
+
+def listen_parse (listen: str):
+	"""! Splits a listen address in the form [HOST:]PORT.
+	@return Returns a touple of (host, port).
+	"""
+	host, _, port = listen.rpartition (':')
+	return (host or '127.0.0.1'), int (port)
+
+
+async def _request_read (reader):
+	"""! Reads a HTTP request.
+	@return Returns a touple of (method, target, headers, body).
+	"""
+	line = await reader.readline ()
+	parts = line.decode ('latin-1').split ()
+	if 3 != len (parts):
+		raise HttpError (400, 'Malformed request line.')
+	method, target, _ = parts
+
+	headers = {}
+	while True:
+		line = await reader.readline ()
+		if line in (b'\r\n', b'\n', b''):
+			break
+		name, _, value = line.decode ('latin-1').partition (':')
+		headers[name.strip ().lower ()] = value.strip ()
+
+	try:
+		size = int (headers.get ('content-length', 0) or 0)
+	except ValueError:
+		size = -1
+	if 0 > size:
+		raise HttpError (400, 'Invalid Content-Length.')
+	if MAX_BODY_SIZE < size:
+		raise HttpError (413, 'Request body too large.')
+	body = await reader.readexactly (size) if 0 < size else b''
+
+	return method.upper (), target, headers, body
+
+
+def _head (status: int, headers: dict):
+	lines = [f'HTTP/1.1 {status} {_REASONS.get (status, "")}']
+	lines += [f'{k}: {v}' for k, v in headers.items ()]
+	return ('\r\n'.join (lines) + '\r\n\r\n').encode ('latin-1')
+
+
+async def _respond (writer, status: int, body: str):
+	data = (body + '\n').encode ('utf-8')
+	writer.write (_head (status, {
+		'Content-Type': 'text/plain; charset=utf-8',
+		'Content-Length': len (data),
+		'Connection': 'close'
+	}) + data)
+	await writer.drain ()
+
+
+def _chunk (data: bytes):
+	return f'{len (data):x}\r\n'.encode ('latin-1') + data + b'\r\n'
+
+
+def _discard (futures):
+	"""! Removes wav files of requests nobody is waiting for anymore."""
+	def _unlink (f):
+		if not f.cancelled () and f.exception () is None:
+			pathlib.Path (f.result ()).unlink (missing_ok = True)
+	for f in futures:
+		f.add_done_callback (_unlink)
+
+
+class SynthesisServer:
+	"""! Serves synthesis requests via a router.Router."""
+	def __init__ (self, router, default_selector: str = None
+		, timeout: float = None
+		, segmented: bool = False
+	):
+		"""! Creates server.
+		@param router Router dispatching to pooled request mode workers.
+		@param default_selector Voice of requests not selecting one.
+		@param timeout Seconds a request may wait for room in the pool.
+		@param segmented	Synthesise (and cache) phrases instead of whole
+							sentences.
+		"""
+		self.router = router
+		self.default_selector = default_selector
+		self.timeout = timeout
+		self.segmented = segmented
+		self.addresses = []
+		self._servers = []
+
+	def _submit_all (self, selector, sentences, speaker):
+		return [
+			self.router.submit (selector, s
+				, speaker = speaker
+				, timeout = self.timeout
+			)
+			for s in sentences
+		]
+
+	def _params (self, method, target, headers, body):
+		url = urllib.parse.urlsplit (target)
+		if '/health' == url.path:
+			return None
+		if '/synthesize' != url.path:
+			raise HttpError (404, f'Unknown endpoint "{url.path}".')
+		if method not in ('GET', 'POST'):
+			raise HttpError (405, f'Method {method} not allowed.')
+
+		params = {
+			k: v[0] for k, v in urllib.parse.parse_qs (url.query).items ()
+		}
+		if body:
+			try:
+				j = json.loads (body)
+			except json.JSONDecodeError as e:
+				raise HttpError (400, f'Invalid JSON body: {e}')
+			if not isinstance (j, dict):
+				raise HttpError (400, 'JSON body must be a map.')
+			params.update (j)
+
+		params.setdefault ('voice', self.default_selector)
+		params.setdefault ('format', 'wav')
+		if not params.get ('text', None):
+			raise HttpError (400, 'No text given.')
+		if not params['voice']:
+			raise HttpError (400, 'No voice given.')
+		if params['format'] not in AUDIO_FORMATS:
+			raise HttpError (400, f'Unknown format "{params["format"]}".')
+
+		return params
+
+	async def _stream (self, writer, params):
+		"""! Synthesises sentences and streams their audio in order."""
+		started = time.monotonic ()
+		loop = asyncio.get_running_loop ()
+		split = whistle_text.sentences_split
+		if self.segmented:
+			split = whistle_text.phrases_split
+		sentences = split (params['text'])
+		if not sentences:
+			raise HttpError (400, 'No text given.')
+		futures = await loop.run_in_executor (None, self._submit_all
+			, params['voice'], sentences, params.get ('speaker', None)
+		)
+
+		i = 0
+		sent_head = False
+		try:
+			for i, f in enumerate (futures):
+				try:
+					wav_path = await asyncio.wrap_future (f)
+				except LookupError as e:
+					raise HttpError (404, str (e))
+				except TimeoutError as e:
+					raise HttpError (503, str (e))
+				except RuntimeError as e:
+					raise HttpError (500, str (e))
+
+				try:
+					fmt, pcm = await loop.run_in_executor (None
+						, audio.wav_read, wav_path
+					)
+				finally:
+					pathlib.Path (wav_path).unlink (missing_ok = True)
+
+				if not sent_head:
+					content_type = 'audio/wav'
+					if 'raw' == params['format']:
+						content_type = \
+							f'audio/L{fmt.sample_width * 8};rate={fmt.sample_rate}'
+					writer.write (_head (200, {
+						'Content-Type': content_type,
+						'X-Sample-Rate': fmt.sample_rate,
+						'X-Sentences': len (sentences),
+						'Transfer-Encoding': 'chunked',
+						'Connection': 'close'
+					}))
+					if 'wav' == params['format']:
+						writer.write (_chunk (audio.wav_header (fmt)))
+					sent_head = True
+					holz.info (
+						f'First audio after '
+						f'{(time.monotonic () - started) * 1000:.0f}ms.'
+					)
+
+				for offset in range (0, len (pcm), CHUNK_SIZE):
+					writer.write (_chunk (pcm[offset:offset + CHUNK_SIZE]))
+					await writer.drain ()
+		except BaseException:
+			_discard (futures[i:])
+			if sent_head:
+				# Too late for an error status. Abort the chunked stream.
+				holz.error ('Aborting response after partial audio.')
+				return
+			raise
+
+		writer.write (b'0\r\n\r\n')
+		await writer.drain ()
+		holz.info (
+			f'Spoke {len (sentences)} sentences in '
+			f'{(time.monotonic () - started) * 1000:.0f}ms.'
+		)
+
+	async def _handle (self, reader, writer):
+		try:
+			try:
+				request = await _request_read (reader)
+				params = self._params (*request)
+				if params is None:
+					await _respond (writer, 200, 'ok')
+				else:
+					await self._stream (writer, params)
+			except HttpError as e:
+				holz.warn (f'Request failed ({e.status}): {e}')
+				await _respond (writer, e.status, str (e))
+		except (ConnectionError, asyncio.IncompleteReadError) as e:
+			holz.debug (f'Connection lost: {e}')
+		except Exception as e:
+			holz.error (f'Request failed: {e}')
+		finally:
+			writer.close ()
+
+	async def start (self, listen: str = None, socket_path: str = None):
+		"""! Starts listening.
+		@param listen Address in the form [HOST:]PORT. (optional)
+		@param socket_path Path of Unix socket to create. (optional)
+		"""
+		if listen:
+			host, port = listen_parse (listen)
+			s = await asyncio.start_server (self._handle, host, port)
+			self._servers.append (s)
+			for sock in s.sockets:
+				self.addresses.append (sock.getsockname ())
+		if socket_path:
+			pathlib.Path (socket_path).unlink (missing_ok = True)
+			s = await asyncio.start_unix_server (self._handle, socket_path)
+			self._servers.append (s)
+			self.addresses.append (socket_path)
+		for address in self.addresses:
+			holz.info (f'Listening on {address} ...')
+
+	async def close (self):
+		for s in self._servers:
+			s.close ()
+			await s.wait_closed ()
+		self._servers = []
+
+	async def run (self, stop_event: asyncio.Event
+		, listen: str = None
+		, socket_path: str = None
+	):
+		"""! Serves until stop_event is set."""
+		await self.start (listen, socket_path)
+		try:
+			await stop_event.wait ()
+		finally:
+			await self.close ()
+			if socket_path:
+				pathlib.Path (socket_path).unlink (missing_ok = True)
@@ -0,0 +1,56 @@
+"""Text segmentation.
+
+Splits text into sentences, so long texts can be synthesised piece by
+piece and their audio delivered as soon as the first piece is done.
+Sentences may be split further into phrases, at clause punctuation, so
+recurring parts of templated prompts are synthesised (and cached) once.
+Bursts of short texts may be joined into one, to be synthesised at once.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import re
+
+
+# Sentence ends at terminal punctuation followed by whitespace, or at
+# line breaks.
+_SENTENCE_BREAK = re.compile (r'(?<=[.!?…。！？])\s+|\s*\n\s*')
+# Phrases end at clause punctuation followed by whitespace.
+_PHRASE_BREAK = re.compile (r'(?<=[,;:，；：])\s+')
+_SENTENCE_END = re.compile (r'[.!?…。！？]["\')»”]*$')
+
+
+def sentences_split (text: str):
+	"""! Splits text into sentences.
+	@param text Text to split.
+	@return Returns a list of non-empty, stripped sentences.
+	"""
+	return [s.strip () for s in _SENTENCE_BREAK.split (text) if s.strip ()]
+
+
+def phrases_split (text: str):
+	"""! Splits text into phrases (sentences split at clause punctuation).
+	@param text Text to split.
+	@return Returns a list of non-empty, stripped phrases.
+	"""
+	return [
+		p.strip ()
+		for s in sentences_split (text)
+		for p in _PHRASE_BREAK.split (s)
+		if p.strip ()
+	]
+
+
+def sentences_join (texts):
+	"""! Joins texts into one, keeping each a sentence of its own.
+	@param texts Iterable of texts.
+	@return Returns the texts, ended with terminal punctuation (if they
+			have none) and separated by spaces.
+	"""
+	joined = []
+	for t in texts:
+		t = t.strip ()
+		if not t:
+			continue
+		if not _SENTENCE_END.search (t):
+			t += '.'
+		joined.append (t)
+	return ' '.join (joined)
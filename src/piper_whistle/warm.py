@@ -0,0 +1,111 @@
+"""Model warming and pinning.
+
+Piper's cold start is dominated by reading the voice model from disk.
+Warming asks the kernel to read models into the page cache ahead of
+time (posix_fadvise / madvise with WILLNEED), and reads them through,
+so the next piper start finds them in memory.
+
+Pinning copies models (and their configuration) to a tmpfs, e.g.
+/dev/shm. The whistle database then resolves selectors of pinned voices
+to the copy, so every piper started or restarted by whistle loads from
+memory, regardless of page cache pressure. Pinned copies vanish with a
+reboot, after which the installed models are used again.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import mmap
+import shutil
+import pathlib
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import db
+
+
+DEFAULT_PIN_ROOT = '/dev/shm/piper-whistle'
+READ_SIZE = 1 << 20
+
+
+def prefetch (path: str, read: bool = True):
+	"""! Brings a file into the page cache.
+	@param path Path to file.
+	@param read	Read the file through, so it is cached once this returns.
+				Otherwise the kernel only gets advised to read ahead.
+	@return Returns the size of the file in bytes.
+	"""
+	fd = os.open (path, os.O_RDONLY)
+	try:
+		size = os.fstat (fd).st_size
+		if hasattr (os, 'posix_fadvise'):
+			os.posix_fadvise (fd, 0, size, os.POSIX_FADV_WILLNEED)
+		elif 0 < size and hasattr (mmap, 'MADV_WILLNEED'):
+			with mmap.mmap (fd, size, access = mmap.ACCESS_READ) as m:
+				m.madvise (mmap.MADV_WILLNEED)
+		if read:
+			while os.read (fd, READ_SIZE):
+				pass
+	finally:
+		os.close (fd)
+	return size
+
+
+def model_files (model_path: str):
+	"""! Lists files piper reads when loading a model.
+	@return Returns the model path and (if present) its config path.
+	"""
+	files = [model_path]
+	config_path = f'{model_path}.json'
+	if pathlib.Path (config_path).exists ():
+		files.append (config_path)
+	return files
+
+
+def pin (paths, model: dict, pin_root: str = DEFAULT_PIN_ROOT):
+	"""! Copies a model to pin_root and records it as pinned.
+	@param paths Paths map. Can be obtained via @ref "db.data_paths ()".
+	@param model Installed model map. (see db.query_installed)
+	@param pin_root Directory on a tmpfs to hold pinned models.
+	@return Returns the path of the pinned model.
+	@throws OSError if copying fails.
+	"""
+	pinned_dir = pathlib.Path (pin_root).joinpath (model['key'])
+	pinned_dir.mkdir (parents = True, exist_ok = True)
+	for src in model_files (model['path']):
+		dest = pinned_dir.joinpath (pathlib.Path (src).name)
+		tmp = dest.with_name (f'.{dest.name}.{os.getpid ()}.tmp')
+		try:
+			shutil.copyfile (src, tmp)
+			os.replace (tmp, dest)
+		finally:
+			tmp.unlink (missing_ok = True)
+
+	pinned_path = pinned_dir.joinpath (pathlib.Path (model['path']).name)
+	pins = db.pins_load (paths)
+	pins[model['key']] = pinned_path.as_posix ()
+	db.pins_save (paths, pins)
+	holz.debug (f'Pinned {model["key"]} at "{pinned_path}".')
+	return pinned_path.as_posix ()
+
+
+def unpin (paths, key: str):
+	"""! Removes the pinned copy of a model.
+	@param paths Paths map. Can be obtained via @ref "db.data_paths ()".
+	@param key Voice key. (e.g. en_GB-alba-medium)
+	@return Returns True if the model was pinned.
+	"""
+	pins = db.pins_load (paths)
+	pinned_path = pins.pop (key, None)
+	if pinned_path is None:
+		return False
+
+	pinned_dir = pathlib.Path (pinned_path).parent
+	for p in model_files (pinned_path):
+		pathlib.Path (p).unlink (missing_ok = True)
+	try:
+		pinned_dir.rmdir ()
+	except OSError:
+		pass
+	db.pins_save (paths, pins)
+	holz.debug (f'Unpinned {key}.')
+	return True
@@ -0,0 +1,521 @@
+"""Piper worker processes.
+
+Keeps piper running with a loaded voice, instead of starting it for
+every payload. A worker either streams raw audio to a given output
+(e.g. an output channel read by aplay), or answers requests by writing
+each utterance to a wav file and reporting the path back.
+
+Bursts of short payloads may be coalesced into one, saving piper calls.
+
+The supervisor restarts crashed workers with exponential backoff and
+exposes readiness via a ready file, containing the pid of the worker.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import time
+import shlex
+import select
+import pathlib
+import threading
+import subprocess
+import collections
+import concurrent.futures
+# Append root package to path so it can be called with absolute path.
+sys.path.append (str (pathlib.Path(__file__).resolve().parents[1]))
+from piper_whistle import holz
+from piper_whistle import text as whistle_text
+from piper_whistle import admission
+from piper_whistle import placement
+
+
+# Piper logs this (to stderr), once the voice model has been loaded.
+READY_MARKER = 'Loaded voice'
+# Default piper executable, unless overridden via environment.
+DEFAULT_PIPER = os.environ.get ('PIPER_PATH', 'piper')
+# Most characters of text joined into one payload by coalescing.
+COALESCE_MAX_TEXT = 1000
+
+
+def piper_command_build (piper, model_path
+	, output_dir = None
+	, speaker = None
+	, extra_args = None
+):
+	"""! Builds parameter list to run piper with JSON input.
+	@param piper Piper executable. Either a path / command string or a list.
+	@param model_path Path to voice model (onnx).
+	@param output_dir	If set, piper writes wav files there and prints
+						their path. Otherwise streams raw audio to stdout.
+	@param speaker Default speaker id. (optional)
+	@param extra_args Additional parameters passed on to piper. (optional)
+	@return Returns a list of parameters.
+	"""
+	params = shlex.split (piper) if isinstance (piper, str) else list (piper)
+	params += ['-m', model_path, '--json-input']
+	if output_dir:
+		params += ['--output_dir', output_dir]
+	else:
+		params += ['--output_raw']
+	if speaker:
+		params += ['-s', str (speaker)]
+	if extra_args:
+		params += list (extra_args)
+
+	return params
+
+
+class PiperWorker:
+	"""! A long-lived piper process.
+
+	If no stdout is given, the worker runs in request mode: payloads are
+	submitted via submit (), which returns a future resolved with the
+	line piper prints once it is done (the wav file path when piper runs
+	with --output_dir or the payload carries an output_file).
+	"""
+	def __init__ (self, params: list
+		, stdout = None
+		, env: dict = None
+		, name: str = None
+		, cpus: set = None
+	):
+		"""! Creates worker.
+		@param params Parameters to run piper with. (see piper_command_build)
+		@param stdout File (descriptor) piper streams raw audio to.
+		@param env Environment of piper. (defaults to whistle's)
+		@param name Name used in logs.
+		@param cpus CPUs to pin piper to. (see placement module)
+		"""
+		self.params = list (params)
+		self.stdout = stdout
+		self.env = env
+		self.cpus = cpus
+		self.name = name or pathlib.Path (self.params[0]).name
+		self.process = None
+		self.started_at = None
+		self.ready_at = None
+		self._ready = threading.Event ()
+		self._lock = threading.Lock ()
+		self._pending = collections.deque ()
+		self._threads = []
+
+	@property
+	def pid (self):
+		return self.process.pid if self.process else None
+
+	@property
+	def returncode (self):
+		return self.process.poll () if self.process else None
+
+	@property
+	def alive (self):
+		return self.process is not None and self.process.poll () is None
+
+	@property
+	def ready (self):
+		return self.alive and self._ready.is_set ()
+
+	@property
+	def pending (self):
+		"""! Number of submitted payloads piper has not answered yet."""
+		with self._lock:
+			return len (self._pending)
+
+	@property
+	def load_time (self):
+		"""! Seconds it took to become ready, or None."""
+		if self.ready_at is None:
+			return None
+		return self.ready_at - self.started_at
+
+	def start (self):
+		"""! Spawns piper process."""
+		holz.debug (f'Running external program: {self.params}')
+		self._ready.clear ()
+		self.ready_at = None
+		self.started_at = time.monotonic ()
+		self.process = subprocess.Popen (self.params
+			, bufsize = 0
+			, stdin = subprocess.PIPE
+			, stdout = self.stdout if self.stdout else subprocess.PIPE
+			, stderr = subprocess.PIPE
+			, env = self.env
+		)
+		if self.cpus:
+			placement.affinity_apply (self.pid, self.cpus)
+		self._threads = [
+			threading.Thread (target = self._watch_stderr, daemon = True)
+		]
+		if not self.stdout:
+			self._threads.append (
+				threading.Thread (target = self._watch_stdout, daemon = True)
+			)
+		for t in self._threads:
+			t.start ()
+
+		return self
+
+	def _watch_stderr (self):
+		for raw in iter (self.process.stderr.readline, b''):
+			line = raw.decode ('utf-8', 'replace').rstrip ()
+			holz.debug (f'[{self.name}:{self.pid}] {line}')
+			if not self._ready.is_set () and READY_MARKER in line:
+				self.ready_at = time.monotonic ()
+				if self.cpus:
+					# Pins threads piper started while loading, as well.
+					placement.affinity_apply (self.pid, self.cpus)
+				self._ready.set ()
+
+	def _watch_stdout (self):
+		for raw in iter (self.process.stdout.readline, b''):
+			line = raw.decode ('utf-8', 'replace').strip ()
+			with self._lock:
+				future = self._pending.popleft () if self._pending else None
+			if future:
+				future.set_result (line)
+			else:
+				holz.debug (f'[{self.name}:{self.pid}] Unexpected: {line}')
+		self._fail_pending (f'{self.name} exited ({self.returncode}).')
+
+	def _fail_pending (self, message):
+		with self._lock:
+			pending = list (self._pending)
+			self._pending.clear ()
+		for future in pending:
+			if not future.done ():
+				future.set_exception (RuntimeError (message))
+
+	def wait_ready (self, timeout = None):
+		"""! Waits until piper has loaded its voice.
+		@return Returns True if worker is ready.
+		"""
+		deadline = None if timeout is None else time.monotonic () + timeout
+		while self.alive:
+			remaining = 0.1
+			if deadline is not None:
+				remaining = min (remaining, deadline - time.monotonic ())
+				if 0 >= remaining:
+					break
+			if self._ready.wait (remaining):
+				return self.alive
+		return False
+
+	def _write (self, payload):
+		if isinstance (payload, dict):
+			payload = json.dumps (payload)
+		data = payload.rstrip ('\n').encode ('utf-8') + b'\n'
+		self.process.stdin.write (data)
+		self.process.stdin.flush ()
+
+	def send (self, payload):
+		"""! Sends a payload (JSON string or map) without waiting for it.
+		@return Returns True if the payload was handed to piper.
+		"""
+		if not self.alive:
+			return False
+		try:
+			with self._lock:
+				self._write (payload)
+			return True
+		except (BrokenPipeError, OSError) as e:
+			holz.warn (f'Could not send to {self.name}: {e}')
+			return False
+
+	def submit (self, payload):
+		"""! Sends a payload and returns a future for piper's answer.
+
+		Only available in request mode (no stdout given).
+
+		@return Returns a concurrent.futures.Future resolving to the line
+				piper printed for this payload.
+		"""
+		future = concurrent.futures.Future ()
+		if self.stdout or not self.alive:
+			future.set_exception (RuntimeError (f'{self.name} not available.'))
+			return future
+		try:
+			with self._lock:
+				self._pending.append (future)
+				self._write (payload)
+		except (BrokenPipeError, OSError) as e:
+			self._fail_pending (f'Could not send to {self.name}: {e}')
+		return future
+
+	def stop (self, timeout = 5.0):
+		"""! Closes piper's input and waits for it to exit (or kills it).
+		@return Returns the exit code.
+		"""
+		if not self.process:
+			return None
+		try:
+			self.process.stdin.close ()
+		except OSError:
+			pass
+		try:
+			self.process.wait (timeout)
+		except subprocess.TimeoutExpired:
+			holz.warn (f'{self.name} did not exit in time. Killing it ...')
+			self.process.kill ()
+			self.process.wait ()
+		for t in self._threads:
+			t.join (timeout)
+		for stream in (self.process.stdout, self.process.stderr):
+			if stream:
+				stream.close ()
+		self._fail_pending (f'{self.name} stopped.')
+		holz.debug (f'Exit with {self.process.returncode}')
+		return self.process.returncode
+
+
+class Supervisor:
+	"""! Keeps a worker running, restarting it when it crashes.
+
+	Payloads sent while the worker is down are held back and delivered
+	in order once a new worker is up.
+	"""
+	def __init__ (self, factory
+		, ready_path: str = None
+		, backoff_min: float = 0.5
+		, backoff_max: float = 30.0
+	):
+		self.factory = factory
+		self.ready_path = ready_path
+		self.backoff_min = backoff_min
+		self.backoff_max = backoff_max
+		self.worker = None
+		self.restarts = 0
+		self._backoff = backoff_min
+		self._next_start = 0.0
+		self._held = collections.deque ()
+		self._ready_written = False
+
+	@property
+	def ready (self):
+		return self.worker is not None and self.worker.ready
+
+	@property
+	def held (self):
+		"""! Number of payloads waiting for a ready worker."""
+		return len (self._held)
+
+	def _ready_mark (self, ready):
+		if not self.ready_path or ready == self._ready_written:
+			return
+		p = pathlib.Path (self.ready_path)
+		if ready:
+			p.write_text (f'{self.worker.pid}\n')
+			holz.info (f'Worker {self.worker.pid} ready.')
+		elif p.exists ():
+			p.unlink ()
+		self._ready_written = ready
+
+	def check (self):
+		"""! Detects crashes, restarts worker and delivers held payloads.
+		@return Returns True if the worker is ready.
+		"""
+		now = time.monotonic ()
+		if self.worker and not self.worker.alive:
+			holz.warn (
+				f'Worker {self.worker.pid} exited '
+				f'({self.worker.returncode}). '
+				f'Restarting in {self._backoff:.1f}s ...'
+			)
+			self.worker.stop ()
+			self.worker = None
+			self._ready_mark (False)
+			self._next_start = now + self._backoff
+			self._backoff = min (self._backoff * 2, self.backoff_max)
+			self.restarts += 1
+
+		if self.worker is None and now >= self._next_start:
+			self.worker = self.factory ().start ()
+
+		if self.ready:
+			# Worker proved healthy, so reset backoff.
+			self._backoff = self.backoff_min
+			self._ready_mark (True)
+			while self._held and self.worker.send (self._held[0]):
+				self._held.popleft ()
+
+		return self.ready
+
+	def send (self, payload):
+		"""! Sends payload, holding it back while no worker is ready."""
+		if self._held or not self.check () or not self.worker.send (payload):
+			self._held.append (payload)
+
+	def stop (self):
+		if self.worker:
+			self.worker.stop ()
+			self.worker = None
+		self._ready_mark (False)
+
+
+class Coalescer:
+	"""! Merges bursts of compatible payloads into one.
+
+	Payloads differing in their text only (same voice, speaker, output
+	and so on) are joined, as long as they arrive within a window after
+	the first one. Piper then synthesises them in one go. Their audio
+	still follows in order of arrival, but as the audio of one payload:
+	it is not split up by the payloads merged again. The merged payload
+	expires with the last of them. (see admission module)
+
+	Payloads writing an output file of their own and lines which are no
+	JSON map are passed on as they are.
+	"""
+	def __init__ (self, window: float, max_text: int = COALESCE_MAX_TEXT):
+		"""! Creates coalescer.
+		@param window Seconds to wait for further payloads.
+		@param max_text Most characters of text in one merged payload.
+		"""
+		self.window = window
+		self.max_text = max_text
+		self.merged = 0
+		self.deadline = None
+		self._payload = None
+		self._texts = []
+		self._expires = []
+
+	@staticmethod
+	def _parse (line):
+		try:
+			payload = json.loads (line)
+		except ValueError:
+			return None
+		if not isinstance (payload, dict) or 'output_file' in payload:
+			return None
+		if not isinstance (payload.get ('text'), str):
+			return None
+		return payload
+
+	@staticmethod
+	def _compatible (a, b):
+		def _rest (p):
+			return {k: v for k, v in p.items () if k not in ('text', 'expires')}
+		return _rest (a) == _rest (b)
+
+	def add (self, line: str, now: float):
+		"""! Takes a payload line.
+		@param line Payload line.
+		@param now Current time. (time.monotonic)
+		@return Returns list of payload lines ready to be sent.
+		"""
+		payload = self._parse (line)
+		if payload is None:
+			return self.flush () + [line]
+
+		ready = []
+		if self._payload is not None and (
+			not self._compatible (self._payload, payload)
+			or self.max_text < sum (map (len, self._texts + [payload['text']]))
+		):
+			ready = self.flush ()
+		if self._payload is None:
+			self._payload = payload
+			self.deadline = now + self.window
+		else:
+			self.merged += 1
+		self._texts.append (payload['text'])
+		self._expires.append (payload.get ('expires', None))
+		return ready + self.due (now)
+
+	def due (self, now: float):
+		"""! Flushes the merged payload, once its window has passed.
+		@return Returns list of payload lines ready to be sent.
+		"""
+		if self.deadline is None or now < self.deadline:
+			return []
+		return self.flush ()
+
+	def flush (self):
+		"""! Ends merging into the current payload.
+		@return Returns list of payload lines ready to be sent.
+		"""
+		if self._payload is None:
+			return []
+		payload = dict (self._payload)
+		if 1 < len (self._texts):
+			payload['text'] = whistle_text.sentences_join (self._texts)
+			# Payloads without expiry never expire, nor does their merger.
+			payload.pop ('expires', None)
+			if None not in self._expires:
+				payload['expires'] = max (self._expires)
+		self._payload = None
+		self._texts = []
+		self._expires = []
+		self.deadline = None
+		return [json.dumps (payload, ensure_ascii = False)]
+
+
+def serve (supervisor, input_fd, stop_event = None, interval = 0.25
+	, coalesce: float = 0.0
+):
+	"""! Forwards payload lines read from input_fd to a supervised worker.
+
+	Runs until input_fd reaches its end or stop_event is set. Expired
+	payloads (see admission module) are skipped.
+
+	@param supervisor Supervisor keeping the worker alive.
+	@param input_fd File descriptor delivering payload lines.
+	@param stop_event Optional threading.Event to stop serving.
+	@param interval Seconds between health checks.
+	@param coalesce	Seconds to wait for further payloads to merge with.
+					(see Coalescer, 0 to forward every payload on its own)
+	@return Returns number of payloads forwarded.
+	"""
+	count = 0
+	expired = 0
+	buffer = b''
+	coalescer = Coalescer (coalesce) if 0 < coalesce else None
+	supervisor.check ()
+	while not (stop_event and stop_event.is_set ()):
+		timeout = interval
+		if coalescer and coalescer.deadline is not None:
+			timeout = max (0, min (timeout
+				, coalescer.deadline - time.monotonic ()
+			))
+		ready, _, _ = select.select ([input_fd], [], [], timeout)
+		supervisor.check ()
+		lines = []
+		if ready:
+			try:
+				data = os.read (input_fd, 1 << 16)
+			except BlockingIOError:
+				data = None
+			if data == b'':
+				break
+			if data:
+				buffer += data
+				*lines, buffer = buffer.split (b'\n')
+		now = time.monotonic ()
+		outgoing = []
+		for line in lines:
+			if not line.strip ():
+				continue
+			line = line.decode ('utf-8', 'replace')
+			if admission.line_expired (line):
+				expired += 1
+				continue
+			count += 1
+			outgoing += coalescer.add (line, now) if coalescer else [line]
+		if coalescer:
+			outgoing += coalescer.due (now)
+		for line in outgoing:
+			supervisor.send (line)
+
+	if coalescer:
+		for line in coalescer.flush ():
+			supervisor.send (line)
+		if coalescer.merged:
+			holz.info (f'Merged {coalescer.merged} payloads into others.')
+	if expired:
+		holz.warn (f'Skipped {expired} expired payloads.')
+
+	# Input is done, but held back payloads still deserve delivery.
+	while 0 < supervisor.held and not (stop_event and stop_event.is_set ()):
+		supervisor.check ()
+		time.sleep (interval)
+
+	return count
@@ -9,12 +9,17 @@ up a temporary directory, which is used as app data root for whistle. All
 
 """
 # 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
 import sys
+import time
 import tempfile
+import threading
 import pathlib
 import io
 import re
+import json
 import inspect
+import select
 import logging
 import unittest
 import unittest.mock
@@ -23,14 +28,41 @@ import hashlib
 import contextlib
 import directory_tree
 import urllib.parse
+import http.client
+import asyncio
 
 from ..piper_whistle import cli as whistle_cli
 from ..piper_whistle import db as whistle_db
 from ..piper_whistle import holz
 from ..piper_whistle import util
+from ..piper_whistle import catalog as whistle_catalog
+from ..piper_whistle import formats as whistle_formats
+from ..piper_whistle import channel as whistle_channel
+from ..piper_whistle import worker as whistle_worker
+from ..piper_whistle import router as whistle_router
+from ..piper_whistle import server as whistle_server
+from ..piper_whistle import text as whistle_text
+from ..piper_whistle import cache as whistle_cache
+from ..piper_whistle import audio as whistle_audio
+from ..piper_whistle import scheduler as whistle_scheduler
+from ..piper_whistle import fanout as whistle_fanout
+from ..piper_whistle import admission as whistle_admission
+from ..piper_whistle import bench as whistle_bench
+from ..piper_whistle import warm as whistle_warm
+from ..piper_whistle import optimize as whistle_optimize
+from ..piper_whistle import engine as whistle_engine
+from ..piper_whistle import placement as whistle_placement
+from ..piper_whistle import render as whistle_render
 
 
 DEBUG = True
+# Runs the stub piper executable, standing in for piper in offline tests.
+STUB_PIPER = [
+	sys.executable,
+	pathlib.Path (__file__).resolve ().parent.joinpath (
+		'stub_piper.py'
+	).as_posix ()
+]
 
 
 expected_list_languages = """
@@ -104,6 +136,71 @@ Removed "eva_k@x_low".
 """
 
 
+# Excerpt of the remote voice index, used for tests working offline.
+sample_index = {
+	'de_DE-eva_k-x_low': {
+		'key': 'de_DE-eva_k-x_low',
+		'name': 'eva_k',
+		'language': {
+			'code': 'de_DE',
+			'family': 'de',
+			'region': 'DE',
+			'name_native': 'Deutsch',
+			'name_english': 'German',
+			'country_english': 'Germany'
+		},
+		'quality': 'x_low',
+		'num_speakers': 1,
+		'speaker_id_map': {},
+		'files': {
+			'de/de_DE/eva_k/x_low/de_DE-eva_k-x_low.onnx': {
+				'size_bytes': 20628813,
+				'md5_digest': '2d1d0b1b1b1b1b1b1b1b1b1b1b1b1b1b'
+			},
+			'de/de_DE/eva_k/x_low/de_DE-eva_k-x_low.onnx.json': {
+				'size_bytes': 4958,
+				'md5_digest': '3e2e0c2c2c2c2c2c2c2c2c2c2c2c2c2c'
+			},
+			'de/de_DE/eva_k/x_low/MODEL_CARD': {
+				'size_bytes': 246,
+				'md5_digest': '4f3f0d3d3d3d3d3d3d3d3d3d3d3d3d3d'
+			}
+		},
+		'aliases': ['de-eva_k-x-low']
+	},
+	'en_GB-aru-medium': {
+		'key': 'en_GB-aru-medium',
+		'name': 'aru',
+		'language': {
+			'code': 'en_GB',
+			'family': 'en',
+			'region': 'GB',
+			'name_native': 'English',
+			'name_english': 'English',
+			'country_english': 'Great Britain'
+		},
+		'quality': 'medium',
+		'num_speakers': 3,
+		'speaker_id_map': {'03': 0, '06': 1, '10': 2},
+		'files': {
+			'en/en_GB/aru/medium/en_GB-aru-medium.onnx': {
+				'size_bytes': 76733615,
+				'md5_digest': '5a4a0e4e4e4e4e4e4e4e4e4e4e4e4e4e'
+			},
+			'en/en_GB/aru/medium/en_GB-aru-medium.onnx.json': {
+				'size_bytes': 5180,
+				'md5_digest': '6b5b0f5f5f5f5f5f5f5f5f5f5f5f5f5f'
+			},
+			'en/en_GB/aru/medium/MODEL_CARD': {
+				'size_bytes': 281,
+				'md5_digest': '7c6c1a6a6a6a6a6a6a6a6a6a6a6a6a6a'
+			}
+		},
+		'aliases': []
+	}
+}
+
+
 def check_if_timestamp (result):
 	m = re.match(r'^\d+\.\d+$', result)
 	return not (m is None)
@@ -185,6 +282,1268 @@ class ModuleTests (CommonBaseTests):
 			['do', 'have-some.heart']
 		)
 
+	def test_catalog_build (self):
+		c = whistle_catalog.catalog_build (sample_index)
+		self.assertEqual (len (c), 2)
+		self.assertEqual (list (c.languages), ['de_DE', 'en_GB'])
+
+		eva = c.voice_at ('de_DE', 0)
+		self.assertEqual (eva.key, 'de_DE-eva_k-x_low')
+		self.assertEqual (eva.selection_name, 'de_DE:eva_k@x_low')
+		self.assertEqual (eva.language.name_english, 'German')
+		self.assertEqual (eva.file_of_kind ('model').size, 20628813)
+		self.assertEqual (list (eva.speakers ()), [])
+		self.assertIsNone (c.voice_at ('de_DE', 1))
+
+		aru = c.voice ('en_GB-aru-medium')
+		self.assertEqual (aru.speaker_id_map, {'03': 0, '06': 1, '10': 2})
+		self.assertEqual (aru.speaker_id ('10'), 2)
+		self.assertIsNone (aru.speaker_id ('42'))
+		# Repeated strings share the same object.
+		self.assertIs (aru.quality, sys.intern ('medium'))
+		self.assertFalse (hasattr (aru, '__dict__'))
+
+	def test_db_query (self):
+		context = {
+			'db': {'catalog': whistle_catalog.catalog_build (sample_index)}
+		}
+
+		codes = [lang.code for lang in whistle_db.query_languages (context)]
+		self.assertEqual (codes, ['de_DE', 'en_GB'])
+
+		voices = whistle_db.query_voices (context
+			, predicate = lambda v: 'medium' == v.quality
+		)
+		self.assertTrue (inspect.isgenerator (voices))
+		self.assertEqual (
+			[(i, v.key) for i, v in voices], [(0, 'en_GB-aru-medium')]
+		)
+		self.assertEqual (len (list (
+			whistle_db.query_voices (context, limit = 1)
+		)), 1)
+		self.assertEqual (list (
+			whistle_db.query_voices (context, code = 'xx_XX')
+		), [])
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			self.assertEqual (whistle_db.model_list_installed (paths), [])
+
+			model_dir = pathlib.Path (paths['voices'])
+			model_dir = model_dir.joinpath ('de_DE', 'de_DE-eva_k-x_low')
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath ('de_DE-eva_k-x_low.onnx').touch ()
+
+			installed = list (whistle_db.query_installed (paths))
+			self.assertEqual (installed[0]['key'], 'de_DE-eva_k-x_low')
+			self.assertEqual (installed[0]['quality'], 'x_low')
+			self.assertEqual (list (whistle_db.query_installed (paths
+				, predicate = lambda m: 'low' == m['quality']
+			)), [])
+
+	def test_db_download_table (self):
+		repo_info = {
+			'root': 'https://huggingface.co',
+			'repo-id': 'rhasspy/piper-voices',
+			'branch': 'main',
+			'voice-index': 'voices.json'
+		}
+		c = whistle_catalog.catalog_build (sample_index)
+		table = whistle_db.download_table_build (c, repo_info)
+		self.assertEqual (set (table), set (sample_index))
+
+		base = 'https://huggingface.co/rhasspy/piper-voices/resolve/main'
+		eva = table['de_DE-eva_k-x_low']
+		self.assertEqual (eva['selection_name'], 'de_DE:eva_k@x_low')
+		self.assertEqual (
+			eva['model']['url'],
+			f'{base}/de/de_DE/eva_k/x_low/de_DE-eva_k-x_low.onnx'
+		)
+		self.assertEqual (eva['config']['size'], 4958)
+		self.assertEqual (
+			eva['samples'],
+			[f'{base}/de/de_DE/eva_k/x_low/samples/speaker_0.mp3']
+		)
+		self.assertEqual (len (table['en_GB-aru-medium']['samples']), 3)
+
+		context = {'db': {'catalog': c, 'downloads': table}}
+		self.assertIs (
+			whistle_db.assemble_download_info (context, 'en_GB', 0),
+			table['en_GB-aru-medium']
+		)
+		self.assertIsNone (whistle_db.assemble_download_info (context, 'en_GB', 1))
+
+		# Contexts load the table on first lookup, or build it if not stored.
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			pathlib.Path (paths['data']).mkdir (parents = True)
+			with open (paths['index'], 'w') as f:
+				json.dump (sample_index, f)
+			context = whistle_db.context_create (paths, repo_info)
+			self.assertIsNone (context['db']['downloads'])
+			self.assertEqual (
+				whistle_db.download_info_by_key (context, 'de_DE-eva_k-x_low'),
+				eva
+			)
+			with open (paths['downloads'], 'w') as f:
+				json.dump ({'de_DE-eva_k-x_low': {'model': None}}, f)
+			context = whistle_db.context_create (paths, repo_info)
+			self.assertEqual (
+				whistle_db.download_info_by_key (context, 'de_DE-eva_k-x_low'),
+				{'model': None}
+			)
+
+	def test_formats_rows (self):
+		columns = ['key', 'speaker_name', 'speaker_id']
+		rows = [
+			{'key': 'a', 'speaker_name': 'x\ty', 'speaker_id': 0},
+			{'key': 'b', 'speaker_id': 1, 'ignored': True}
+		]
+		render = whistle_formats.render_rows
+
+		self.assertEqual (
+			render ('tsv', columns, rows),
+			'key\tspeaker_name\tspeaker_id\na\tx\\ty\t0\nb\t\t1\n'
+		)
+		self.assertEqual (
+			render ('csv', columns, rows),
+			'key,speaker_name,speaker_id\na,x\ty,0\nb,,1\n'
+		)
+		jsonl = render ('jsonl', columns, rows).splitlines ()
+		self.assertEqual (len (jsonl), 2)
+		self.assertEqual (
+			list (json.loads (jsonl[1]).items ()),
+			[('key', 'b'), ('speaker_name', None), ('speaker_id', 1)]
+		)
+		self.assertEqual (
+			json.loads (render ('json', columns, rows))[0]['speaker_name'],
+			'x\ty'
+		)
+		self.assertEqual (json.loads (render ('json', columns, [])), [])
+
+		out = io.StringIO ()
+		w = whistle_formats.BufferedWriter (out, threshold = 8)
+		w.write ('1234')
+		self.assertEqual (out.getvalue (), '')
+		w.write ('5678')
+		self.assertEqual (out.getvalue (), '12345678')
+
+	@unittest.skipUnless (hasattr (os, 'mkfifo'), 'Requires named pipes.')
+	def test_channel_spool (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			fifo_path = pathlib.Path (tmp).joinpath ('speak').as_posix ()
+			os.mkfifo (fifo_path)
+			spool_path = whistle_channel.spool_path_for (paths, fifo_path)
+
+			c = whistle_channel.Channel (fifo_path, spool_path, timeout = 0.05)
+			with c:
+				# No reader attached, so payloads have to be spooled.
+				self.assertEqual (c.send ('one\n'), c.SPOOLED)
+				self.assertEqual (c.send (b'two\n'), c.SPOOLED)
+				self.assertEqual (
+					whistle_channel.spool_size (spool_path), 8
+				)
+
+				reader = os.open (fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+				try:
+					self.assertEqual (c.send ('three\n'), c.SENT)
+					self.assertEqual (
+						os.read (reader, 1024), b'one\ntwo\nthree\n'
+					)
+				finally:
+					os.close (reader)
+			self.assertEqual (whistle_channel.spool_size (spool_path), 0)
+
+			no_spool = whistle_channel.Channel (fifo_path, timeout = 0.01)
+			self.assertEqual (no_spool.send ('lost\n'), no_spool.FAILED)
+
+			# A line started is finished, never torn between pipe and spool.
+			reader = os.open (fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+			filler = os.open (fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+			try:
+				while True:
+					os.write (filler, b'\n' * 4096)
+			except BlockingIOError:
+				pass
+			# Room for part of the next line only.
+			os.read (reader, 4096)
+			received = []
+
+			def _read_later ():
+				time.sleep (0.3)
+				while True:
+					ready, _, _ = select.select ([reader], [], [], 0.5)
+					if not ready:
+						return
+					received.append (os.read (reader, 1 << 16))
+
+			t = threading.Thread (target = _read_later)
+			t.start ()
+			line = '{"text": "' + 'x' * 8000 + '"}\n'
+			with whistle_channel.Channel (fifo_path, spool_path, 0.05) as c:
+				self.assertEqual (c.send (line + 'next\n'), c.SENT)
+			t.join ()
+			os.close (filler)
+			os.close (reader)
+			self.assertTrue (
+				b''.join (received).endswith ((line + 'next\n').encode ())
+			)
+			self.assertEqual (whistle_channel.spool_size (spool_path), 0)
+
+	@unittest.skipUnless (hasattr (os, 'mkfifo'), 'Requires named pipes.')
+	def test_admission_shedding (self):
+		now = time.time ()
+		stale = json.dumps ({'text': 'stale', 'expires': now - 1}) + '\n'
+		fresh = [
+			json.dumps ({'text': f'fresh {i}', 'expires': now + 60}) + '\n'
+			for i in range (3)
+		]
+		self.assertTrue (whistle_admission.line_expired (stale))
+		self.assertFalse (whistle_admission.line_expired (fresh[0]))
+		self.assertFalse (whistle_admission.line_expired ('plain text'))
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			fifo_path = pathlib.Path (tmp).joinpath ('speak').as_posix ()
+			os.mkfifo (fifo_path)
+			spool_path = whistle_channel.spool_path_for (paths, fifo_path)
+			c = whistle_channel.Channel (fifo_path, spool_path, timeout = 0.01)
+			with c:
+				# Rest of a payload partially sent before, never dropped.
+				c.send ('rest"}\n')
+				for payload in [stale] + fresh:
+					c.send (payload)
+				self.assertEqual (
+					c.backlog (), whistle_channel.spool_size (spool_path)
+				)
+
+			shed = whistle_channel.spool_shed
+			self.assertEqual (shed (spool_path
+				, outdated = whistle_admission.line_expired
+			), 1)
+			self.assertEqual (shed (spool_path, len (fresh[2]) + 7), 2)
+			with open (spool_path, 'r') as f:
+				self.assertEqual (f.read (), 'rest"}\n' + fresh[2])
+
+		# No lower quality is installed.
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			self.assertIsNone (
+				whistle_admission.voice_degrade (paths, 'aru@medium')
+			)
+
+		r, w = os.pipe ()
+		os.write (w, (stale + fresh[0]).encode ())
+		os.close (w)
+
+		class _Recorder:
+			held = 0
+
+			def __init__ (self):
+				self.sent = []
+
+			def check (self):
+				return True
+
+			def send (self, payload):
+				self.sent.append (payload)
+
+		s = _Recorder ()
+		self.assertEqual (whistle_worker.serve (s, r), 1)
+		os.close (r)
+		self.assertEqual (s.sent, [fresh[0].strip ()])
+
+	@unittest.skipUnless (hasattr (os, 'mkfifo'), 'Requires named pipes.')
+	def test_channel_relay (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			channels = whistle_channel.channel_setup (tmp)
+			self.assertEqual (set (channels), {'speak', 'input', 'output'})
+
+			stop = threading.Event ()
+			relay = threading.Thread (
+				target = whistle_channel.relay,
+				args = (channels['speak'], channels['input']),
+				kwargs = {'idle_interval': 0.05, 'stop_event': stop}
+			)
+			relay.start ()
+			try:
+				reader = os.open (channels['input']
+					, os.O_RDONLY | os.O_NONBLOCK
+				)
+				c = whistle_channel.Channel (channels['speak'], timeout = 1.0)
+				with c:
+					self.assertEqual (c.send ('{"text": "hi"}\n'), c.SENT)
+				received = b''
+				for _ in range (100):
+					try:
+						received += os.read (reader, 1024)
+					except BlockingIOError:
+						pass
+					if received.endswith (b'\n'):
+						break
+					time.sleep (0.01)
+				os.close (reader)
+				self.assertEqual (received, b'{"text": "hi"}\n')
+			finally:
+				stop.set ()
+				relay.join ()
+
+			# Spooled lines only go in between whole lines relayed.
+			spool_path = pathlib.Path (tmp).joinpath ('speak.spool').as_posix ()
+			stop = threading.Event ()
+			relay = threading.Thread (
+				target = whistle_channel.relay,
+				args = (channels['speak'], channels['input']),
+				kwargs = {
+					'spool_path': spool_path, 'idle_interval': 0.05,
+					'stop_event': stop
+				}
+			)
+			relay.start ()
+			time.sleep (0.1)
+			reader = os.open (channels['input'], os.O_RDONLY | os.O_NONBLOCK)
+			writer = os.open (channels['speak'], os.O_WRONLY | os.O_NONBLOCK)
+			try:
+				os.write (writer, b'{"text": "ne')
+				time.sleep (0.2)
+				whistle_channel.spool_append (spool_path, b'{"text": "old"}\n')
+				time.sleep (0.3)
+				os.write (writer, b'w"}\n')
+				time.sleep (0.3)
+				self.assertEqual (os.read (reader, 1024)
+					, b'{"text": "new"}\n{"text": "old"}\n'
+				)
+				self.assertEqual (whistle_channel.spool_size (spool_path), 0)
+			finally:
+				stop.set ()
+				relay.join ()
+				os.close (writer)
+				os.close (reader)
+
+			# Stops even while piper does not read its full input.
+			stop = threading.Event ()
+			relay = threading.Thread (
+				target = whistle_channel.relay,
+				args = (channels['speak'], channels['input']),
+				kwargs = {
+					'pipe_size': 4096, 'idle_interval': 0.05,
+					'stop_event': stop
+				},
+				daemon = True
+			)
+			relay.start ()
+			time.sleep (0.1)
+			writer = os.open (channels['speak'], os.O_WRONLY | os.O_NONBLOCK)
+			# Fills the pipes of both channels, and relay's hands.
+			until = time.monotonic () + 0.5
+			while time.monotonic () < until:
+				try:
+					os.write (writer, b'x' * 4096)
+				except BlockingIOError:
+					time.sleep (0.01)
+			stop.set ()
+			relay.join (5)
+			os.close (writer)
+			self.assertFalse (relay.is_alive ())
+
+	def test_worker_request_mode (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			params = whistle_worker.piper_command_build (STUB_PIPER
+				, pathlib.Path (tmp).joinpath ('voice.onnx').as_posix ()
+				, output_dir = tmp
+			)
+			w = whistle_worker.PiperWorker (params).start ()
+			try:
+				self.assertTrue (w.wait_ready (10))
+				self.assertIsNotNone (w.load_time)
+				out = pathlib.Path (tmp).joinpath ('hi.wav').as_posix ()
+				f = w.submit ({'text': 'hi', 'output_file': out})
+				self.assertEqual (f.result (10), out)
+				self.assertTrue (pathlib.Path (out).exists ())
+			finally:
+				self.assertEqual (w.stop (), 0)
+			self.assertFalse (w.alive)
+			self.assertRaises (RuntimeError
+				, w.submit ({'text': 'late'}).result, 1
+			)
+
+	def test_worker_supervisor_restarts (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			ready_path = pathlib.Path (tmp).joinpath ('ready')
+			params = whistle_worker.piper_command_build (STUB_PIPER, 'voice.onnx')
+			env = dict (os.environ, STUB_PIPER_CRASH_AFTER = '1')
+
+			with open (pathlib.Path (tmp).joinpath ('out.raw'), 'wb') as out:
+				def _create ():
+					return whistle_worker.PiperWorker (params
+						, stdout = out, env = env
+					)
+				s = whistle_worker.Supervisor (_create
+					, ready_path = ready_path.as_posix ()
+					, backoff_min = 0.01
+				)
+				try:
+					for i, text in enumerate (['a', 'b']):
+						s.send ({'text': text})
+						# Every payload crashes the stub, so wait for restart.
+						for _ in range (1000):
+							s.check ()
+							if i + 1 == s.restarts and ready_path.exists ():
+								break
+							time.sleep (0.01)
+						self.assertEqual (0, s.held)
+						self.assertEqual (
+							ready_path.read_text ().strip (), str (s.worker.pid)
+						)
+				finally:
+					s.stop ()
+				self.assertFalse (ready_path.exists ())
+			self.assertEqual (s.restarts, 2)
+			self.assertEqual (
+				pathlib.Path (tmp).joinpath ('out.raw').stat ().st_size,
+				2 * 2 * 220
+			)
+
+	def test_worker_coalescing (self):
+		self.assertEqual (
+			whistle_text.sentences_join (['Mail from Bob', ' Build done! ', ''])
+			, 'Mail from Bob. Build done!'
+		)
+
+		class _Recorder:
+			held = 0
+
+			def __init__ (self):
+				self.sent = []
+
+			def check (self):
+				return True
+
+			def send (self, payload):
+				self.sent.append (json.loads (payload))
+
+		burst = [
+			{'text': 'One'}, {'text': 'Two'},
+			{'text': 'Three', 'output_file': '/tmp/three.wav'},
+			{'text': 'Four', 'speaker_id': 1}, {'text': 'Five', 'speaker_id': 1},
+			{'text': 'Six', 'expires': 2e9}, {'text': 'Seven', 'expires': 3e9},
+			{'text': 'Eight', 'expires': 2e9, 'speaker_id': 1},
+			{'text': 'Nine', 'speaker_id': 1}
+		]
+		r, w = os.pipe ()
+		os.write (w, ''.join (json.dumps (p) + '\n' for p in burst).encode ())
+		os.close (w)
+		s = _Recorder ()
+		count = whistle_worker.serve (s, r, coalesce = 0.05)
+		os.close (r)
+		self.assertEqual (count, 9)
+		self.assertEqual (s.sent, [
+			{'text': 'One. Two.'},
+			{'text': 'Three', 'output_file': '/tmp/three.wav'},
+			{'text': 'Four. Five.', 'speaker_id': 1},
+			# Merged payloads expire with the last of them, if at all.
+			{'text': 'Six. Seven.', 'expires': 3e9},
+			{'text': 'Eight. Nine.', 'speaker_id': 1}
+		])
+
+	def test_router_pool_eviction (self):
+		self.assertEqual (whistle_db.selector_parse ('en_GB:aru@medium/03'), {
+			'code': 'en_GB', 'name': 'aru', 'quality': 'medium', 'variant': None,
+			'speaker': '03'
+		})
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			for code, key in [
+				('de_DE', 'de_DE-eva_k-x_low'), ('en_GB', 'en_GB-aru-medium')
+			]:
+				model_dir = pathlib.Path (paths['voices']).joinpath (code, key)
+				model_dir.mkdir (parents = True)
+				model_dir.joinpath (f'{key}.onnx').touch ()
+
+			# Whether the pool could be used by others, while stopping.
+			unlocked = []
+
+			class _Worker (whistle_worker.PiperWorker):
+				def stop (self):
+					t = threading.Thread (target = pool.loaded)
+					t.start ()
+					t.join (2)
+					unlocked.append (not t.is_alive ())
+					return super ().stop ()
+
+			def _create (model_path):
+				return _Worker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				)
+
+			# Budget fits a single (empty) voice model only.
+			pool = whistle_router.WorkerPool (_create
+				, memory_budget = whistle_router.PROCESS_OVERHEAD + (16 << 20)
+			)
+			r = whistle_router.Router (paths, pool
+				, synthesis_cache = whistle_cache.SynthesisCache (paths['cache'])
+				, scratch_dir = tmp
+			)
+			try:
+				selectors = ['eva_k@x_low', 'aru@medium/1', 'eva_k@x_low']
+				for i, selector in enumerate (selectors):
+					f = r.submit (selector, f'hi {i}')
+					self.assertTrue (pathlib.Path (f.result (10)).exists ())
+					self.assertEqual (len (pool.loaded ()), 1)
+				self.assertEqual (pool.evictions, 2)
+				self.assertEqual (unlocked, [True, True])
+				self.assertIn ('eva_k', pool.loaded ()[0])
+				# Repeated requests are served from cache, without loading.
+				f = r.submit ('aru@medium/1', 'hi 1')
+				self.assertTrue (f.done ())
+				self.assertTrue (pathlib.Path (f.result ()).exists ())
+				self.assertIn ('eva_k', pool.loaded ()[0])
+				self.assertEqual (r.cache.hits, 1)
+				self.assertRaises (LookupError
+					, r.submit ('nobody@medium', 'hi').result, 1
+				)
+			finally:
+				r.stop ()
+			self.assertEqual (pool.loaded (), [])
+
+	def test_db_quality_auto (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			for quality in ['x_low', 'medium', 'high']:
+				key = f'en_GB-alba-{quality}'
+				model_dir = pathlib.Path (paths['voices']).joinpath ('en_GB', key)
+				model_dir.mkdir (parents = True)
+				model_dir.joinpath (f'{key}.onnx').touch ()
+
+			# Nothing measured yet, so the fastest quality is used.
+			m = whistle_db.model_resolve_selector (paths, 'alba@auto')
+			self.assertEqual (m['quality'], 'x_low')
+			self.assertTrue (m['path'].endswith ('en_GB-alba-x_low.onnx'))
+
+			whistle_db.perf_record (paths, 'en_GB-alba-high', 0.9)
+			whistle_db.perf_record (paths, 'en_GB-alba-medium', 0.2, 3)
+			self.assertAlmostEqual (
+				whistle_db.perf_record (paths, 'en_GB-alba-medium', 0.6), 0.3
+			)
+			self.assertEqual (
+				whistle_db.quality_auto (paths, 'alba', 'en_GB'), 'medium'
+			)
+			with unittest.mock.patch.dict (os.environ
+				, {'PIPER_WHISTLE_RTF_BUDGET': '1.0'}
+			):
+				self.assertEqual (whistle_db.quality_auto (paths, 'alba'), 'high')
+			self.assertIsNone (whistle_db.quality_auto (paths, 'alba', 'de_DE'))
+
+			def _create (model_path):
+				return whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				)
+
+			pool = whistle_router.WorkerPool (_create, memory_budget = 1 << 30)
+			r = whistle_router.Router (paths, pool)
+			try:
+				# The first request waits for piper loading, unmeasured.
+				for text in ['Loading.', 'Measure me.']:
+					r.submit ('alba@auto', text).result (10)
+			finally:
+				r.stop ()
+			voices = whistle_db.perf_load (paths)['voices']
+			self.assertEqual (voices['en_GB-alba-medium']['samples'], 5)
+
+	def test_db_variants (self):
+		self.assertEqual (whistle_db.selector_parse ('alba@medium+int8/1'), {
+			'code': None, 'name': 'alba', 'quality': 'medium', 'variant': 'int8',
+			'speaker': '1'
+		})
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'en_GB-alba-medium'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('en_GB', key)
+			model_dir.mkdir (parents = True)
+			model_path = model_dir.joinpath (f'{key}.onnx')
+			model_path.write_bytes (b'\1' * 1000)
+
+			# Stands in for onnxruntime writing the variants.
+			variant_paths = {}
+			for variant, size in [('optimized', 900), ('int8', 300)]:
+				d = pathlib.Path (whistle_db.model_variant_dir (model_path, variant))
+				d.mkdir ()
+				variant_paths[variant] = d.joinpath (f'{key}+{variant}.onnx')
+				variant_paths[variant].write_bytes (b'\2' * size)
+				provenance = whistle_optimize.provenance_build (model_path
+					, variant, {}
+				)
+				d.joinpath ('provenance.json').write_text (json.dumps (provenance))
+			self.assertEqual (
+				provenance['source']['sha256'],
+				hashlib.sha256 (b'\1' * 1000).hexdigest ()
+			)
+
+			def _resolve (selector, optimized = False):
+				return whistle_db.model_resolve_selector (paths, selector
+					, optimized = optimized
+				)['path']
+
+			self.assertEqual (_resolve ('alba@medium'), model_path.as_posix ())
+			self.assertEqual (_resolve ('alba@medium', True)
+				, variant_paths['optimized'].as_posix ()
+			)
+			self.assertEqual (_resolve ('en_GB-alba-medium+int8')
+				, variant_paths['int8'].as_posix ()
+			)
+			self.assertEqual (len (whistle_db.model_list_installed (paths)), 1)
+			self.assertEqual (whistle_db.model_variants (model_path)
+				, ['optimized', 'int8']
+			)
+
+			self.assertTrue (whistle_optimize.variant_remove (model_path, 'int8'))
+			self.assertIsNone (_resolve ('alba@medium+int8'))
+
+			# Removing a variant leaves the voice and its pin alone.
+			model = whistle_db.model_list_installed (paths)[0]
+			whistle_warm.pin (paths, model, pathlib.Path (tmp).joinpath ('shm'))
+			parser = whistle_cli.create_arg_parser ()
+			args = parser.parse_args (['remove', 'alba@medium+optimized'])
+			with contextlib.redirect_stdout (io.StringIO ()) as out:
+				self.assertEqual (whistle_cli.cmds.run_remove ({'paths': paths}, args), 0)
+			self.assertEqual (out.getvalue (), 'Removed "alba@medium+optimized".\n')
+			self.assertTrue (model_path.exists ())
+			self.assertEqual (whistle_db.model_variants (model_path), [])
+			self.assertIn (key, whistle_db.pins_load (paths))
+			self.assertEqual (whistle_cli.cmds.run_remove ({'paths': paths}, args), 13)
+			whistle_warm.unpin (paths, key)
+
+			# Variants of a changed source model are outdated.
+			model_path.write_bytes (b'\1' * 1001)
+			self.assertEqual (_resolve ('alba@medium', True)
+				, model_path.as_posix ()
+			)
+			self.assertEqual (whistle_db.model_variants (model_path), [])
+
+			m = whistle_db.model_resolve_selector (paths, 'alba@medium')
+			with contextlib.redirect_stdout (io.StringIO ()):
+				self.assertTrue (whistle_db.model_remove (paths, m))
+			self.assertFalse (model_dir.exists ())
+
+	def test_bench_compare (self):
+		self.assertAlmostEqual (
+			whistle_bench.correlation ([1, 2, 3], [2, 4, 6]), 1.0
+		)
+		self.assertAlmostEqual (
+			whistle_bench.correlation ([1, 2, 3], [3, 2, 1]), -1.0
+		)
+
+		with tempfile.TemporaryDirectory () as tmp:
+			model_path = pathlib.Path (tmp).joinpath ('en_GB-alba-medium.onnx')
+			model_path.write_bytes (b'\1' * 1000)
+			variant_path = pathlib.Path (tmp).joinpath ('en_GB-alba-medium+int8.onnx')
+			variant_path.write_bytes (b'\1' * 250)
+			model = {
+				'key': 'en_GB-alba-medium', 'quality': 'medium',
+				'path': model_path.as_posix ()
+			}
+			variant = dict (model
+				, key = 'en_GB-alba-medium+int8'
+				, path = variant_path.as_posix ()
+			)
+			rows = whistle_bench.voice_compare (STUB_PIPER, model, variant
+				, corpus = ['Hello.', 'Hello there, world.']
+				, timeout = 10
+			)
+
+		self.assertEqual ([r['key'] for r in rows], [model['key'], variant['key']])
+		self.assertEqual (list (rows[1].keys ()), whistle_bench.COMPARE_COLUMNS)
+		self.assertEqual ([r['model_size'] for r in rows], [1000, 250])
+		# The stub speaks alike with every model.
+		self.assertEqual (rows[1]['duration_delta'], 0.0)
+		self.assertEqual (rows[1]['envelope_correlation'], 1.0)
+
+	def test_engine_phonemes (self):
+		config = whistle_engine.VoiceConfig ({
+			'audio': {'sample_rate': 16000},
+			'phoneme_type': 'text',
+			'phoneme_id_map': {
+				'_': [0], '^': [1], '$': [2], 'a': [3], 'b': [4], ' ': [5]
+			},
+			'num_speakers': 2,
+			'speaker_id_map': {'ann': 1}
+		})
+		self.assertEqual (config.format.sample_rate, 16000)
+		self.assertEqual (config.speaker_id ('ann'), 1)
+		self.assertEqual (config.speaker_id (None), 0)
+		self.assertRaises (ValueError, config.speaker_id, 'bob')
+
+		phonemes = whistle_engine.phonemize ('Ab bä', config)
+		self.assertEqual (phonemes, [['a', 'b', ' ', 'b', 'a', '\u0308']])
+		self.assertEqual (
+			whistle_engine.phoneme_ids (phonemes[0], config.phoneme_id_map),
+			[1, 0, 3, 0, 4, 0, 5, 0, 4, 0, 3, 0, 2]
+		)
+
+		with tempfile.TemporaryDirectory () as tmp:
+			model_path = pathlib.Path (tmp).joinpath ('en_GB-alba-medium.onnx')
+			model_path.write_bytes (b'no model')
+			factory = whistle_engine.worker_factory ('onnx', STUB_PIPER, tmp)
+			w = factory (model_path.as_posix ()).start ()
+			# Fails to load, be it for lack of onnxruntime or a model.
+			self.assertFalse (w.wait_ready (10))
+			self.assertRaises (RuntimeError
+				, w.submit ({'text': 'Hello.'}).result, 10
+			)
+			self.assertEqual (w.stop (), 13)
+
+			factory = whistle_engine.worker_factory ('piper', STUB_PIPER, tmp)
+			w = factory (model_path.as_posix ())
+			self.assertIn (model_path.as_posix (), w.params)
+			self.assertIn ('--output_dir', w.params)
+
+	def test_placement (self):
+		self.assertEqual (
+			whistle_placement.cpulist_parse ('0-3,8\n'), [0, 1, 2, 3, 8]
+		)
+		self.assertEqual (
+			whistle_placement.cpulist_format ([8, 0, 2, 1, 3]), '0-3,8'
+		)
+		self.assertRaises (ValueError, whistle_placement.cpulist_parse, '0-a')
+
+		class Owner:
+			returncode = None
+
+		p = whistle_placement.Placement (2
+			, nodes = {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+		)
+		first, second = Owner (), Owner ()
+		alba = p.assign ('alba', first)
+		# Voices are spread across nodes.
+		self.assertEqual (p.assign ('eva', Owner ()), {4, 5})
+		# Workers of a voice stay on its node, on cores of their own.
+		self.assertEqual (alba, {0, 1})
+		self.assertEqual (p.assign ('alba', second), {2, 3})
+		first.returncode = 0
+		self.assertEqual (p.assign ('alba', Owner ()), {0, 1})
+		self.assertEqual (p.usage ()[0], 1)
+
+		with tempfile.TemporaryDirectory () as tmp:
+			factory = whistle_engine.worker_factory ('piper', STUB_PIPER, tmp
+				, cpu_placement = whistle_placement.Placement (1)
+			)
+			w = factory (pathlib.Path (tmp).joinpath ('a.onnx').as_posix ())
+			self.assertEqual (len (w.cpus), 1)
+			# In-process sessions can not be pinned, so placement is refused.
+			self.assertRaises (ValueError, whistle_engine.worker_factory
+				, 'onnx', STUB_PIPER, tmp
+				, cpu_placement = whistle_placement.Placement (1)
+			)
+			parser = whistle_cli.create_arg_parser ()
+			for engine, ok in [('piper', True), ('onnx', False)]:
+				args = parser.parse_args (
+					['route', '-E', engine, '--cpus-per-worker', '1']
+				)
+				self.assertEqual (whistle_cli.cmds._engine_check (args), ok)
+
+	def test_warm_pin (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'en_GB-alba-medium'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('en_GB', key)
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath (f'{key}.onnx').write_bytes (b'\1' * 5000)
+			model_dir.joinpath (f'{key}.onnx.json').write_text (
+				json.dumps ({'audio': {'sample_rate': 16000}})
+			)
+			model = whistle_db.model_list_installed (paths)[0]
+			self.assertEqual (whistle_warm.prefetch (model['path']), 5000)
+			self.assertEqual (len (whistle_warm.model_files (model['path'])), 2)
+
+			pin_root = pathlib.Path (tmp).joinpath ('shm').as_posix ()
+			pinned = whistle_warm.pin (paths, model, pin_root)
+			self.assertTrue (pinned.startswith (pin_root))
+			m = whistle_db.model_resolve_selector (paths, 'alba@medium')
+			self.assertEqual (m['path'], pinned)
+			self.assertEqual (whistle_audio.voice_format (pinned).sample_rate, 16000)
+			self.assertEqual (
+				whistle_db.model_resolve_path (paths, m, pinned = False)
+				, model['path']
+			)
+
+			# Copies lost (e.g. by a reboot) fall back to the installed model.
+			pathlib.Path (pinned).unlink ()
+			m = whistle_db.model_resolve_selector (paths, 'alba@medium')
+			self.assertEqual (m['path'], model['path'])
+
+			self.assertTrue (whistle_warm.unpin (paths, key))
+			self.assertFalse (whistle_warm.unpin (paths, key))
+			self.assertEqual (whistle_db.pins_load (paths), {})
+			self.assertFalse (pathlib.Path (pinned).parent.exists ())
+
+	def test_bench_voice (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'en_GB-alba-medium'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('en_GB', key)
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath (f'{key}.onnx').touch ()
+			model = whistle_db.model_list_installed (paths)[0]
+
+			with unittest.mock.patch.dict (os.environ, {'STUB_PIPER_RTF': '0.5'}):
+				result = whistle_bench.voice_bench (STUB_PIPER, model
+					, corpus = ['Hello.', 'Hello there, world.']
+					, repeat = 2
+					, timeout = 10
+				)
+			self.assertEqual (list (result.keys ()), whistle_bench.COLUMNS)
+			self.assertEqual (result['key'], key)
+			self.assertEqual (result['sentences'], 4)
+			self.assertAlmostEqual (result['audio_seconds'], 0.5, places = 2)
+			self.assertLess (0.45, result['rtf'])
+			self.assertLess (0, result['load_time'])
+			self.assertAlmostEqual (result['ttfb']
+				, result['rtf'] * result['audio_seconds'] / 4, places = 3
+			)
+
+	def test_router_segmented (self):
+		self.assertEqual (
+			whistle_text.phrases_split ('Your order, 1234, is ready. Bye'),
+			['Your order,', '1234,', 'is ready.', 'Bye']
+		)
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'de_DE-eva_k-x_low'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('de_DE', key)
+			model_dir.mkdir (parents = True)
+			model_path = model_dir.joinpath (f'{key}.onnx')
+			model_path.touch ()
+			pathlib.Path (f'{model_path}.json').write_text (
+				json.dumps ({'audio': {'sample_rate': 16000}})
+			)
+
+			pool = whistle_router.WorkerPool (
+				lambda model_path: whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				)
+			)
+			r = whistle_router.Router (paths, pool
+				, synthesis_cache = whistle_cache.SynthesisCache (paths['cache'])
+				, scratch_dir = tmp
+			)
+			try:
+				for i, number in enumerate (['1234', '99']):
+					out = pathlib.Path (tmp).joinpath (f'{i}.wav').as_posix ()
+					text = f'Your order, {number}, is ready.'
+					f = r.submit_segmented ('eva_k@x_low', text, output_file = out)
+					self.assertEqual (f.result (10), out)
+					fmt, pcm = whistle_audio.wav_read (out)
+					self.assertEqual (fmt.sample_rate, 16000)
+					# Phrases without separating spaces, 10ms per character.
+					chars = len (text.replace (' ', '')) + 2
+					self.assertEqual (len (pcm), chars * 160 * 2)
+				# Only the number was synthesised for the second prompt.
+				self.assertEqual (r.cache.hits, 2)
+			finally:
+				r.stop ()
+
+	def test_router_parallel_sentences (self):
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'de_DE-eva_k-x_low'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('de_DE', key)
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath (f'{key}.onnx').touch ()
+			env = dict (os.environ, STUB_PIPER_LOAD_DELAY = '0.2')
+
+			pool = whistle_router.WorkerPool (
+				lambda model_path: whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					), env = env
+				), workers_per_voice = 2
+			)
+			r = whistle_router.Router (paths, pool)
+			in_r, in_w = os.pipe ()
+			out_r, out_w = os.pipe ()
+			os.write (in_w, b'One. Two. Three.\n')
+			os.close (in_w)
+			received = []
+			reader = threading.Thread (
+				target = lambda: received.extend (iter (
+					lambda: os.read (out_r, 1 << 16), b''
+				))
+			)
+			reader.start ()
+			try:
+				count = whistle_router.route (r, in_r, out_w
+					, default_selector = 'eva_k@x_low'
+				)
+				self.assertEqual (count, 1)
+				# Sentences were spread across two workers of the voice.
+				self.assertEqual (pool.workers (pool.loaded ()[0]), 2)
+			finally:
+				r.stop ()
+				os.close (out_w)
+				reader.join (10)
+				os.close (in_r)
+				os.close (out_r)
+
+			pcm = b''.join (received)
+			self.assertEqual (len (pcm), len ('One.Two.Three.') * 220 * 2)
+			# Audio arrives in order of sentences.
+			self.assertEqual (pcm[:2], (ord ('O') * 64).to_bytes (2, 'little'))
+			self.assertEqual (pcm[-2:], (ord ('.') * 64).to_bytes (2, 'little'))
+			self.assertEqual (
+				pcm[8 * 440:8 * 440 + 2], (ord ('T') * 64).to_bytes (2, 'little')
+			)
+
+	def test_render_script (self):
+		script = whistle_render.script_parse ([
+			'# Scene one\n',
+			'eva_k@x_low\t1\tAb\n',
+			'\n',
+			'eva_k@x_low\tLonger line.\n',
+			'{"text": "Cd", "gap": 0.2}\n',
+			'Ef\n'
+		], 'eva_k@x_low')
+		self.assertEqual ([e['text'] for e in script]
+			, ['Ab', 'Longer line.', 'Cd', 'Ef']
+		)
+		self.assertEqual ([e['speaker'] for e in script], ['1', None, None, None])
+		self.assertEqual ([e['gap'] for e in script], [None, None, 0.2, None])
+		self.assertRaises (ValueError, whistle_render.script_parse, ['Ab'])
+		self.assertRaises (ValueError, whistle_render.script_parse, ['{"text": 1'])
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'de_DE-eva_k-x_low'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('de_DE', key)
+			model_dir.mkdir (parents = True)
+			model_path = model_dir.joinpath (f'{key}.onnx')
+			model_path.touch ()
+			pathlib.Path (f'{model_path}.json').write_text (
+				json.dumps ({'audio': {'sample_rate': 16000}})
+			)
+
+			pool = whistle_router.WorkerPool (
+				lambda model_path: whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				), workers_per_voice = 2
+			)
+			r = whistle_router.Router (paths, pool)
+			try:
+				fmt, pcm = whistle_render.render (r, script
+					, gap = 0.1
+					, workers_per_voice = 2
+				)
+				# Lines were spread across two workers of the voice.
+				self.assertEqual (pool.workers (model_path.as_posix ()), 2)
+				self.assertRaises (LookupError, whistle_render.render, r
+					, [dict (script[0], voice = 'nobody@low')]
+				)
+			finally:
+				r.stop ()
+
+			self.assertEqual (fmt.sample_rate, 16000)
+			# 10ms per character, gaps of 100ms, but 200ms after "Cd".
+			chars = len ('AbLonger line.CdEf')
+			self.assertEqual (len (pcm), (chars * 160 + 4 * 1600) * 2)
+			# Audio is assembled in script order, with the speaker of a line.
+			self.assertEqual (pcm[:2], (ord ('A') * 64 + 1).to_bytes (2, 'little'))
+			offset = (2 * 160 + 1600) * 2
+			self.assertEqual (pcm[offset:offset + 2]
+				, (ord ('L') * 64).to_bytes (2, 'little')
+			)
+			self.assertEqual (pcm[-2:], (ord ('f') * 64).to_bytes (2, 'little'))
+
+	def test_route_priority_interrupt (self):
+		self.assertEqual (whistle_scheduler.priority_parse ('critical'), 0)
+		self.assertRaises (ValueError, whistle_scheduler.priority_parse, 'meh')
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'de_DE-eva_k-x_low'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('de_DE', key)
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath (f'{key}.onnx').touch ()
+
+			pool = whistle_router.WorkerPool (
+				lambda model_path: whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				)
+			)
+			r = whistle_router.Router (paths, pool)
+			in_r, in_w = os.pipe ()
+			out_r, out_w = os.pipe ()
+			routed = []
+			t = threading.Thread (target = lambda: routed.append (
+				whistle_router.route (r, in_r, out_w
+					, default_selector = 'eva_k@x_low'
+					, interrupt = True
+				)
+			))
+			t.start ()
+
+			# Every sentence exceeds the pipe buffer, so playback stalls
+			# in the first sentence until output gets read.
+			sentence = 'a' * 200 + '.'
+			low = json.dumps ({'text': ' '.join ([sentence] * 5)
+				, 'priority': 'low'
+			})
+			os.write (in_w, f'{low}\n'.encode ())
+			time.sleep (0.5)
+			critical = json.dumps ({'text': 'Z.', 'priority': 'critical'})
+			os.write (in_w, f'{critical}\n'.encode ())
+			time.sleep (0.5)
+			os.close (in_w)
+
+			received = []
+			reader = threading.Thread (
+				target = lambda: received.extend (iter (
+					lambda: os.read (out_r, 1 << 16), b''
+				))
+			)
+			reader.start ()
+			try:
+				t.join (20)
+				self.assertEqual (routed, [2])
+			finally:
+				r.stop ()
+				os.close (out_w)
+				reader.join (10)
+				os.close (in_r)
+				os.close (out_r)
+
+			pcm = b''.join (received)
+			z = pcm.find ((ord ('Z') * 64).to_bytes (2, 'little'))
+			per_sentence = len (sentence) * 220 * 2
+			# Critical audio cut into the first sentence, the remaining four
+			# low priority sentences followed.
+			self.assertLess (-1, z)
+			self.assertLess (z, per_sentence)
+			self.assertEqual (len (pcm) - z, 2 * 220 * 2 + 4 * per_sentence)
+
+	def test_server_streaming (self):
+		self.assertEqual (
+			whistle_text.sentences_split ('Hi there. How are you?\nFine'),
+			['Hi there.', 'How are you?', 'Fine']
+		)
+
+		with tempfile.TemporaryDirectory () as tmp:
+			paths = whistle_db.data_paths (tmp)
+			key = 'de_DE-eva_k-x_low'
+			model_dir = pathlib.Path (paths['voices']).joinpath ('de_DE', key)
+			model_dir.mkdir (parents = True)
+			model_dir.joinpath (f'{key}.onnx').touch ()
+
+			pool = whistle_router.WorkerPool (
+				lambda model_path: whistle_worker.PiperWorker (
+					whistle_worker.piper_command_build (STUB_PIPER, model_path
+						, output_dir = tmp
+					)
+				)
+			)
+			s = whistle_server.SynthesisServer (
+				whistle_router.Router (paths, pool), 'eva_k@x_low'
+			)
+			loop = asyncio.new_event_loop ()
+			stop = asyncio.Event ()
+			t = threading.Thread (target = loop.run_until_complete
+				, args = (s.run (stop, listen = '127.0.0.1:0'),)
+			)
+			t.start ()
+			try:
+				for _ in range (500):
+					if s.addresses:
+						break
+					time.sleep (0.01)
+				host, port = s.addresses[0][:2]
+
+				c = http.client.HTTPConnection (host, port, timeout = 10)
+				c.request ('POST', '/synthesize'
+					, body = json.dumps ({'text': 'Hi. You!'})
+				)
+				r = c.getresponse ()
+				self.assertEqual (r.status, 200)
+				self.assertEqual (r.getheader ('X-Sentences'), '2')
+				body = r.read ()
+				self.assertEqual (body[:4], b'RIFF')
+				# Header plus 10ms (220 samples of 16bit) per character.
+				self.assertEqual (len (body), 44 + 7 * 220 * 2)
+
+				c = http.client.HTTPConnection (host, port, timeout = 10)
+				c.request ('GET', '/synthesize?text=hi&voice=nobody@low')
+				self.assertEqual (c.getresponse ().status, 404)
+
+				for length in ['abc', '-5']:
+					c = http.client.HTTPConnection (host, port, timeout = 10)
+					c.putrequest ('POST', '/synthesize')
+					c.putheader ('Content-Length', length)
+					c.endheaders ()
+					self.assertEqual (c.getresponse ().status, 400)
+			finally:
+				loop.call_soon_threadsafe (stop.set)
+				t.join (10)
+				loop.close ()
+				pool.stop ()
+
+	def test_synthesis_cache (self):
+		key = whistle_cache.cache_key ('Please  hold.', 'en_GB-aru-medium', 1)
+		self.assertEqual (key, whistle_cache.cache_key (
+			' Please hold. ', 'en_GB-aru-medium', '1'
+		))
+		self.assertNotEqual (key, whistle_cache.cache_key (
+			'Please hold.', 'en_GB-aru-medium', 2
+		))
+
+		with tempfile.TemporaryDirectory () as tmp:
+			fmt = whistle_audio.AudioFormat (16000)
+			wavs = []
+			for i in range (3):
+				wav_path = pathlib.Path (tmp).joinpath (f'{i}.wav').as_posix ()
+				whistle_audio.wav_write (wav_path, fmt, b'\0\0' * 1000)
+				wavs.append (wav_path)
+
+			root = pathlib.Path (tmp).joinpath ('cache')
+			# Room for two entries, also after eviction down to 90%.
+			c = whistle_cache.SynthesisCache (root, 3 * 2044 - 1)
+			self.assertIsNone (c.get ('a' * 64))
+			c.put ('a' * 64, wavs[0])
+			c.put ('b' * 64, wavs[1])
+			os.utime (c.get ('b' * 64), (1, 1))
+			c.put ('c' * 64, wavs[2], link = True)
+			# b was used longest ago, so it gets evicted.
+			self.assertIsNone (c.get ('b' * 64))
+			dest = pathlib.Path (tmp).joinpath ('out.wav').as_posix ()
+			self.assertTrue (c.fetch ('a' * 64, dest))
+			self.assertEqual (whistle_audio.wav_read (dest)[0], fmt)
+			self.assertLessEqual (c.size, c.max_size)
+
+			# Eviction makes room down to 90%, not just for one more entry.
+			small = pathlib.Path (tmp).joinpath ('small.wav').as_posix ()
+			whistle_audio.wav_write (small, fmt, b'\0\0' * 10)
+			s = whistle_cache.SynthesisCache (
+				pathlib.Path (tmp).joinpath ('small'), 10 * 64
+			)
+			for i in range (11):
+				s.put (f'{i:064}', small)
+			self.assertLessEqual (s.size, s.max_size * 0.9)
+			self.assertEqual (0, s.evict ())
+
+			# Pending entries are taken in once their wav file is complete.
+			pending = pathlib.Path (tmp).joinpath ('pending.wav').as_posix ()
+			c.pending ('d' * 64, pending)
+			self.assertIsNone (c.get ('d' * 64))
+			whistle_audio.wav_write (pending, fmt, b'\0\0' * 10)
+			self.assertIsNotNone (c.get ('d' * 64))
+
+			# Outputs overwritten with other texts keep their entries apart.
+			out = pathlib.Path (tmp).joinpath ('speak.wav').as_posix ()
+			hello, bye = b'\1\0' * 10, b'\2\0' * 20
+			self.assertTrue (c.pending ('e' * 64, out))
+			whistle_audio.wav_write (out, fmt, hello)
+			self.assertTrue (c.pending ('f' * 64, out))
+			whistle_audio.wav_write (out, fmt, bye)
+			self.assertEqual (whistle_audio.wav_read (c.get ('e' * 64))[1], hello)
+			self.assertEqual (whistle_audio.wav_read (c.get ('f' * 64))[1], bye)
+			# Queued up behind a write still to come, nothing is recorded.
+			self.assertTrue (c.pending ('g' * 64, out))
+			self.assertFalse (c.pending ('h' * 64, out))
+			whistle_audio.wav_write (out, fmt, hello)
+			self.assertIsNone (c.get ('g' * 64))
+			self.assertIsNone (c.get ('h' * 64))
+
+			# Replacing an entry only accounts for the difference in size.
+			c = whistle_cache.SynthesisCache (root)
+			size = c.size
+			c.put ('f' * 64, wavs[0])
+			c.put ('f' * 64, wavs[0])
+			self.assertEqual (c.size, size + 2 * 1000 - 2 * 20)
+
+			# Speakers of a voice keep entries of their own.
+			parser = whistle_cli.create_arg_parser ()
+			keys = set ()
+			for selector in ['aru@medium/0', 'aru@medium/2']:
+				args = parser.parse_args (
+					['speak', '-j', '-o', 'out.wav', '-V', selector, 'hi']
+				)
+				_, voice, speaker = whistle_cli.cmds._speak_cache_create (
+					{'paths': whistle_db.data_paths (tmp)}, args
+				)
+				keys.add (whistle_cache.cache_key ('hi', voice, speaker))
+			self.assertEqual (len (keys), 2)
+
+	def test_fanout_slow_sink (self):
+		ring = whistle_fanout.RingBuffer (8)
+		ring.write (b'abcdef')
+		ring.write (b'ghij')
+		self.assertEqual (ring.start, 2)
+		self.assertEqual (bytes (ring.read (2, 100)), b'cdefgh')
+		self.assertEqual (bytes (ring.read (8, 100)), b'ij')
+
+		# A sink falling behind mid-frame stays aligned to its frames.
+		ring = whistle_fanout.RingBuffer (8)
+		r, w = os.pipe ()
+		sink = whistle_fanout.Sink ('partial', fd = w)
+		sink.attach (ring, 2)
+		ring.write (b'abcd')
+		write = os.write
+		with unittest.mock.patch.object (whistle_fanout.os, 'write'
+			, lambda fd, data: write (fd, data[:1])
+		):
+			sink.flush (ring, 2)
+		ring.write (b'efghijkl')
+		sink.flush (ring, 2)
+		sink.close ()
+		self.assertEqual (os.read (r, 100), b'afghijkl')
+		self.assertEqual (sink.dropped, 4)
+		os.close (r)
+
+		data = bytes (range (256)) * 4096
+		with tempfile.TemporaryDirectory () as tmp:
+			record = pathlib.Path (tmp).joinpath ('record.raw')
+			fifo = pathlib.Path (tmp).joinpath ('stalled.fifo')
+			os.mkfifo (fifo)
+			# Attached reader, which never reads.
+			stalled_fd = os.open (fifo, os.O_RDONLY | os.O_NONBLOCK)
+			sinks, listeners = whistle_fanout.sinks_create ([
+				record.as_posix (), fifo.as_posix ()
+			])
+			r, w = os.pipe ()
+
+			def _produce ():
+				with os.fdopen (w, 'wb') as f:
+					f.write (data)
+
+			t = threading.Thread (target = _produce)
+			t.start ()
+			n = whistle_fanout.fanout (r, sinks
+				, buffer_size = 128 << 10
+				, drain_timeout = 0.2
+			)
+			t.join ()
+			os.close (r)
+
+			self.assertEqual (n, len (data))
+			self.assertEqual (record.read_bytes (), data)
+			stalled = sinks[1]
+			self.assertLess (0, stalled.dropped)
+			self.assertEqual (0, stalled.dropped % 2)
+			self.assertLessEqual (stalled.written + stalled.dropped, len (data))
+			for s in sinks:
+				s.close ()
+			os.close (stalled_fd)
+
 	def test_util_math (self):
 		self.assertEqual (
 			util.float_round ((1 + math.sqrt (5)) / 2.0, 3), 1.618
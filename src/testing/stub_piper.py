@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Stand-in for the piper executable, used to test whistle offline.
+
+Understands the subset of piper's command line whistle relies on. Instead
+of synthesising speech, it produces a deterministic 16bit mono signal
+with 10ms of audio per input character.
+
+Behaviour can be tuned via environment variables:
+
+* STUB_PIPER_LOAD_DELAY: Seconds to wait before reporting the voice loaded.
+* STUB_PIPER_CRASH_AFTER: Exit with code 3 after this many payloads.
+* STUB_PIPER_SAMPLE_RATE: Sample rate if model has no config file.
+* STUB_PIPER_RTF: Real-time factor to simulate, i.e. seconds spent per
+	second of audio produced.
+"""
+# 2023-∞ (c) blurryroots innovation qanat OÜ. All rights reserved.
+import os
+import sys
+import json
+import time
+import wave
+import pathlib
+import argparse
+
+
+def _sample_rate (model_path):
+	config_path = pathlib.Path (f'{model_path}.json')
+	if config_path.exists ():
+		with open (config_path, 'r') as f:
+			return int (json.load (f)['audio']['sample_rate'])
+	return int (os.environ.get ('STUB_PIPER_SAMPLE_RATE', 22050))
+
+
+def _synthesize (text, sample_rate, speaker_id = 0):
+	samples_per_char = sample_rate // 100
+	pcm = bytearray ()
+	for c in text:
+		value = ((ord (c) * 64 + speaker_id) % 0x7fff).to_bytes (2, 'little')
+		pcm += value * samples_per_char
+	return bytes (pcm)
+
+
+def main ():
+	parser = argparse.ArgumentParser ()
+	parser.add_argument ('-m', '--model', required = True)
+	parser.add_argument ('-s', '--speaker', type = int, default = 0)
+	parser.add_argument ('--json-input', action = 'store_true')
+	parser.add_argument ('--output_raw', action = 'store_true')
+	parser.add_argument ('--output_dir', default = None)
+	parser.add_argument ('--output_file', default = None)
+	parser.add_argument ('--debug', action = 'store_true')
+	args, _ = parser.parse_known_args ()
+
+	started = time.monotonic ()
+	time.sleep (float (os.environ.get ('STUB_PIPER_LOAD_DELAY', 0)))
+	sample_rate = _sample_rate (args.model)
+	loaded = time.monotonic () - started
+	sys.stderr.write (f'[piper] [info] Loaded voice in {loaded} second(s)\n')
+	sys.stderr.flush ()
+
+	crash_after = int (os.environ.get ('STUB_PIPER_CRASH_AFTER', 0))
+	rtf = float (os.environ.get ('STUB_PIPER_RTF', 0))
+	count = 0
+	for line in iter (sys.stdin.readline, ''):
+		line = line.strip ()
+		if not line:
+			continue
+
+		text = line
+		speaker_id = args.speaker
+		output_file = None
+		if args.json_input:
+			j = json.loads (line)
+			text = j['text']
+			speaker_id = int (j.get ('speaker_id', speaker_id))
+			output_file = j.get ('output_file', None)
+
+		pcm = _synthesize (text, sample_rate, speaker_id)
+		time.sleep (rtf * len (pcm) / (2 * sample_rate))
+		if output_file is None and args.output_dir:
+			output_file = pathlib.Path (args.output_dir) \
+				.joinpath (f'{time.monotonic_ns ()}.wav') \
+				.as_posix ()
+
+		if output_file:
+			with wave.open (output_file, 'wb') as w:
+				w.setnchannels (1)
+				w.setsampwidth (2)
+				w.setframerate (sample_rate)
+				w.writeframes (pcm)
+			sys.stdout.write (f'{output_file}\n')
+			sys.stdout.flush ()
+		else:
+			sys.stdout.buffer.write (pcm)
+			sys.stdout.buffer.flush ()
+
+		count += 1
+		if 0 < crash_after and count >= crash_after:
+			sys.stderr.write ('[piper] [error] Stub crashing on purpose.\n')
+			return 3
+
+	return 0
+
+
+if '__main__' == __name__:
+	sys.exit (main ())